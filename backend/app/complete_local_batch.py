@@ -0,0 +1,136 @@
+# Answers the request files submitted to the local batch backend
+# (BATCH_BACKEND=local), standing in for the provider. Requests are sent one
+# by one to the chat completions API, or answered with fixed placeholder
+# results for end-to-end checks without an API key. Run next to the worker:
+# python -m app.complete_local_batch --responder openai --watch
+
+
+import argparse
+import logging
+import time
+from typing import Any, Callable, Dict, Optional
+
+from dotenv import load_dotenv
+from openai import OpenAI
+
+from app.core.config import settings
+from app.services.ai_evaluation import ExamModel, StructuredAnalyzeResponse
+from app.services.batch_evaluation import LocalBatchBackend
+
+# Load environment variables
+load_dotenv(override=True)
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s %(levelname)s [%(name)s] %(message)s"
+)
+logger = logging.getLogger("app.complete_local_batch")
+
+# Constants
+# Placeholder results of the canned responder, by response model name
+CANNED_RESULTS = {
+    ExamModel.__name__: ExamModel(
+        student_id="local",
+        section="local",
+        seat="local",
+        room="local",
+        extracted_exam_text="Placeholder text written by the local batch responder.",
+        confidence_score=1.0,
+    ),
+    StructuredAnalyzeResponse.__name__: StructuredAnalyzeResponse(
+        scoring_justification="Placeholder evaluation written by the local batch responder.",
+        score_task_completion=3.0,
+        score_organization=3.0,
+        score_style_language_expression=3.0,
+        score_structural_variety_accuracy=3.0,
+        improved_text="Placeholder text written by the local batch responder.",
+        ai_comment="Placeholder comment written by the local batch responder.",
+    ),
+}
+
+Responder = Callable[[Dict[str, Any]], Dict[str, Any]]
+
+
+def openai_responder() -> Responder:
+    """
+    Answer each request with a chat completions call.
+
+    Returns:
+        Responder: Maps a request body to the API's response body
+    """
+    client = OpenAI(api_key=settings.OPENAI_API_KEY)
+
+    def respond(body: Dict[str, Any]) -> Dict[str, Any]:
+        return client.chat.completions.create(**body).model_dump()
+
+    return respond
+
+
+def canned_responder(body: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Answer a request with the placeholder result of its response model.
+
+    Args:
+        body: Chat completion request body
+
+    Returns:
+        Dict[str, Any]: Chat completion response body
+
+    Raises:
+        ValueError: If the request asks for an unknown response model
+    """
+    name = body["response_format"]["json_schema"]["name"]
+    if name not in CANNED_RESULTS:
+        raise ValueError(f"No canned result for {name}")
+    return {
+        "object": "chat.completion",
+        "model": body["model"],
+        "choices": [{
+            "index": 0,
+            "finish_reason": "stop",
+            "message": {"role": "assistant", "content": CANNED_RESULTS[name].model_dump_json()},
+        }],
+    }
+
+
+RESPONDERS: Dict[str, Callable[[], Responder]] = {
+    "openai": openai_responder,
+    "canned": lambda: canned_responder,
+}
+
+
+def complete_pending(responder: Responder, backend: Optional[LocalBatchBackend] = None) -> int:
+    """
+    Answer every submitted local batch that has no output yet.
+
+    Args:
+        responder: Maps a request body to a chat completion response body
+        backend: Local backend to complete; defaults to one on BATCH_LOCAL_DIR
+
+    Returns:
+        int: Number of batches completed
+    """
+    backend = backend or LocalBatchBackend()
+    batch_ids = backend.pending_batches()
+    for batch_id in batch_ids:
+        errors = backend.complete(batch_id, responder)
+        logger.info(f"Completed local batch {batch_id} with {errors} failed requests")
+    return len(batch_ids)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Answer the batches submitted to the local batch backend")
+    parser.add_argument("--responder", choices=sorted(RESPONDERS), default="openai")
+    parser.add_argument("--watch", action="store_true", help="Keep answering new batches until interrupted")
+    args = parser.parse_args()
+
+    responder = RESPONDERS[args.responder]()
+    complete_pending(responder)
+    while args.watch:
+        time.sleep(settings.WORKER_POLL_INTERVAL)
+        complete_pending(responder)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,6 @@
-from typing import Annotated, Any, Optional
+import os
+import tempfile
+from typing import Annotated, Any, Literal, Optional
 
 from pydantic import (
     AnyUrl,
@@ -56,6 +58,25 @@ class Settings(BaseSettings):
     S3_BUCKET_NAME: str = "culi-dev-s3"
     S3_EXAM_PREFIX: str = "exams"
     S3_URL_EXPIRATION: int = 3600  # 1 hour in seconds
+    S3_MAX_POOL_CONNECTIONS: int = 32
+    S3_UPLOAD_CONCURRENCY: int = 8  # Pages of one PDF uploaded at once
+    S3_DELETE_CONCURRENCY: int = 8  # DeleteObjects calls of one purge in flight at once
+    REPORT_IMAGE_CONCURRENCY: int = 8  # Exam images downloaded at once for a PDF report
+
+    # Local Exam Image Cache
+    IMAGE_CACHE_ENABLED: bool = True
+    IMAGE_CACHE_DIR: str = os.path.join(tempfile.gettempdir(), 'culi_image_cache')
+    IMAGE_CACHE_MAX_BYTES: int = 2 * 1024 * 1024 * 1024  # Least recently used images are evicted above this
+    # Seconds a cached image is served without asking S3 whether it changed; 0 always asks
+    IMAGE_CACHE_REVALIDATE_SECONDS: int = 3600
+
+    # PDF Rendering
+    # Processes rasterizing uploaded PDFs; 0 renders in a thread of the API process
+    PDF_RENDER_WORKERS: int = min(4, os.cpu_count() or 1)
+    # "model" renders grayscale pages at the largest size OCR_MODEL_NAME looks at,
+    # "legacy" renders RGB pages at 300 DPI. Stays on legacy until
+    # benchmarks.raster_profile --ocr shows no loss of OCR accuracy
+    PDF_RASTER_PROFILE: Literal['model', 'legacy'] = 'legacy'
 
     # OpenAI Configuration
     OPENAI_API_KEY: str
@@ -64,6 +85,68 @@ class Settings(BaseSettings):
     OCR_MODEL_NAME: str = 'gpt-4o-mini'
     AI_MODEL_NAME: str = 'gpt-4o'
     RANDOM_STATE: int = 42
+    EVALUATION_CONCURRENCY: int = 5  # Number of exams a worker grades at once
+
+    # OpenAI Rate Limits (per model, per minute)
+    OCR_MODEL_RPM: int = 500
+    OCR_MODEL_TPM: int = 200000
+    AI_MODEL_RPM: int = 500
+    AI_MODEL_TPM: int = 30000
+    # "local" keeps buckets in process memory, "postgres" shares them across workers
+    RATE_LIMIT_BACKEND: Literal['local', 'postgres'] = 'local'
+
+    # Evaluation Worker Configuration
+    WORKER_POLL_INTERVAL: float = 2.0  # Seconds between queue polls when idle
+    JOB_LOCK_TIMEOUT: int = 60 * 30  # Running jobs whose lease was not renewed for this long are requeued
+    JOB_HEARTBEAT_INTERVAL: int = 60  # Seconds between lease renewals of a running job
+    JOB_MAX_ATTEMPTS: int = 3
+    PURGE_LOCK_TIMEOUT: int = 60 * 10  # Running storage purges older than this are retried
+
+    # OCR Result Cache
+    OCR_CACHE_ENABLED: bool = True
+    OCR_CACHE_MAX_BYTES: int = 512 * 1024 * 1024  # Least recently used entries are evicted above this
+    OCR_CACHE_MAX_AGE_DAYS: int = 90
+
+    # Evaluation Result Cache
+    EVALUATION_CACHE_ENABLED: bool = True
+    EVALUATION_CACHE_MAX_BYTES: int = 256 * 1024 * 1024
+    EVALUATION_CACHE_MAX_AGE_DAYS: int = 90
+
+    # Offline (Batch API) Evaluation
+    # "openai" submits to the Batch API, "local" is a file-based stand-in for offline testing
+    BATCH_BACKEND: Literal['openai', 'local'] = 'openai'
+    BATCH_LOCAL_DIR: str = os.path.join(tempfile.gettempdir(), 'culi_batch_store')
+    BATCH_POLL_INTERVAL: int = 60  # Seconds between status checks of a submitted batch
+    BATCH_MAX_REQUESTS_PER_FILE: int = 50000
+    BATCH_MAX_FILE_BYTES: int = 180 * 1024 * 1024
+    BATCH_MAX_ATTEMPTS: int = 5  # Consecutive failed steps before a run and its exams are marked failed
+
+    # Vector Store
+    # Directory of a saved SentenceTransformer model; unset downloads all-MiniLM-L6-v2 from the Hugging Face Hub
+    EMBEDDING_MODEL_PATH: Optional[str] = None
+    VECTOR_WARM_UP: bool = True  # Load the embedding model and open the collection at API startup
+    # "huggingface" runs the PyTorch model, "onnx" the int8 export written by app.export_onnx_embedding
+    EMBEDDING_SOURCE: Literal['huggingface', 'onnx'] = 'huggingface'
+    ONNX_EMBEDDING_PATH: str = 'models/all-MiniLM-L6-v2-onnx-int8'
+    ONNX_NUM_THREADS: int = 0  # onnxruntime intra-op threads; 0 uses one per physical core
+    # "chroma" keeps the collection in a local directory per container,
+    # "pgvector" shares it through the Postgres database
+    VECTOR_STORE_BACKEND: Literal['chroma', 'pgvector'] = 'chroma'
+    CHROMA_PATH: str = 'app/chroma_store'
+    PGVECTOR_EF_SEARCH: int = 64  # HNSW candidates examined per query; higher is slower with better recall
+    # Stored exam embeddings; float16 halves the size at a negligible cost in cosine similarity
+    EMBEDDING_STORE_DTYPE: Literal['float16', 'float32'] = 'float16'
+    EMBEDDING_BATCH_SIZE: int = 64  # Texts encoded per forward pass of the embedding model
+    VECTOR_UPSERT_CHUNK_SIZE: int = 256  # Documents written to the collection and committed together
+    # Few-shot lookups from concurrently graded exams are collected for up to
+    # FEWSHOT_BATCH_WINDOW seconds and answered with one retrieval call
+    FEWSHOT_BATCH_SIZE: int = 32
+    FEWSHOT_BATCH_WINDOW: float = 0.05
+    # "task" draws few-shot examples from exams of the same task first, "global" from the whole collection
+    FEWSHOT_SCOPE: Literal['task', 'global'] = 'task'
+    FEWSHOT_CANDIDATES: int = 12  # Nearest exams fetched per lookup before the diverse few-shot examples are picked
+    FEWSHOT_MMR_LAMBDA: float = 0.5  # Relevance versus diversity of the picked examples; 1 ranks by relevance only
+    FEWSHOT_TOKEN_BUDGET: int = 1800  # Maximum tokens of the few-shot examples of one scoring request
 
     # Email Configuration
     EMAIL_HOST: Optional[str] = None
@@ -1,15 +1,62 @@
+import logging
 from typing import Annotated
 
+from sqlalchemy import Connection, inspect, text
 from sqlmodel import Session, SQLModel, create_engine
 from fastapi import Depends
 
 from ..core.config import settings
 
+logger = logging.getLogger(__name__)
+
 engine = create_engine(settings.POSTGRESQL_DATABASE_URI)
 
+SCHEMA_LOCK_KEY = 7301  # Advisory lock held while the schema is created or extended
+
 
 def create_db_and_tables():
-    SQLModel.metadata.create_all(engine)
+    """
+    Create missing tables and columns.
+
+    The API and the workers run this at startup, possibly at the same time.
+    A transaction-level advisory lock makes them take turns, and each one
+    skips whatever another process already created.
+    """
+    with engine.begin() as connection:
+        connection.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": SCHEMA_LOCK_KEY})
+        SQLModel.metadata.create_all(connection)
+        add_missing_columns(connection)
+
+
+def add_missing_columns(connection: Connection):
+    """
+    Add nullable columns (and their indexes) that were introduced after a table was created.
+
+    create_all only creates missing tables, so new optional model fields would
+    otherwise never reach existing databases. Statements are no-ops for
+    columns and indexes that already exist.
+
+    Args:
+        connection: Connection inside the transaction holding the schema lock
+    """
+    inspector = inspect(connection)
+    for table in SQLModel.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        added = set()
+        for column in table.columns:
+            if column.name in existing or not column.nullable:
+                continue
+            column_type = column.type.compile(dialect=engine.dialect)
+            connection.execute(text(f'ALTER TABLE "{table.name}" ADD COLUMN IF NOT EXISTS "{column.name}" {column_type}'))
+            added.add(column.name)
+            logger.info(f"Added column {table.name}.{column.name}")
+
+        for index in table.indexes:
+            if added & {column.name for column in index.columns}:
+                index.create(connection, checkfirst=True)
 
 
 def get_session():
@@ -17,4 +64,4 @@ def get_session():
         yield session
 
 
-SessionDep = Annotated[Session, Depends(get_session)]
\ No newline at end of file
+SessionDep = Annotated[Session, Depends(get_session)]
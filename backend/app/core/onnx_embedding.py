@@ -0,0 +1,128 @@
+import json
+import logging
+import os
+from typing import Any, Dict, List
+
+import numpy as np
+import onnxruntime
+from chromadb.utils.embedding_functions import SentenceTransformerEmbeddingFunction
+from tokenizers import Tokenizer
+
+logger = logging.getLogger(__name__)
+
+# Files written by app.export_onnx_embedding
+MODEL_FILE = "model.onnx"  # int8-quantized encoder
+TOKENIZER_FILE = "tokenizer.json"
+CONFIG_FILE = "embedding_config.json"  # Pooling, normalization and sequence length of the source model
+
+
+class OnnxEmbeddingFunction:
+    """
+    CPU embedding runtime for an exported, int8-quantized sentence-transformers model.
+
+    Reproduces the source model's pipeline (tokenization, encoder, mean
+    pooling, optional L2 normalization) with onnxruntime and the Rust
+    tokenizer, without loading PyTorch.
+
+    To Chroma it presents itself as the sentence-transformers function of
+    the source model. The collection's stored configuration therefore stays
+    valid whichever runtime opens it, and Chroma uses the instance passed to
+    get_or_create_collection instead of rebuilding one from that config.
+    Documents and queries are always embedded by the application before
+    they reach the collection.
+    """
+
+    def __init__(self, model_dir: str, num_threads: int = 0, batch_size: int = 64):
+        with open(os.path.join(model_dir, CONFIG_FILE)) as f:
+            self.config: Dict[str, Any] = json.load(f)
+        self.model_name: str = self.config["model_name"]
+        self.dimensions: int = self.config["dimensions"]
+        self.normalize: bool = self.config["normalize"]
+        self.batch_size = batch_size
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, TOKENIZER_FILE))
+        self.tokenizer.enable_truncation(max_length=self.config["max_seq_length"])
+        # Pad each batch to its longest text only
+        self.tokenizer.enable_padding(
+            pad_id=self.tokenizer.token_to_id(self.config["pad_token"]),
+            pad_token=self.config["pad_token"],
+        )
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = num_threads  # 0 lets onnxruntime use one thread per physical core
+        options.inter_op_num_threads = 1
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(model_dir, MODEL_FILE),
+            sess_options=options,
+            providers=["CPUExecutionProvider"],
+        )
+        self.input_names = [model_input.name for model_input in self.session.get_inputs()]
+
+    def encode(self, texts: List[str], batch_size: int = None) -> np.ndarray:
+        """
+        Embed texts in batches.
+
+        Texts are sorted by length before batching, so each batch pads to
+        similar lengths and little compute is spent on padding.
+
+        Args:
+            texts: Texts to embed
+            batch_size: Texts per forward pass; defaults to the instance's batch size
+
+        Returns:
+            np.ndarray: float32 array of shape (len(texts), dimensions), in input order
+        """
+        batch_size = batch_size or self.batch_size
+        embeddings = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        order = sorted(range(len(texts)), key=lambda index: len(texts[index]), reverse=True)
+
+        for start in range(0, len(order), batch_size):
+            positions = order[start:start + batch_size]
+            encodings = self.tokenizer.encode_batch([texts[position] for position in positions])
+            feeds = {
+                "input_ids": np.array([encoding.ids for encoding in encodings], dtype=np.int64),
+                "attention_mask": np.array([encoding.attention_mask for encoding in encodings], dtype=np.int64),
+                "token_type_ids": np.array([encoding.type_ids for encoding in encodings], dtype=np.int64),
+            }
+            token_embeddings = self.session.run(None, {name: feeds[name] for name in self.input_names})[0]
+
+            # Mean over real tokens, as the sentence-transformers pooling layer does
+            mask = feeds["attention_mask"][:, :, None].astype(np.float32)
+            pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            if self.normalize:
+                pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            embeddings[positions] = pooled
+
+        return embeddings
+
+    def __call__(self, input: List[str]) -> List[np.ndarray]:
+        return list(self.encode(input))
+
+    # Chroma embedding function interface, mirroring the source model's function
+    @staticmethod
+    def name() -> str:
+        return SentenceTransformerEmbeddingFunction.name()
+
+    def get_config(self) -> Dict[str, Any]:
+        return {"model_name": self.model_name, "device": "cpu", "normalize_embeddings": False, "kwargs": {}}
+
+    @staticmethod
+    def build_from_config(config: Dict[str, Any]) -> Any:
+        return SentenceTransformerEmbeddingFunction.build_from_config(config)
+
+    def is_legacy(self) -> bool:
+        return False
+
+    def default_space(self) -> str:
+        return "cosine"
+
+    def supported_spaces(self) -> List[str]:
+        return ["cosine", "l2", "ip"]
+
+    def validate_config_update(self, old_config: Dict[str, Any], new_config: Dict[str, Any]) -> None:
+        return
+
+    @staticmethod
+    def validate_config(config: Dict[str, Any]) -> None:
+        return
@@ -0,0 +1,27 @@
+from typing import Any, List
+
+import numpy as np
+from chromadb.utils.embedding_functions import SentenceTransformerEmbeddingFunction
+
+
+class LoadedSentenceTransformerFunction(SentenceTransformerEmbeddingFunction):
+    """
+    Chroma's sentence-transformers function around a model the application loaded.
+
+    Chroma's own constructor loads the model into a cache shared by the
+    class. This one takes the application's model instead, so there is one
+    copy in memory and the application keeps its own handle on it. Name and
+    config are inherited, so the collection's stored configuration is the
+    same as with Chroma's function.
+    """
+
+    def __init__(self, model: Any, model_name: str, device: str = "cpu"):
+        self.model = model
+        self.model_name = model_name
+        self.device = device
+        self.normalize_embeddings = False
+        self.kwargs = {}
+
+    def __call__(self, input: List[str]) -> List[np.ndarray]:
+        embeddings = self.model.encode(list(input), convert_to_numpy=True, normalize_embeddings=self.normalize_embeddings)
+        return [np.array(embedding, dtype=np.float32) for embedding in embeddings]
@@ -0,0 +1,266 @@
+import json
+import logging
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from typing import Any, Dict, Iterator, List, Optional
+
+from sqlalchemy import text
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+COLLECTION_NAME = "essays"
+PGVECTOR_TABLE = "exam_vectors"
+HNSW_M = 16  # Graph links per node in the pgvector HNSW index
+HNSW_EF_CONSTRUCTION = 64  # Candidate list size while building the pgvector HNSW index
+ITERATIVE_SCAN_VERSION = (0, 8)  # First pgvector release that can keep scanning HNSW until a filter is satisfied
+
+
+class VectorStore(ABC):
+    """
+    Collection of embedded exams used for few-shot retrieval.
+
+    Query results use Chroma's layout: a dict of "ids", "documents",
+    "metadatas" and "distances", each holding one list per query, nearest
+    first. Distances are cosine distances. A `where` filter keeps only items
+    whose metadata has all of the given key/value pairs. With
+    include_embeddings, results also hold the items' "embeddings".
+    """
+
+    @abstractmethod
+    def upsert(self, ids: List[str], documents: List[str], embeddings: List[List[float]], metadatas: List[Optional[dict]]) -> None:
+        """Insert items, replacing those whose id already exists."""
+
+    @abstractmethod
+    def query(
+        self,
+        query_embeddings: List[List[float]],
+        n_results: int,
+        where: Optional[Dict[str, Any]] = None,
+        include_embeddings: bool = False
+    ) -> Dict[str, List[List[Any]]]:
+        """Return the n_results nearest items of each query embedding."""
+
+    @abstractmethod
+    def delete(self, ids: List[str]) -> None:
+        """Remove items by id; unknown ids are ignored."""
+
+    @abstractmethod
+    def list_ids(self) -> List[str]:
+        """Return the ids of every stored item."""
+
+    @abstractmethod
+    def count(self) -> int:
+        """Return the number of stored items."""
+
+    @abstractmethod
+    def iter_all(self, batch_size: int = 500) -> Iterator[Dict[str, List[Any]]]:
+        """Yield every stored item in batches of "ids", "documents", "metadatas" and "embeddings"."""
+
+
+class ChromaVectorStore(VectorStore):
+    """Chroma collection persisted in a local directory."""
+
+    def __init__(self, path: str, embedding_function: Any):
+        from chromadb import PersistentClient
+        self.client = PersistentClient(path=path)
+        self.collection = self.client.get_or_create_collection(
+            name=COLLECTION_NAME,
+            embedding_function=embedding_function,
+            metadata={"hnsw:space": "cosine"}
+        )
+
+    def upsert(self, ids, documents, embeddings, metadatas):
+        self.collection.upsert(ids=ids, documents=documents, embeddings=embeddings, metadatas=metadatas)
+
+    def query(self, query_embeddings, n_results, where=None, include_embeddings=False):
+        if where and len(where) > 1:
+            where = {"$and": [{key: value} for key, value in where.items()]}
+        keys = ["documents", "metadatas", "distances"] + (["embeddings"] if include_embeddings else [])
+        results = self.collection.query(
+            query_embeddings=query_embeddings,
+            n_results=n_results,
+            where=where or None,
+            include=keys
+        )
+        return {key: [list(row) for row in results[key]] for key in ["ids"] + keys}
+
+    def delete(self, ids):
+        self.collection.delete(ids=ids)
+
+    def list_ids(self):
+        return self.collection.get(include=[])["ids"]
+
+    def count(self):
+        return self.collection.count()
+
+    def iter_all(self, batch_size=500):
+        offset = 0
+        while True:
+            batch = self.collection.get(
+                include=["documents", "metadatas", "embeddings"],
+                limit=batch_size,
+                offset=offset
+            )
+            if not batch["ids"]:
+                return
+            yield {key: list(batch[key]) for key in ("ids", "documents", "metadatas", "embeddings")}
+            offset += len(batch["ids"])
+
+
+class PgVectorStore(VectorStore):
+    """
+    Collection kept in the application's Postgres database with pgvector.
+
+    Every API replica and worker sees the same data, and nearest neighbours
+    come from an HNSW index on cosine distance. A plain HNSW scan applies
+    `where` filters after it picks ef_search candidates, so a filter matching
+    few items would come back short. Filtered queries therefore use
+    pgvector's iterative scan where available (0.8+), and an exact scan of
+    the matching items otherwise.
+    """
+
+    def __init__(self, engine: Any, dimensions: int, ef_search: int = settings.PGVECTOR_EF_SEARCH, table: str = PGVECTOR_TABLE):
+        self.engine = engine
+        self.dimensions = dimensions
+        self.ef_search = ef_search
+        self.table = table
+        self._schema_ready = False
+        self._iterative_scan = False
+
+    def _ensure_schema(self) -> None:
+        if self._schema_ready:
+            return
+        with self.engine.begin() as connection:
+            connection.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
+            version = connection.execute(text("SELECT extversion FROM pg_extension WHERE extname = 'vector'")).scalar_one()
+            self._iterative_scan = tuple(int(part) for part in version.split(".")[:2]) >= ITERATIVE_SCAN_VERSION
+            connection.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {self.table} ("
+                f"id TEXT PRIMARY KEY, "
+                f"document TEXT NOT NULL, "
+                f"metadata JSONB, "
+                f"embedding vector({self.dimensions}) NOT NULL)"
+            ))
+            connection.execute(text(
+                f"CREATE INDEX IF NOT EXISTS {self.table}_embedding_hnsw ON {self.table} "
+                f"USING hnsw (embedding vector_cosine_ops) "
+                f"WITH (m = {HNSW_M}, ef_construction = {HNSW_EF_CONSTRUCTION})"
+            ))
+            # Metadata filters (e.g. one task's exams) can be answered from this index when they are selective
+            connection.execute(text(
+                f"CREATE INDEX IF NOT EXISTS {self.table}_metadata_gin ON {self.table} "
+                f"USING gin (metadata jsonb_path_ops)"
+            ))
+        self._schema_ready = True
+
+    @staticmethod
+    def _vector_literal(vector: List[float]) -> str:
+        return "[" + ",".join(f"{float(value):.8g}" for value in vector) + "]"
+
+    @staticmethod
+    def _parse_vector(literal: str) -> List[float]:
+        return [float(value) for value in literal.strip("[]").split(",")] if literal.strip("[]") else []
+
+    def upsert(self, ids, documents, embeddings, metadatas):
+        if not ids:
+            return
+        self._ensure_schema()
+        rows = [
+            {
+                "id": item_id,
+                "document": document,
+                "metadata": json.dumps(metadata) if metadata is not None else None,
+                "embedding": self._vector_literal(embedding),
+            }
+            for item_id, document, embedding, metadata in zip(ids, documents, embeddings, metadatas)
+        ]
+        with self.engine.begin() as connection:
+            connection.execute(text(
+                f"INSERT INTO {self.table} (id, document, metadata, embedding) "
+                f"VALUES (:id, :document, CAST(:metadata AS jsonb), CAST(:embedding AS vector)) "
+                f"ON CONFLICT (id) DO UPDATE SET "
+                f"document = EXCLUDED.document, metadata = EXCLUDED.metadata, embedding = EXCLUDED.embedding"
+            ), rows)
+
+    def query(self, query_embeddings, n_results, where=None, include_embeddings=False):
+        keys = ["ids", "documents", "metadatas", "distances"] + (["embeddings"] if include_embeddings else [])
+        results: Dict[str, List[List[Any]]] = {key: [[] for _ in query_embeddings] for key in keys}
+        if not query_embeddings:
+            return results
+
+        self._ensure_schema()
+        with self.engine.begin() as connection:
+            # Wider HNSW search than the default 40 candidates for better recall
+            connection.execute(text(f"SET LOCAL hnsw.ef_search = {max(self.ef_search, n_results)}"))
+            if where and self._iterative_scan:
+                # Keep walking the index until enough items pass the filter
+                connection.execute(text("SET LOCAL hnsw.iterative_scan = relaxed_order"))
+            elif where:
+                # Rank the filtered items exactly (found through the GIN index) instead of post-filtering HNSW candidates
+                connection.execute(text("SET LOCAL enable_indexscan = off"))
+            # Each query walks the index on its own, all in one round trip
+            rows = connection.execute(text(
+                f"SELECT q.ord, v.id, v.document, v.metadata, v.distance{', v.embedding::text' if include_embeddings else ''} "
+                f"FROM unnest(CAST(:queries AS text[])) WITH ORDINALITY AS q(embedding, ord) "
+                f"CROSS JOIN LATERAL ("
+                f"  SELECT id, document, metadata, embedding, embedding <=> CAST(q.embedding AS vector) AS distance "
+                f"  FROM {self.table} "
+                f"  {'WHERE metadata @> CAST(:where AS jsonb) ' if where else ''}"
+                f"  ORDER BY embedding <=> CAST(q.embedding AS vector) "
+                f"  LIMIT :n_results"
+                f") v "
+                f"ORDER BY q.ord, v.distance"
+            ), {
+                "queries": [self._vector_literal(embedding) for embedding in query_embeddings],
+                "n_results": n_results,
+                "where": json.dumps(where) if where else None,
+            }).all()
+
+        for row in rows:
+            index = row[0] - 1
+            results["ids"][index].append(row[1])
+            results["documents"][index].append(row[2])
+            results["metadatas"][index].append(row[3])
+            results["distances"][index].append(float(row[4]))
+            if include_embeddings:
+                results["embeddings"][index].append(self._parse_vector(row[5]))
+        return results
+
+    def delete(self, ids):
+        if not ids:
+            return
+        self._ensure_schema()
+        with self.engine.begin() as connection:
+            connection.execute(text(f"DELETE FROM {self.table} WHERE id = ANY(:ids)"), {"ids": list(ids)})
+
+    def list_ids(self):
+        self._ensure_schema()
+        with self.engine.begin() as connection:
+            return [row[0] for row in connection.execute(text(f"SELECT id FROM {self.table} ORDER BY id"))]
+
+    def count(self):
+        self._ensure_schema()
+        with self.engine.begin() as connection:
+            return connection.execute(text(f"SELECT count(*) FROM {self.table}")).scalar_one()
+
+    def iter_all(self, batch_size=500):
+        self._ensure_schema()
+        last_id = ""
+        while True:
+            with self.engine.begin() as connection:
+                rows = connection.execute(text(
+                    f"SELECT id, document, metadata, embedding::text FROM {self.table} "
+                    f"WHERE id > :last_id ORDER BY id LIMIT :limit"
+                ), {"last_id": last_id, "limit": batch_size}).all()
+            if not rows:
+                return
+            batch = defaultdict(list)
+            for item_id, document, metadata, embedding in rows:
+                batch["ids"].append(item_id)
+                batch["documents"].append(document)
+                batch["metadatas"].append(metadata)
+                batch["embeddings"].append(self._parse_vector(embedding))
+            yield dict(batch)
+            last_id = rows[-1][0]
@@ -1,10 +1,29 @@
-from chromadb import PersistentClient
-from chromadb.utils import embedding_functions
-from sentence_transformers import SentenceTransformer
-from typing import Literal
+import logging
+import threading
+import time
+
+from typing import Any, Dict, List, Literal, Optional
+
+from .config import settings
+from .database import engine
+from .vector_store import ChromaVectorStore, PgVectorStore, VectorStore
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+# Identifies the vectors of the configured runtime in the embedding store,
+# since the int8 ONNX model gives slightly different values
+EMBEDDING_MODEL_ID = EMBEDDING_MODEL_NAME if settings.EMBEDDING_SOURCE == "huggingface" else f"{EMBEDDING_MODEL_NAME}-onnx-int8"
+
+# The embedding model and the collection are created on first use (or by
+# warm_up), so importing this module stays cheap for scripts and tests
+_embedding_fn: Optional[Any] = None
+_vector_store: Optional[VectorStore] = None
+_init_lock = threading.Lock()
 
 class LocalEmbeddingFunction:
     def __init__(self, model_path_or_name: str):
+        from sentence_transformers import SentenceTransformer
         self.model = SentenceTransformer(model_path_or_name)
 
     def embed_documents(self, texts):
@@ -14,45 +33,194 @@ class LocalEmbeddingFunction:
         return self.model.encode([text], convert_to_tensor=False)[0].tolist()
 
 
-def get_embedding_function(source: Literal["local", "huggingface"], model_path_or_name: str):
+def get_embedding_function(source: Literal["local", "huggingface", "onnx"], model_path_or_name: str):
     if source == "huggingface":
-        return embedding_functions.SentenceTransformerEmbeddingFunction(
-            model_name=model_path_or_name
+        from sentence_transformers import SentenceTransformer
+        from .sentence_transformer_embedding import LoadedSentenceTransformerFunction
+        return LoadedSentenceTransformerFunction(
+            SentenceTransformer(model_path_or_name, device="cpu"),
+            model_name=model_path_or_name,
         )
     elif source == "local":
         return LocalEmbeddingFunction(model_path_or_name)
+    elif source == "onnx":
+        # Directory written by app.export_onnx_embedding
+        from .onnx_embedding import OnnxEmbeddingFunction
+        return OnnxEmbeddingFunction(
+            model_path_or_name,
+            num_threads=settings.ONNX_NUM_THREADS,
+            batch_size=settings.EMBEDDING_BATCH_SIZE,
+        )
     else:
         raise ValueError("Invalid source for embedding function")
 
 
+# Shared embedding function of EMBEDDING_SOURCE. The PyTorch model is loaded
+# from EMBEDDING_MODEL_PATH when set so startup needs no network
+def get_shared_embedding_function():
+    global _embedding_fn
+    if _embedding_fn is None:
+        with _init_lock:
+            if _embedding_fn is None:
+                started = time.perf_counter()
+                if settings.EMBEDDING_SOURCE == "onnx":
+                    model_path_or_name = settings.ONNX_EMBEDDING_PATH
+                else:
+                    model_path_or_name = settings.EMBEDDING_MODEL_PATH or EMBEDDING_MODEL_NAME
+                _embedding_fn = get_embedding_function(
+                    source=settings.EMBEDDING_SOURCE,
+                    model_path_or_name=model_path_or_name,
+                )
+                logger.info(f"Loaded {settings.EMBEDDING_SOURCE} embedding model in {(time.perf_counter() - started) * 1000:.0f} ms")
+    return _embedding_fn
+
+# The SentenceTransformer behind the shared embedding function
+def get_embedding_model():
+    return get_shared_embedding_function().model
+
+def get_embedding_dimensions() -> int:
+    if settings.EMBEDDING_SOURCE == "onnx":
+        return get_shared_embedding_function().dimensions
+    return get_embedding_model().get_sentence_embedding_dimension()
+
+def get_vector_store(backend: Literal["chroma", "pgvector"] = settings.VECTOR_STORE_BACKEND) -> VectorStore:
+    if backend == "chroma":
+        return ChromaVectorStore(settings.CHROMA_PATH, get_shared_embedding_function())
+    elif backend == "pgvector":
+        return PgVectorStore(engine, get_embedding_dimensions())
+    else:
+        raise ValueError("Invalid vector store backend")
+
+# Shared collection of the configured backend (local Chroma directory or pgvector table)
+def get_shared_vector_store() -> VectorStore:
+    global _vector_store
+    if _vector_store is None:
+        store = get_vector_store()
+        with _init_lock:
+            if _vector_store is None:
+                _vector_store = store
+    return _vector_store
+
+# Load the model and open the collection ahead of the first request
+def warm_up() -> int:
+    started = time.perf_counter()
+    embed_documents(["warm up"])
+    count = get_shared_vector_store().count()
+    logger.info(f"Vector store ready with {count} documents in {(time.perf_counter() - started) * 1000:.0f} ms")
+    return count
+
+
 # Insert a document to Vectordb
 def build_collection(exam_id: int, text: str, metadata: dict = None):
-    essay_collection.add(
-        documents=[text],
-        ids=[str(exam_id)],
-        metadatas=[metadata] if metadata else [None],
+    upsert_documents([exam_id], [text], [metadata])
+
+# Encode documents in batches with the collection's embedding model
+def embed_documents(texts: List[str]) -> List[List[float]]:
+    if settings.EMBEDDING_SOURCE == "onnx":
+        return get_shared_embedding_function().encode(texts, batch_size=settings.EMBEDDING_BATCH_SIZE).tolist()
+    embeddings = get_embedding_model().encode(
+        texts,
+        batch_size=settings.EMBEDDING_BATCH_SIZE,
+        convert_to_numpy=True,
+        normalize_embeddings=get_shared_embedding_function().normalize_embeddings,
+    )
+    return embeddings.tolist()
+
+# Insert or replace many documents in one call, reusing embeddings computed earlier
+def upsert_documents(
+    exam_ids: List[int],
+    texts: List[str],
+    metadatas: List[Optional[dict]],
+    embeddings: Optional[List[List[float]]] = None
+):
+    get_shared_vector_store().upsert(
+        ids=[str(exam_id) for exam_id in exam_ids],
+        documents=texts,
+        embeddings=embeddings if embeddings is not None else embed_documents(texts),
+        metadatas=metadatas,
     )
 
 # Retrieve similar documents
 def get_similar_exams(query_text: str, n_results: int = 5):
-    return essay_collection.query(
-        query_texts=[query_text],
+    return get_shared_vector_store().query(
+        query_embeddings=embed_documents([query_text]),
         n_results=n_results
     )
 
+# Retrieve similar documents for many queries: one encoding pass and one collection query.
+# With task_ids, each query only searches its own task's exams, topped up from all tasks when the task has too few
+def get_similar_exams_batch(
+    query_texts: List[str],
+    n_results: int = 5,
+    query_embeddings: Optional[List[List[float]]] = None,
+    task_ids: Optional[List[Optional[int]]] = None,
+    include_embeddings: bool = False
+):
+    started = time.perf_counter()
+    if query_embeddings is None:
+        query_embeddings = embed_documents(query_texts)
+    embedded = time.perf_counter()
+    if task_ids is None:
+        results = get_shared_vector_store().query(
+            query_embeddings=query_embeddings,
+            n_results=n_results,
+            include_embeddings=include_embeddings
+        )
+    else:
+        results = query_by_task(query_embeddings, n_results, task_ids, include_embeddings)
+    queried = time.perf_counter()
+
+    logger.info(
+        f"Retrieved {n_results} similar exams for {len(query_texts)} queries: "
+        f"embedding {(embedded - started) * 1000:.0f} ms, query {(queried - embedded) * 1000:.0f} ms"
+    )
+    return results
+
+# One filtered query per distinct task, then one global query for every query that came back short
+def query_by_task(
+    query_embeddings: List[List[float]],
+    n_results: int,
+    task_ids: List[Optional[int]],
+    include_embeddings: bool = False
+):
+    store = get_shared_vector_store()
+    keys = ["ids", "documents", "metadatas", "distances"] + (["embeddings"] if include_embeddings else [])
+    results = {key: [[] for _ in query_embeddings] for key in keys}
 
-# Initialize ChromaDB client with persistence
-chroma_client = PersistentClient(path="app/chroma_store")
+    positions_by_task: Dict[Optional[int], List[int]] = {}
+    for position, task_id in enumerate(task_ids):
+        positions_by_task.setdefault(task_id, []).append(position)
 
-# Setup embedding function
-embedding_fn = get_embedding_function(
-    source="huggingface",
-    model_path_or_name="all-MiniLM-L6-v2",
-)
+    for task_id, positions in positions_by_task.items():
+        if task_id is None:
+            continue
+        task_results = store.query(
+            query_embeddings=[query_embeddings[position] for position in positions],
+            n_results=n_results,
+            where={"task_id": task_id},
+            include_embeddings=include_embeddings
+        )
+        for i, position in enumerate(positions):
+            for key in results:
+                results[key][position] = list(task_results[key][i])
+
+    short = [position for position in range(len(query_embeddings)) if len(results["ids"][position]) < n_results]
+    if short:
+        global_results = store.query(
+            query_embeddings=[query_embeddings[position] for position in short],
+            n_results=n_results,
+            include_embeddings=include_embeddings
+        )
+        # Task examples stay first; the nearest other exams fill the remaining slots
+        for i, position in enumerate(short):
+            seen = set(results["ids"][position])
+            for j, item_id in enumerate(global_results["ids"][i]):
+                if len(results["ids"][position]) >= n_results:
+                    break
+                if item_id in seen:
+                    continue
+                for key in results:
+                    results[key][position].append(global_results[key][i][j])
+        logger.info(f"{len(short)} of {len(query_embeddings)} queries had fewer than {n_results} examples of their task")
 
-# Load or create collection
-essay_collection = chroma_client.get_or_create_collection(
-    name="essays",
-    embedding_function=embedding_fn,
-    metadata={"hnsw:space": "cosine"}
-)
+    return results
@@ -0,0 +1,128 @@
+# Exports the sentence-transformers embedding model to ONNX and quantizes
+# its weights to int8, for EMBEDDING_SOURCE=onnx. Run once per model change
+# (needs PyTorch and the onnx package; the API itself then only needs
+# onnxruntime), then check parity and speed:
+# python -m app.export_onnx_embedding --output models/all-MiniLM-L6-v2-onnx-int8
+# python -m benchmarks.onnx_embedding
+
+
+import argparse
+import json
+import logging
+import os
+
+import torch
+from dotenv import load_dotenv
+from onnxruntime.quantization import QuantType, quantize_dynamic
+from sentence_transformers import SentenceTransformer
+from sentence_transformers.models import Normalize, Pooling
+
+from app.core.config import settings
+from app.core.onnx_embedding import CONFIG_FILE, MODEL_FILE
+from app.core.vectordb import EMBEDDING_MODEL_NAME
+
+# Load environment variables
+load_dotenv(override=True)
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s %(levelname)s [%(name)s] %(message)s"
+)
+logger = logging.getLogger("app.export_onnx_embedding")
+
+# Constants
+FP32_MODEL_FILE = "model_fp32.onnx"  # Unquantized export, kept for comparison
+OPSET_VERSION = 17
+
+
+class TokenEmbeddings(torch.nn.Module):
+    """Transformer of a sentence-transformers model, returning only the token embeddings."""
+
+    def __init__(self, transformer: torch.nn.Module):
+        super().__init__()
+        self.transformer = transformer
+
+    def forward(self, input_ids, attention_mask, token_type_ids):
+        return self.transformer(
+            input_ids=input_ids,
+            attention_mask=attention_mask,
+            token_type_ids=token_type_ids,
+        ).last_hidden_state
+
+
+def export(model_path_or_name: str, output_dir: str) -> str:
+    """
+    Export a sentence-transformers model as an int8 ONNX encoder.
+
+    Pooling and normalization stay outside the graph and are described in
+    the config file, so the runtime can pool over the attention mask of
+    each batch.
+
+    Args:
+        model_path_or_name: Model name on the Hugging Face Hub or saved model directory
+        output_dir: Directory to write the model, tokenizer and config to
+
+    Returns:
+        str: Path of the quantized model
+
+    Raises:
+        ValueError: If the model does not use mean pooling
+    """
+    model = SentenceTransformer(model_path_or_name, device="cpu")
+    pooling = next(module for module in model if isinstance(module, Pooling))
+    if pooling.get_pooling_mode_str() != "mean":
+        raise ValueError(f"Only mean pooling is supported, got {pooling.get_pooling_mode_str()}")
+
+    os.makedirs(output_dir, exist_ok=True)
+    tokenizer = model.tokenizer
+    tokenizer.save_pretrained(output_dir)
+
+    config = {
+        "model_name": EMBEDDING_MODEL_NAME,
+        "dimensions": model.get_sentence_embedding_dimension(),
+        "max_seq_length": model.max_seq_length,
+        "normalize": any(isinstance(module, Normalize) for module in model),
+        "pad_token": tokenizer.pad_token,
+    }
+    with open(os.path.join(output_dir, CONFIG_FILE), "w") as f:
+        json.dump(config, f, indent=2)
+
+    # Batch and sequence length stay dynamic
+    sample = tokenizer(["An example sentence to trace the encoder."], return_tensors="pt")
+    input_names = ["input_ids", "attention_mask", "token_type_ids"]
+    fp32_path = os.path.join(output_dir, FP32_MODEL_FILE)
+    with torch.no_grad():
+        torch.onnx.export(
+            TokenEmbeddings(model[0].auto_model).eval(),
+            tuple(sample[name] for name in input_names),
+            fp32_path,
+            input_names=input_names,
+            output_names=["token_embeddings"],
+            dynamic_axes={name: {0: "batch", 1: "sequence"} for name in input_names + ["token_embeddings"]},
+            opset_version=OPSET_VERSION,
+            dynamo=False,
+        )
+
+    # Weights of the linear layers become int8; activations are quantized per batch at run time
+    model_path = os.path.join(output_dir, MODEL_FILE)
+    quantize_dynamic(fp32_path, model_path, weight_type=QuantType.QInt8, per_channel=True)
+
+    logger.info(
+        f"Exported {model_path_or_name} to {model_path}: "
+        f"{os.path.getsize(fp32_path) / 1e6:.1f} MB fp32, {os.path.getsize(model_path) / 1e6:.1f} MB int8"
+    )
+    return model_path
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Export the embedding model to int8 ONNX")
+    parser.add_argument("--model", default=settings.EMBEDDING_MODEL_PATH or EMBEDDING_MODEL_NAME, help="Model name or saved model directory")
+    parser.add_argument("--output", default=settings.ONNX_EMBEDDING_PATH, help="Output directory")
+    args = parser.parse_args()
+
+    export(args.model, args.output)
+
+
+if __name__ == "__main__":
+    main()
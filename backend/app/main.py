@@ -8,11 +8,13 @@ from fastapi import FastAPI, APIRouter
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 from dotenv import load_dotenv
+import asyncio
 import os
 
 from app.routes import v1_router
 from app.core import database, config
 from app.core import vectordb
+from app.services import pdf_processor
 
 # Load environment variables
 load_dotenv(override=True)
@@ -24,15 +26,19 @@ def custom_generate_unique_id(route: APIRouter) -> str:
 async def lifespan(app: FastAPI):
     database.create_db_and_tables()
     
-    # Forces collection to initialize
-    try:
-        _ = vectordb.essay_collection.count()
-        print("[ChromaDB] Essay collection loaded successfully.")
-    except Exception as e:
-        print("[ChromaDB] Initialization failed:", str(e))
+    # Load the embedding model and open the collection before the first request
+    if config.settings.VECTOR_WARM_UP:
+        try:
+            count = await asyncio.to_thread(vectordb.warm_up)
+            print(f"[VectorStore] Essay collection loaded successfully ({config.settings.VECTOR_STORE_BACKEND}, {count} documents).")
+        except Exception as e:
+            # Retrieval retries the lazy initialization on first use
+            print("[VectorStore] Initialization failed:", str(e))
 
     yield
 
+    pdf_processor.shutdown_render_pool()
+
 app = FastAPI(
     title="CULI API",
     description="This is an APIs for CULI",
@@ -0,0 +1,176 @@
+# Re-encodes exam pages stored as JPEG into the 1-bit PNG page format and
+# points the exam rows at the new objects. Safe to stop and re-run:
+# python -m app.migrate_page_storage --dry-run
+# python -m app.migrate_page_storage --concurrency 16
+
+
+import argparse
+import asyncio
+import io
+import logging
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+from PIL import Image
+from sqlalchemy import update
+from sqlmodel import Session, select
+
+from app.core import database
+from app.core.config import settings
+from app.models import exam_model
+from app.services import aws_s3, pdf_processor
+
+# Load environment variables
+load_dotenv(override=True)
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s %(levelname)s [%(name)s] %(message)s"
+)
+logger = logging.getLogger("app.migrate_page_storage")
+
+# Constants
+BATCH_SIZE = 100  # Exam rows migrated per transaction
+BILEVEL_THRESHOLD = 128  # Gray level splitting black from white when re-binarizing JPEG pages
+MAX_MIDTONE_SHARE = 0.05  # Pages with more mid-gray pixels than this were not binarized and are skipped
+LEGACY_EXTENSION = ".jpg"
+
+
+def convert_page(image_bytes: bytes) -> Optional[bytes]:
+    """
+    Re-binarize a JPEG page and encode it in the page storage format.
+
+    Args:
+        image_bytes: The stored JPEG file
+
+    Returns:
+        Optional[bytes]: The 1-bit PNG, or None if the page is not a binarized scan
+    """
+    gray = Image.open(io.BytesIO(image_bytes)).convert("L")
+    histogram = np.array(gray.histogram())
+    # JPEG ringing leaves some gray around text edges; real photos are mostly gray
+    if histogram[64:192].sum() > MAX_MIDTONE_SHARE * histogram.sum():
+        return None
+
+    bilevel = gray.point([255 if level >= BILEVEL_THRESHOLD else 0 for level in range(256)]).convert("1")
+    return pdf_processor.encode_page(bilevel)
+
+
+async def migrate_exam(exam_id: int, key: str, dry_run: bool) -> Tuple[int, Optional[str], int, int]:
+    """
+    Convert one stored page.
+
+    Returns:
+        Tuple of (exam_id, new key or None when skipped, old size, new size)
+    """
+    # Read around the local image cache, which would only fill up with the old pages
+    response = await asyncio.to_thread(aws_s3.s3_client.get_object, Bucket=settings.S3_BUCKET_NAME, Key=key)
+    image_bytes = response["Body"].read()
+    png_bytes = await asyncio.to_thread(convert_page, image_bytes)
+    if png_bytes is None:
+        return exam_id, None, len(image_bytes), 0
+
+    new_key = key[:-len(LEGACY_EXTENSION)] + "." + aws_s3.CONTENT_TYPE_EXTENSIONS[pdf_processor.PAGE_CONTENT_TYPE]
+    if not dry_run:
+        await asyncio.to_thread(
+            aws_s3.s3_client.put_object,
+            Bucket=settings.S3_BUCKET_NAME,
+            Key=new_key,
+            Body=png_bytes,
+            ContentType=pdf_processor.PAGE_CONTENT_TYPE
+        )
+    return exam_id, new_key, len(image_bytes), len(png_bytes)
+
+
+async def migrate(concurrency: int, dry_run: bool, limit: Optional[int]) -> Dict[str, int]:
+    """
+    Migrate every exam whose page is still stored as JPEG.
+
+    Rows are processed in id order, a batch at a time. The new objects are
+    written before the rows are updated, and the JPEG objects are only
+    deleted after the update is committed, so an interrupted run never
+    leaves a row pointing at a missing object.
+
+    Args:
+        concurrency: Pages converted at once
+        dry_run: Convert and measure without writing anything
+        limit: Maximum number of exams to migrate
+
+    Returns:
+        Dict[str, int]: Counts of migrated, skipped and failed pages and bytes before and after
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    stats = {"migrated": 0, "skipped": 0, "failed": 0, "old_bytes": 0, "new_bytes": 0}
+    last_id = 0
+
+    async def bounded(exam_id: int, key: str):
+        async with semaphore:
+            return await migrate_exam(exam_id, key, dry_run)
+
+    while limit is None or stats["migrated"] + stats["skipped"] + stats["failed"] < limit:
+        batch_size = BATCH_SIZE if limit is None else min(BATCH_SIZE, limit - stats["migrated"] - stats["skipped"] - stats["failed"])
+        with Session(database.engine) as session:
+            rows = session.exec(
+                select(exam_model.Exam.id, exam_model.Exam.exam_image_url)
+                .where(exam_model.Exam.id > last_id)
+                .where(exam_model.Exam.exam_image_url.like(f"%{LEGACY_EXTENSION}"))
+                .order_by(exam_model.Exam.id)
+                .limit(batch_size)
+            ).all()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+
+        results = await asyncio.gather(*(bounded(exam_id, key) for exam_id, key in rows), return_exceptions=True)
+
+        updates, old_keys = [], []
+        for (exam_id, key), result in zip(rows, results):
+            if isinstance(result, BaseException):
+                logger.error(f"Failed to migrate exam {exam_id}: {str(result)}")
+                stats["failed"] += 1
+                continue
+
+            _, new_key, old_size, new_size = result
+            if new_key is None:
+                stats["skipped"] += 1
+                continue
+
+            stats["migrated"] += 1
+            stats["old_bytes"] += old_size
+            stats["new_bytes"] += new_size
+            updates.append({"id": exam_id, "exam_image_url": new_key})
+            old_keys.append(key)
+
+        if dry_run or not updates:
+            continue
+
+        with Session(database.engine) as session:
+            session.execute(update(exam_model.Exam), updates)
+            session.commit()
+
+        await asyncio.gather(*(aws_s3.delete_exam_image(key) for key in old_keys), return_exceptions=True)
+        logger.info(f"Migrated {stats['migrated']} pages so far (up to exam {last_id})")
+
+    return stats
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Convert stored JPEG exam pages to 1-bit PNG")
+    parser.add_argument("--concurrency", type=int, default=settings.S3_UPLOAD_CONCURRENCY, help="Pages converted at once")
+    parser.add_argument("--limit", type=int, help="Maximum number of exams to migrate")
+    parser.add_argument("--dry-run", action="store_true", help="Convert and report sizes without writing to S3 or the database")
+    args = parser.parse_args()
+
+    stats = asyncio.run(migrate(args.concurrency, args.dry_run, args.limit))
+    saved = 1 - stats["new_bytes"] / stats["old_bytes"] if stats["old_bytes"] else 0
+    logger.info(
+        f"{'Would migrate' if args.dry_run else 'Migrated'} {stats['migrated']} pages "
+        f"({stats['old_bytes'] / 1024 / 1024:.1f} MB -> {stats['new_bytes'] / 1024 / 1024:.1f} MB, {saved:.0%} smaller), "
+        f"skipped {stats['skipped']}, failed {stats['failed']}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+# Copies the exam collection from the local Chroma store into pgvector (or
+# back), keeping ids, documents, metadata and the stored vectors as they are.
+# Re-running overwrites items already copied:
+# python -m app.migrate_vector_store --source chroma --target pgvector
+
+
+import argparse
+import logging
+
+from dotenv import load_dotenv
+
+from app.core import vectordb
+
+# Load environment variables
+load_dotenv(override=True)
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s %(levelname)s [%(name)s] %(message)s"
+)
+logger = logging.getLogger("app.migrate_vector_store")
+
+# Constants
+BATCH_SIZE = 500  # Items read and written at a time
+
+
+def migrate(source_backend: str, target_backend: str, batch_size: int = BATCH_SIZE) -> int:
+    """
+    Copy every item of one vector store into another.
+
+    Args:
+        source_backend: Backend to read from ("chroma" or "pgvector")
+        target_backend: Backend to write to
+        batch_size: Items copied per batch
+
+    Returns:
+        int: Number of items copied
+
+    Raises:
+        RuntimeError: If the target holds fewer of the source ids than were copied
+    """
+    source = vectordb.get_vector_store(source_backend)
+    target = vectordb.get_vector_store(target_backend)
+
+    copied = 0
+    for batch in source.iter_all(batch_size):
+        target.upsert(batch["ids"], batch["documents"], batch["embeddings"], batch["metadatas"])
+        copied += len(batch["ids"])
+        logger.info(f"Copied {copied} items")
+
+    missing = set(source.list_ids()) - set(target.list_ids())
+    if missing:
+        raise RuntimeError(f"{len(missing)} items are missing from {target_backend} after copying")
+
+    logger.info(f"Copied {copied} items from {source_backend} to {target_backend}; {target_backend} now holds {target.count()}")
+    return copied
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Copy the exam vector collection between backends")
+    parser.add_argument("--source", choices=["chroma", "pgvector"], default="chroma")
+    parser.add_argument("--target", choices=["chroma", "pgvector"], default="pgvector")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+
+    if args.source == args.target:
+        parser.error("--source and --target must differ")
+    migrate(args.source, args.target, args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,11 @@
 from .project_model import Project
 from .user_model import User
 from .task_model import Task
+from .exam_model import Exam
+from .job_model import EvaluationJob, StoragePurgeJob
+from .batch_model import BatchRun
+from .rate_limit_model import RateLimitBucket
+from .cache_model import OcrCacheEntry, EvaluationCacheEntry
+from .embedding_model import ExamEmbedding
 
-__all__ = ["Project", "User", "Task"]
+__all__ = ["Project", "User", "Task", "Exam", "EvaluationJob", "StoragePurgeJob", "BatchRun", "RateLimitBucket", "OcrCacheEntry", "EvaluationCacheEntry", "ExamEmbedding"]
@@ -0,0 +1,41 @@
+from datetime import datetime
+from typing import List, Optional
+
+from sqlalchemy import Column, JSON
+from sqlmodel import SQLModel, Field
+
+from ..schemas import batch_schema, exam_schema
+
+
+class BatchRun(SQLModel, table=True):
+    __tablename__ = 'batch_runs'
+
+    id: int = Field(default=None, primary_key=True)
+    phase: batch_schema.BatchPhaseEnum = Field(default=batch_schema.BatchPhaseEnum.ocr)
+    status: batch_schema.BatchStatusEnum = Field(default=batch_schema.BatchStatusEnum.preparing, index=True)
+    evaluation_type: exam_schema.EvaluationTypeEnum = Field(default=exam_schema.EvaluationTypeEnum.full)
+    backend: str
+
+    # Exams in the current phase and the provider batches holding their requests
+    exam_ids: List[int] = Field(default_factory=list, sa_column=Column(JSON, nullable=False))
+    provider_batch_ids: List[str] = Field(default_factory=list, sa_column=Column(JSON, nullable=False))
+    request_count: int = Field(default=0)
+    last_error: Optional[str] = Field(default=None)
+
+    # Progress of the current phase, saved as it happens so a retry does not redo it
+    submitted_exam_ids: Optional[List[int]] = Field(default=None, sa_column=Column(JSON))
+    cached_exam_ids: Optional[List[int]] = Field(default=None, sa_column=Column(JSON))
+    attempts: Optional[int] = Field(default=0)  # Consecutive failed attempts to advance the run
+
+    # Set while a worker advances the run
+    locked_by: Optional[str] = Field(default=None)
+    locked_at: Optional[datetime] = Field(default=None)
+    polled_at: Optional[datetime] = Field(default=None)
+
+    # Timestamps
+    created_at: datetime = Field(default_factory=datetime.now)
+    updated_at: datetime = Field(default_factory=datetime.now)
+
+    # Foreign keys to Project & User
+    project_id: int = Field(foreign_key="projects.id", ondelete="CASCADE", index=True)
+    user_id: int = Field(foreign_key="users.id", ondelete="CASCADE", index=True)
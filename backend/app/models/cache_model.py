@@ -0,0 +1,35 @@
+from datetime import datetime
+
+from sqlmodel import SQLModel, Field
+
+
+class OcrCacheEntry(SQLModel, table=True):
+    __tablename__ = 'ocr_cache'
+
+    # sha256 of the preprocessed image, OCR model and prompt version
+    key: str = Field(primary_key=True)
+    model_name: str
+    prompt_version: str
+    # Serialized ExamModel
+    payload: str
+    size_bytes: int
+
+    # Timestamps
+    created_at: datetime = Field(default_factory=datetime.now, index=True)
+    last_accessed_at: datetime = Field(default_factory=datetime.now, index=True)
+
+
+class EvaluationCacheEntry(SQLModel, table=True):
+    __tablename__ = 'evaluation_cache'
+
+    # sha256 of the task prompt, exam text, few-shot examples and model
+    key: str = Field(primary_key=True)
+    task_id: int = Field(index=True)
+    model_name: str
+    # Serialized StructuredAnalyzeResponse
+    payload: str
+    size_bytes: int
+
+    # Timestamps
+    created_at: datetime = Field(default_factory=datetime.now, index=True)
+    last_accessed_at: datetime = Field(default_factory=datetime.now, index=True)
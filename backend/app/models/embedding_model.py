@@ -0,0 +1,19 @@
+from datetime import datetime
+
+from sqlalchemy import Column, LargeBinary
+from sqlmodel import SQLModel, Field
+
+
+class ExamEmbedding(SQLModel, table=True):
+    __tablename__ = 'exam_embeddings'
+
+    # sha256 of the embedding model name and the exam text
+    key: str = Field(primary_key=True)
+    model_name: str
+    dimensions: int
+    # Raw little-endian vector of `dtype` ("float16" or "float32")
+    dtype: str
+    vector: bytes = Field(sa_column=Column(LargeBinary, nullable=False))
+
+    # Timestamps
+    created_at: datetime = Field(default_factory=datetime.now, index=True)
@@ -12,6 +12,9 @@ class Exam(SQLModel, table=True):
     status: exam_schema.StatusEnum = Field(default=exam_schema.StatusEnum.pending, index=True)
     page: int = Field(index=True)
     total_pages: Optional[int] = Field(default=None)
+    # Pages of a PDF uploaded with group_pages share the ID of their first page,
+    # which holds the scores of the whole submission
+    lead_exam_id: Optional[int] = Field(default=None, index=True)
     exam_image_url: str | None = None
 
     student_id: str | None = None
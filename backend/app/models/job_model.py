@@ -0,0 +1,55 @@
+from datetime import datetime
+from typing import Optional
+
+from sqlmodel import SQLModel, Field
+
+from ..schemas import exam_schema, job_schema
+
+
+class EvaluationJob(SQLModel, table=True):
+    __tablename__ = 'evaluation_jobs'
+
+    id: int = Field(default=None, primary_key=True)
+    status: job_schema.JobStatusEnum = Field(default=job_schema.JobStatusEnum.queued, index=True)
+    evaluation_type: exam_schema.EvaluationTypeEnum = Field(default=exam_schema.EvaluationTypeEnum.full)
+    attempts: int = Field(default=0)
+    # Bypass cached OCR results when re-evaluating
+    force_refresh: bool = Field(default=False)
+
+    # Set while a worker holds the job
+    worker_id: Optional[str] = Field(default=None)
+    locked_at: Optional[datetime] = Field(default=None)
+    last_error: Optional[str] = Field(default=None)
+
+    # Timestamps
+    created_at: datetime = Field(default_factory=datetime.now)
+    updated_at: datetime = Field(default_factory=datetime.now)
+
+    # Foreign keys to Exam, Project & User
+    exam_id: int = Field(foreign_key="exams.id", ondelete="CASCADE", index=True)
+    project_id: int = Field(foreign_key="projects.id", ondelete="CASCADE", index=True)
+    user_id: int = Field(foreign_key="users.id", ondelete="CASCADE", index=True)
+
+
+class StoragePurgeJob(SQLModel, table=True):
+    __tablename__ = 'storage_purge_jobs'
+
+    id: int = Field(default=None, primary_key=True)
+    # S3 prefix to empty; the project rows are already gone when the job runs
+    prefix: str
+    status: job_schema.JobStatusEnum = Field(default=job_schema.JobStatusEnum.queued, index=True)
+    attempts: int = Field(default=0)
+    deleted_objects: int = Field(default=0)
+
+    # Set while a worker holds the job
+    worker_id: Optional[str] = Field(default=None)
+    locked_at: Optional[datetime] = Field(default=None)
+    last_error: Optional[str] = Field(default=None)
+
+    # Timestamps
+    created_at: datetime = Field(default_factory=datetime.now)
+    updated_at: datetime = Field(default_factory=datetime.now)
+
+    # Not foreign keys: the job outlives the project and user rows it purges
+    project_id: int = Field(index=True)
+    user_id: int = Field(index=True)
@@ -0,0 +1,11 @@
+from sqlmodel import SQLModel, Field
+
+
+class RateLimitBucket(SQLModel, table=True):
+    __tablename__ = 'rate_limit_buckets'
+
+    # e.g. "gpt-4o:tokens" or "gpt-4o:requests"
+    key: str = Field(primary_key=True)
+    tokens: float
+    # Epoch seconds of the last refill
+    updated_at: float
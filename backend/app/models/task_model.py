@@ -1,4 +1,6 @@
 from datetime import datetime
+from typing import Optional
+
 from sqlmodel import SQLModel, Field
 
 
@@ -12,4 +14,5 @@ class Task(SQLModel, table=True):
     rubrics: str
     example_evaluation: str
     student_instruction: str
-    created_at: datetime = datetime.now().isoformat()
\ No newline at end of file
+    created_at: datetime = datetime.now().isoformat()
+    updated_at: Optional[datetime] = Field(default=None)  # Set on every edit; keys compiled scoring prompts
\ No newline at end of file
@@ -1,15 +1,17 @@
+import asyncio
+import os
 from typing import List, Optional
-from io import BytesIO
 
-from fastapi import APIRouter, HTTPException, status, BackgroundTasks, UploadFile, File, Query
+from fastapi import APIRouter, HTTPException, status, UploadFile, File, Query
 from fastapi.responses import StreamingResponse
+from sqlalchemy import delete
 from sqlmodel import select
 from datetime import datetime
 
 from ...core import database, security
-from ...models import project_model, task_model, exam_model
-from ...schemas import project_schema, exam_schema
-from ...services import aws_s3, background_helper, pdf_processor
+from ...models import project_model, task_model, exam_model, batch_model
+from ...schemas import project_schema, exam_schema, batch_schema
+from ...services import aws_s3, background_helper, batch_evaluation, exam_ingestion, job_queue, pdf_processor, storage_purge
 from ...utils import report_generator, csv_generator
 
 import logging
@@ -138,6 +140,8 @@ async def delete_project(
 ):
     """
     Delete a project and all its associated exams for the current user.
+    
+    The exam images are removed from S3 afterwards by the evaluation worker.
     """
     # Get the project
     statement = select(project_model.Project).where(
@@ -153,20 +157,15 @@ async def delete_project(
         )
     
     try:
-        # Delete all associated exams from S3
-        await aws_s3.delete_project_exams(current_user.id, project_id)
-        
         # Delete all associated exams from database
-        exams = session.exec(
-            select(exam_model.Exam)
+        session.execute(
+            delete(exam_model.Exam)
             .where(exam_model.Exam.project_id == project_id)
-        ).all()
-        
-        for exam in exams:
-            session.delete(exam)
+        )
         
-        # Delete the project
+        # Delete the project and queue its S3 objects for removal by the worker
         session.delete(db_project)
+        storage_purge.enqueue_project_purge(session, current_user.id, project_id)
         session.commit()
         
     except Exception as e:
@@ -213,10 +212,14 @@ async def download_multiple_exams_pdf(
 
     final_pdf = await report_generator.generate_exam_pdf(exams)
 
+    size = os.path.getsize(final_pdf)
     return StreamingResponse(
-        final_pdf,
+        report_generator.stream_report(final_pdf),
         media_type="application/pdf",
-        headers={"Content-Disposition": f"attachment; filename=project_{project_id}_grading_report.pdf"}
+        headers={
+            "Content-Disposition": f"attachment; filename=project_{project_id}_grading_report.pdf",
+            "Content-Length": str(size),
+        }
     )
 
 
@@ -294,10 +297,14 @@ async def download_single_exam_pdf(
 
     final_pdf = await report_generator.generate_exam_pdf([exam])
 
+    size = os.path.getsize(final_pdf)
     return StreamingResponse(
-        final_pdf,
+        report_generator.stream_report(final_pdf),
         media_type="application/pdf",
-        headers={"Content-Disposition": f"attachment; filename=exam_{exam_id}_grading_report.pdf"}
+        headers={
+            "Content-Disposition": f"attachment; filename=exam_{exam_id}_grading_report.pdf",
+            "Content-Length": str(size),
+        }
     )
 
 @router.get("/{project_id}/exams/{exam_id}/download/csv", status_code=status.HTTP_200_OK)
@@ -342,14 +349,18 @@ async def download_single_exam_csv(
 @router.post('/{project_id}/exams/upload_and_evaluate', response_model=List[exam_schema.ExamInDB])
 async def upload_and_evaluate_exams(
     project_id: int,
-    background_tasks: BackgroundTasks,
     files: List[UploadFile] = File(...),
     current_user: security.UserDep = security.UserDep,
-    session: database.SessionDep = database.SessionDep
+    session: database.SessionDep = database.SessionDep,
+    group_pages: bool = False
 ):
     """
     Upload multiple exam PDFs, convert each page to images, store in S3, and queue for evaluation.
-    Each page of the PDF will be processed and evaluated independently.
+    Each page of the PDF will be processed and evaluated independently by the evaluation worker.
+    
+    With group_pages, all pages of one PDF are a single submission: they are
+    read in one OCR request and scored once, with the scores stored on the
+    first page. Every page keeps its own row and extracted text for display.
     """
     # Verify project exists and user has access
     project = session.exec(
@@ -373,85 +384,109 @@ async def upload_and_evaluate_exams(
                 detail=f"File {file.filename} is not a PDF"
             )
         
+        pdf_path = None
         try:
-            # Read file content
-            file_content = await file.read()
-            pdf_file = BytesIO(file_content)
-            
-            # Process PDF and get pages
-            processed_pages = await pdf_processor.process_pdf(pdf_file)
-            
-            # Process each page
-            for page_number, page_image in processed_pages:
-                try:
-                    # Create exam record first
-                    exam = exam_model.Exam(
-                        project_id=project_id,
-                        user_id=current_user.id,
-                        page=page_number,
-                        total_pages=len(processed_pages),
-                        status=exam_schema.StatusEnum.pending,
-                        is_embedded=False,
-                        source=exam_schema.SourceEnum.internal,
-                        exam_image_url=None,  # Will be set after S3 upload
-                        created_at=datetime.now().isoformat(),
-                        updated_at=datetime.now().isoformat()
-                    )
-                    
-                    # Add and commit to ensure exam is persisted
-                    session.add(exam)
-                    session.commit()
-                    session.refresh(exam)
-                    
-                    # Create BytesIO from image bytes
-                    image_file = BytesIO(page_image)
-                    
-                    try:
-                        # Upload page to S3 using the exam ID
-                        s3_key = await aws_s3.upload_exam_image(
-                            file=image_file,
-                            user_id=current_user.id,
-                            project_id=project_id,
-                            exam_id=exam.id,
-                            page_number=page_number
-                        )
-                        
-                        # Update exam with S3 key
-                        exam.exam_image_url = s3_key
-                        session.add(exam)
-                        session.commit()
-                        session.refresh(exam)
-                        
-                        created_exams.append(exam)
-                        
-                    except Exception as e:
-                        # If S3 upload fails, clean up the exam record
-                        logger.error(f"Failed to upload to S3 for exam {exam.id}: {str(e)}")
-                        session.delete(exam)
-                        session.commit()
-                        raise
-                    
-                except Exception as e:
-                    logger.error(f"Failed to process page {page_number}: {str(e)}")
-                    # Continue with other pages even if one fails
-                    continue
+            # Spool the upload to disk instead of reading it into memory
+            pdf_path = await pdf_processor.spool_upload(file)
+            page_count = await asyncio.to_thread(pdf_processor.count_pdf_pages, pdf_path)
             
-            # Queue background evaluation for all pages
-            background_tasks.add_task(
-                background_helper.evaluate_project_exams,
-                session,
-                project_id,
-                current_user
+            # Insert all page rows at once and upload pages concurrently as they are rendered
+            file_exams = await exam_ingestion.ingest_pdf(
+                session, pdf_path, page_count, project_id, current_user.id, group_pages
             )
             
+            created_exams.extend(file_exams)
+            
         except Exception as e:
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail=f"Failed to process exam {file.filename}: {str(e)}"
             )
+        finally:
+            if pdf_path:
+                os.remove(pdf_path)
+    
+    # Queue evaluation for all uploaded pages in the durable job queue; grouped
+    # submissions are queued once, through their first page
+    job_queue.enqueue_evaluation_jobs(
+        session,
+        project_id,
+        current_user.id,
+        [exam.id for exam in created_exams if exam.lead_exam_id in (None, exam.id)]
+    )
     
     return created_exams
 
+@router.post(
+    '/{project_id}/batch_evaluations',
+    response_model=batch_schema.BatchRunRead,
+    status_code=status.HTTP_202_ACCEPTED
+)
+async def start_batch_evaluation(
+    project_id: int,
+    current_user: security.UserDep = security.UserDep,
+    session: database.SessionDep = database.SessionDep,
+    evaluation_type: exam_schema.EvaluationTypeEnum = exam_schema.EvaluationTypeEnum.full
+):
+    """
+    Grade all pending exams of a project through the offline batch API.
+
+    Results arrive within the provider's completion window instead of
+    seconds, at a lower price than interactive grading.
+
+    Args:
+        project_id: ID of the project
+        current_user: Current authenticated user
+        session: Database session
+        evaluation_type: Type of evaluation to perform (full or ai_only)
+    """
+    project = session.exec(
+        select(project_model.Project)
+        .where(project_model.Project.id == project_id)
+        .where(project_model.Project.user_id == current_user.id)
+    ).first()
+
+    if not project:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Project with ID {project_id} not found"
+        )
+
+    run = batch_evaluation.start_batch_run(session, project_id, current_user.id, evaluation_type)
+    if not run:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Project has no pending exams to evaluate"
+        )
+    return run
+
+@router.get('/{project_id}/batch_evaluations', response_model=List[batch_schema.BatchRunRead])
+async def list_batch_evaluations(
+    project_id: int,
+    current_user: security.UserDep = security.UserDep,
+    session: database.SessionDep = database.SessionDep
+):
+    """
+    List the offline batch evaluation runs of a project, newest first.
+    """
+    project = session.exec(
+        select(project_model.Project)
+        .where(project_model.Project.id == project_id)
+        .where(project_model.Project.user_id == current_user.id)
+    ).first()
+
+    if not project:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Project with ID {project_id} not found"
+        )
+
+    return session.exec(
+        select(batch_model.BatchRun)
+        .where(batch_model.BatchRun.project_id == project_id)
+        .order_by(batch_model.BatchRun.id.desc())
+    ).all()
+
 @router.get('/{project_id}/exams/', response_model=List[exam_schema.ExamInDB])
 async def list_project_exams(
     project_id: int,
@@ -584,10 +619,10 @@ async def update_exam(
 async def re_evaluate_exam(
     project_id: int,
     exam_id: int,
-    background_tasks: BackgroundTasks,
     current_user: security.UserDep = security.UserDep,
     session: database.SessionDep = database.SessionDep,
-    evaluation_type: exam_schema.EvaluationTypeEnum = exam_schema.EvaluationTypeEnum.full
+    evaluation_type: exam_schema.EvaluationTypeEnum = exam_schema.EvaluationTypeEnum.full,
+    force_refresh: bool = False
 ):
     """
     Trigger re-evaluation of a specific exam.
@@ -595,10 +630,10 @@ async def re_evaluate_exam(
     Args:
         project_id: ID of the project
         exam_id: ID of the exam to re-evaluate
-        background_tasks: FastAPI background tasks
         current_user: Current authenticated user
         session: Database session
         evaluation_type: Type of evaluation to perform (full or ai_only)
+        force_refresh: Run OCR again instead of reusing the cached result
     """
     # Verify project exists and user has access
     project = session.exec(
@@ -626,38 +661,44 @@ async def re_evaluate_exam(
             detail=f"Exam with ID {exam_id} not found"
         )
     
-    # Reset exam status
-    exam.status = exam_schema.StatusEnum.pending
-    
-    # Reset fields based on evaluation type
-    if evaluation_type == exam_schema.EvaluationTypeEnum.full:
-        # Reset all fields for full evaluation
-        exam.student_id = None
-        exam.student_section = None
-        exam.student_seat = None
-        exam.student_room = None
-        exam.exam_extracted_text = None
-    
-    # Reset AI evaluation fields for both types
-    exam.exam_improved_text = None
-    exam.scoring_justification = None
-    exam.score_task_completion = None
-    exam.score_organization = None
-    exam.score_style_language_expression = None
-    exam.score_structural_variety_accuracy = None
-    exam.ai_comment = None
-    exam.updated_at = datetime.utcnow()
+    # Pages of a grouped submission are re-evaluated together through the first page
+    lead_exam = (session.get(exam_model.Exam, exam.lead_exam_id) if exam.lead_exam_id else None) or exam
+    
+    for page in background_helper.get_submission_pages(session, lead_exam):
+        # Reset exam status
+        page.status = exam_schema.StatusEnum.pending
+        
+        # Reset fields based on evaluation type
+        if evaluation_type == exam_schema.EvaluationTypeEnum.full:
+            # Reset all fields for full evaluation
+            page.student_id = None
+            page.student_section = None
+            page.student_seat = None
+            page.student_room = None
+            page.exam_extracted_text = None
+        
+        # Reset AI evaluation fields for both types
+        page.exam_improved_text = None
+        page.scoring_justification = None
+        page.score_task_completion = None
+        page.score_organization = None
+        page.score_style_language_expression = None
+        page.score_structural_variety_accuracy = None
+        page.ai_comment = None
+        page.updated_at = datetime.utcnow()
+        session.add(page)
     
-    session.add(exam)
     session.commit()
+    session.refresh(exam)
     
     # Queue re-evaluation
-    background_tasks.add_task(
-        background_helper.process_exam_batch,
+    job_queue.enqueue_evaluation_jobs(
         session,
         project_id,
-        [exam_id],
-        evaluation_type
+        current_user.id,
+        [lead_exam.id],
+        evaluation_type,
+        force_refresh=force_refresh
     )
     
     return exam
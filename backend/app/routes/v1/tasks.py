@@ -1,3 +1,4 @@
+from datetime import datetime
 from typing import List
 
 from fastapi import APIRouter, HTTPException, status
@@ -6,6 +7,7 @@ from sqlmodel import select
 from ...core import database, security
 from ...models import task_model
 from ...schemas import task_schema
+from ...services import inference_cache
 
 router = APIRouter(
     prefix='/tasks',
@@ -89,12 +91,16 @@ def update_task(
     update_data = task_update.model_dump(exclude_unset=True)
     for key, value in update_data.items():
         setattr(db_task, key, value)
+    db_task.updated_at = datetime.now()
     
     # Commit changes
     session.add(db_task)
     session.commit()
     session.refresh(db_task)
     
+    # Cached evaluations use the old rubric; compiled prompts are keyed on updated_at
+    inference_cache.invalidate_task_evaluations(session, task_id)
+    
     return db_task
 
 @router.delete('/{task_id}', status_code=status.HTTP_204_NO_CONTENT)
@@ -118,4 +124,6 @@ def delete_task(
     session.delete(db_task)
     session.commit()
     
+    inference_cache.invalidate_task_evaluations(session, task_id)
+    
     return None 
\ No newline at end of file
@@ -1,13 +1,16 @@
-from typing import List
+from typing import Dict, List, Optional, Tuple
 
 from fastapi import APIRouter, HTTPException, status
+from sqlalchemy import update
 from sqlmodel import select
 
 from ...core import database, security
+from ...core.config import settings
 from ...schemas import vector_schema
-from ...models import exam_model
+from ...models import exam_model, project_model
 from ...schemas import user_schema, exam_schema
-from ...core.vectordb import chroma_client, essay_collection, build_collection
+from ...services import embedding_store
+from ...core.vectordb import get_shared_vector_store, upsert_documents
 
 import logging
 
@@ -30,12 +33,11 @@ def list_collection_documents(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="You do not have permission to access this resource."
         )
-    collection = chroma_client.get_collection("essays")
-    results = collection.get()
+    doc_ids = get_shared_vector_store().list_ids()
     
     return {
-        "count": len(results["ids"]),
-        "exam_ids": [int(doc_id) for doc_id in results["ids"]]
+        "count": len(doc_ids),
+        "exam_ids": [int(doc_id) for doc_id in doc_ids]
     }
 
 
@@ -110,74 +112,103 @@ def embed_batch_exams(
             detail="You do not have permission to access this resource."
         )
 
-    results: List[vector_schema.EmbedResult] = []
-    updated_exams = []
+    # Load every requested exam in one query
+    exams = {
+        exam.id: exam
+        for exam in session.exec(
+            select(exam_model.Exam).where(exam_model.Exam.id.in_(set(request.exam_ids)))
+        ).all()
+    }
+
+    # Task of each exam's project, stored with the vector so retrieval can stay within a task
+    task_ids = dict(session.exec(
+        select(project_model.Project.id, project_model.Project.task_id)
+        .where(project_model.Project.id.in_({exam.project_id for exam in exams.values()}))
+    ).all())
+
+    results: List[Optional[vector_schema.EmbedResult]] = [None] * len(request.exam_ids)
+    to_embed: Dict[int, List[int]] = {}  # Exam ID -> positions in the results
+    documents: Dict[int, Tuple[str, dict]] = {}  # Exam ID -> (text, metadata)
 
-    for exam_id in request.exam_ids:
-        exam = session.exec(select(exam_model.Exam).where(exam_model.Exam.id == exam_id)).first()
+    for position, exam_id in enumerate(request.exam_ids):
+        exam = exams.get(exam_id)
 
         if not exam:
-            results.append(vector_schema.EmbedResult(
+            results[position] = vector_schema.EmbedResult(
                 exam_id=exam_id,
                 status=vector_schema.EmbedStatusEnum.failed,
                 detail="Not found"
-            ))
+            )
             continue
 
         if not exam.exam_extracted_text:
-            results.append(vector_schema.EmbedResult(
+            results[position] = vector_schema.EmbedResult(
                 exam_id=exam_id,
                 status=vector_schema.EmbedStatusEnum.failed,
                 detail="Missing extracted text"
-            ))
+            )
             continue
 
         if exam.status != exam_schema.StatusEnum.processed:
-            results.append(vector_schema.EmbedResult(
+            results[position] = vector_schema.EmbedResult(
                 exam_id=exam_id,
                 status=vector_schema.EmbedStatusEnum.processed,
                 detail="Exam is not processed"
-            ))
+            )
             continue
 
         if exam.is_embedded and not request.overwrite:
-            results.append(vector_schema.EmbedResult(
+            results[position] = vector_schema.EmbedResult(
                 exam_id=exam_id,
                 status=vector_schema.EmbedStatusEnum.skipped,
                 detail="Already embedded"
-            ))
+            )
             continue
 
-        metadata = {
-            "score_task_completion": exam.score_task_completion,
-            "score_organization": exam.score_organization,
-            "score_style_language_expression": exam.score_style_language_expression,
-            "score_structural_variety_accuracy": exam.score_structural_variety_accuracy,
-        }
+        if exam_id not in to_embed:
+            to_embed[exam_id] = []
+            metadata = {
+                "task_id": task_ids.get(exam.project_id),
+                "project_id": exam.project_id,
+                "source": exam.source.value,
+                "score_task_completion": exam.score_task_completion,
+                "score_organization": exam.score_organization,
+                "score_style_language_expression": exam.score_style_language_expression,
+                "score_structural_variety_accuracy": exam.score_structural_variety_accuracy,
+            }
+            # The collection does not store empty metadata values
+            documents[exam_id] = (exam.exam_extracted_text, {key: value for key, value in metadata.items() if value is not None})
+        to_embed[exam_id].append(position)
+
+    # Embed and upsert in chunks, committing is_embedded once per chunk
+    exam_ids = list(to_embed)
+    for start in range(0, len(exam_ids), settings.VECTOR_UPSERT_CHUNK_SIZE):
+        chunk = exam_ids[start:start + settings.VECTOR_UPSERT_CHUNK_SIZE]
 
         try:
-            build_collection(exam_id=exam.id, text=exam.exam_extracted_text, metadata=metadata)
-            exam.is_embedded = True
-            updated_exams.append(exam)
-
-            results.append(vector_schema.EmbedResult(
-                exam_id=exam_id,
-                status=vector_schema.EmbedStatusEnum.embedded,
-                detail="Success"
-            ))
+            texts = [documents[exam_id][0] for exam_id in chunk]
+            upsert_documents(
+                chunk,
+                texts,
+                [documents[exam_id][1] for exam_id in chunk],
+                embeddings=embedding_store.get_embeddings(session, texts)
+            )
+            session.execute(
+                update(exam_model.Exam)
+                .where(exam_model.Exam.id.in_(chunk))
+                .values(is_embedded=True)
+            )
+            session.commit()
+            outcome, detail = vector_schema.EmbedStatusEnum.embedded, "Success"
 
         except Exception as e:
-            results.append(vector_schema.EmbedResult(
-                exam_id=exam_id,
-                status=vector_schema.EmbedStatusEnum.failed,
-                detail=str(e)
-            ))
-
-        # Batch update
-        for exam in updated_exams:
-            session.add(exam)
-        session.commit()
+            session.rollback()
+            logger.error(f"Failed to embed {len(chunk)} exams: {str(e)}")
+            outcome, detail = vector_schema.EmbedStatusEnum.failed, str(e)
 
+        for exam_id in chunk:
+            for position in to_embed[exam_id]:
+                results[position] = vector_schema.EmbedResult(exam_id=exam_id, status=outcome, detail=detail)
 
     return vector_schema.EmbedBatchResponse(results=results)
 
@@ -204,9 +235,9 @@ def delete_vector_by_exam_id(
     if not exam.is_embedded:
         raise HTTPException(status_code=400, detail="Exam is not embedded")
 
-    # Delete from ChromaDB
+    # Delete from the vector store
     try:
-        essay_collection.delete(ids=[exam.id])
+        get_shared_vector_store().delete(ids=[str(exam.id)])
         exam.is_embedded = False
         exam.hashed_id = None
         session.add(exam)
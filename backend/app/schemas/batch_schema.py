@@ -0,0 +1,37 @@
+from enum import Enum
+from datetime import datetime
+from typing import Optional, List
+
+from pydantic import BaseModel, Field
+
+from .exam_schema import EvaluationTypeEnum
+
+
+class BatchPhaseEnum(str, Enum):
+    ocr: str = 'ocr'
+    scoring: str = 'scoring'
+
+
+class BatchStatusEnum(str, Enum):
+    preparing: str = 'preparing'  # Building and submitting the request file
+    submitted: str = 'submitted'  # Waiting for the batch backend
+    completed: str = 'completed'
+    failed: str = 'failed'
+
+
+class BatchRunRead(BaseModel):
+    """Schema for reading an offline evaluation run."""
+    id: int = Field(..., description="Unique identifier for the batch run")
+    project_id: int = Field(..., description="Project being evaluated")
+    phase: BatchPhaseEnum = Field(..., description="Current phase of the run")
+    status: BatchStatusEnum = Field(..., description="Status of the current phase")
+    evaluation_type: EvaluationTypeEnum = Field(..., description="Type of evaluation performed")
+    backend: str = Field(..., description="Batch backend handling the run")
+    exam_ids: List[int] = Field(..., description="Exams included in the current phase")
+    request_count: int = Field(..., description="Requests submitted for the current phase")
+    last_error: Optional[str] = Field(None, description="Last error reported for the run")
+    created_at: datetime = Field(..., description="Timestamp when the run was created")
+    updated_at: datetime = Field(..., description="Timestamp when the run was last updated")
+
+    class Config:
+        from_attributes = True
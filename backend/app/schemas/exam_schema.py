@@ -25,6 +25,7 @@ class SourceEnum(str, Enum):
 class ExamModel(BaseModel):
     status: StatusEnum = StatusEnum.pending
     page: int
+    lead_exam_id: Optional[int] = None
     exam_image_url: Optional[str] = None
 
     student_id: Optional[str] = None
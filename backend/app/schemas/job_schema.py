@@ -0,0 +1,8 @@
+from enum import Enum
+
+
+class JobStatusEnum(str, Enum):
+    queued: str = 'queued'
+    running: str = 'running'
+    done: str = 'done'
+    failed: str = 'failed'
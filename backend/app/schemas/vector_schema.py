@@ -29,6 +29,7 @@ class EmbedStatusEnum(str, Enum):
     embedded: str = 'embedded'
     skipped: str = 'skipped'
     failed: str = 'failed'
+    processed: str = 'processed'
 
 class EmbedBatchRequest(BaseModel):
     exam_ids: List[int]
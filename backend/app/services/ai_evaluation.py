@@ -1,82 +1,39 @@
+import asyncio
 import base64
 import logging
-import time
-from typing import Any, BinaryIO
+from typing import Any, BinaryIO, Dict, List, Tuple
 from io import BytesIO
-from textwrap import dedent
 from fastapi import HTTPException, status
 
 import instructor
-import numpy as np
-from openai import OpenAI
-from PIL import Image, ImageFilter
+from openai import AsyncOpenAI
+from PIL import Image
 from pydantic import BaseModel, Field
-from sqlmodel import select
 
 from ..core.config import settings
-from ..models import task_model
 from ..schemas import exam_schema
+from . import inference_cache, prompt_cache
+from .image_preprocessing import ocr_polarity, preprocess_image
+from .rate_limiter import rate_limiter
+from .token_counter import estimate_chat_tokens
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
-# Initialize OpenAI client with instructor
-client = instructor.from_openai(OpenAI(api_key=settings.OPENAI_API_KEY))
+# Initialize async OpenAI client with instructor
+client = instructor.from_openai(AsyncOpenAI(api_key=settings.OPENAI_API_KEY))
 
+# OCR system prompt; bump the version whenever the prompt or ExamModel changes
+# so cached OCR results from the old prompt are no longer used
+OCR_SYSTEM_PROMPT = """You are an Exam OCR system. You will be given an exam image and your task is to extract exam email text from the scanned student exam."""
+OCR_PROMPT_VERSION = "v1"
 
+# OCR prompt for all pages of one submission sent as a single multi-image request
+SUBMISSION_OCR_SYSTEM_PROMPT = OCR_SYSTEM_PROMPT + """ The images are the consecutive pages of one student's exam. Return the extracted text of every page separately, in page order."""
+SUBMISSION_OCR_PROMPT_VERSION = "v1"
 
-def preprocess_image(image_pil: Image.Image) -> Image.Image:
-    """
-    Preprocess Image to remove red marks, enhance text for OCR.
-    
-    Args:
-        image_pil: PIL Image to preprocess
-        
-    Returns:
-        Image.Image: Preprocessed image optimized for OCR
-    """
-    x = image_pil.copy()
-
-    # Convert the image to an RGB array for color manipulation
-    x = np.array(x)
-    
-    # Check if the image is already grayscale (2D array)
-    if len(x.shape) == 2:
-        # Image is already grayscale, just normalize it
-        mean = np.mean(x)
-        std = np.std(x)
-        if std > 0:  # Avoid division by zero
-            x = (x - mean) / std  # Standard normal distribution
-    else:
-        # Image is RGB, normalize each channel
-        for i in range(3):  # Iterate over R, G, B channels
-            channel = x[:, :, i]
-            mean = np.mean(channel)
-            std = np.std(channel)
-            if std > 0:  # Avoid division by zero
-                x[:, :, i] = (channel - mean) / std  # Standard normal distribution
-
-    # Scale normalized values back to 0-255 range
-    x = np.clip((x - x.min()) / (x.max() - x.min()) * 255, 0, 255).astype(np.uint8)
-
-    # Convert back to PIL image
-    # Ensure the data type is uint8 before converting back to PIL Image
-    x = x.astype(np.uint8)
-    x = Image.fromarray(x)
-
-    # Convert to grayscale to reduce complexity and enhance text contrast
-    x = x.convert("L")
-
-    # Apply binary thresholding to make text stand out (binarization)
-    x = x.point(lambda x: 0 if x < 128 else 255, '1')
-
-    # Invert colors (flip black and white)
-    x = x.point(lambda val: 255 - val)
-
-    # Apply noise reduction filter
-    x = x.filter(ImageFilter.MedianFilter(size=3))
-
-    return x
+# Bump whenever the layout of the scoring prompt changes
+EVALUATION_PROMPT_VERSION = "v3"
 
 
 def PIL_to_base64(image: Image.Image) -> str:
@@ -109,6 +66,16 @@ class ExamModel(BaseModel):
     confidence_score: float = Field(..., description="The confidence score 0-1 of the extracted text. A lower score indicates higher noise levels or poor handwriting in the exam.")
 
 
+class SubmissionModel(BaseModel):
+    """Model for structured metadata extracted from all pages of one exam."""
+    student_id: str = Field(..., description="A unique identifier for the student on the top right of the first page")
+    section: str
+    seat: str
+    room: str
+    pages: List[str] = Field(..., description="The extracted text content of each page, one entry per image, in page order.")
+    confidence_score: float = Field(..., description="The confidence score 0-1 of the extracted text. A lower score indicates higher noise levels or poor handwriting in the exam.")
+
+
 class StructuredAnalyzeResponse(BaseModel):
     scoring_justification: str 
     score_task_completion: float
@@ -119,12 +86,15 @@ class StructuredAnalyzeResponse(BaseModel):
     ai_comment: str
 
 
-def retry_inference(func: Any, *args: Any, retries: int = settings.OPENAI_MAX_RETRIES, delay: int = settings.OPENAI_RETRY_DELAY, **kwargs: Any) -> Any:
+async def retry_inference(func: Any, *args: Any, retries: int = settings.OPENAI_MAX_RETRIES, delay: int = settings.OPENAI_RETRY_DELAY, **kwargs: Any) -> Any:
     """
-    Retry mechanism for AI inference calls.
+    Retry mechanism for async AI inference calls.
+    
+    Waits between attempts with asyncio.sleep so other exams keep
+    progressing on the event loop.
     
     Args:
-        func: The function to retry
+        func: The coroutine function to retry
         *args: Positional arguments for the function
         retries: Number of retry attempts
         delay: Delay between retries in seconds
@@ -138,23 +108,114 @@ def retry_inference(func: Any, *args: Any, retries: int = settings.OPENAI_MAX_RE
     """
     for attempt in range(retries):
         try:
-            return func(*args, **kwargs)
+            return await func(*args, **kwargs)
         except Exception as e:
             if attempt < retries - 1:
                 logger.warning(f"Error in AI inference: {str(e)}. Retrying in {delay} seconds...")
-                time.sleep(delay)
+                await asyncio.sleep(delay)
             else:
                 logger.error(f"All retries failed for AI inference: {str(e)}")
                 raise
 
 
-async def extract_exam_metadata(image_data: BinaryIO, session: Any) -> ExamModel:
+async def create_structured_completion(**kwargs: Any) -> Tuple[Any, Any]:
+    """
+    Run a structured chat completion through the per-model rate limiter.
+    
+    The request's tokens are estimated and reserved before the call, and the
+    reservation is corrected with the usage reported by the response.
+    
+    Args:
+        **kwargs: Arguments for client.chat.completions.create
+        
+    Returns:
+        Tuple of the parsed response model and the raw completion
+    """
+    model = kwargs["model"]
+    estimated_tokens = estimate_chat_tokens(
+        model,
+        kwargs["messages"],
+        response_model=kwargs.get("response_model"),
+        max_tokens=kwargs.get("max_tokens"),
+    )
+    await rate_limiter.acquire(model, estimated_tokens)
+    
+    result, completion = await client.chat.completions.create_with_completion(**kwargs)
+    
+    usage = getattr(completion, "usage", None)
+    if usage is not None:
+        await rate_limiter.reconcile(model, estimated_tokens, usage.total_tokens)
+    
+    return result, completion
+
+
+def prepare_ocr_image(image_data: BinaryIO) -> str:
+    """
+    Decode, preprocess and base64-encode an exam image for the OCR model.
+    
+    Stored pages that are already binarized only get the inversion and
+    despeckling of ocr_polarity. This is CPU bound and is meant to be run
+    off the event loop.
+    
+    Args:
+        image_data: The exam image file
+        
+    Returns:
+        str: Base64 encoded PNG of the preprocessed image
+    """
+    image_pil = Image.open(image_data)
+    processed_image = ocr_polarity(image_pil) if image_pil.mode == "1" else preprocess_image(image_pil)
+    return PIL_to_base64(processed_image)
+
+
+def build_ocr_messages(base64_image: str) -> List[Dict[str, Any]]:
+    """
+    Build the chat messages for an OCR request.
+    
+    Args:
+        base64_image: Base64 encoded PNG of the preprocessed exam image
+        
+    Returns:
+        List of chat messages
+    """
+    return [
+        {"role": "system", "content": OCR_SYSTEM_PROMPT},
+        {"role": "user", "content": [
+            {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{base64_image}"}},
+        ]},
+    ]
+
+
+def build_submission_ocr_messages(base64_images: List[str]) -> List[Dict[str, Any]]:
+    """
+    Build the chat messages for one OCR request covering every page of a submission.
+    
+    Args:
+        base64_images: Base64 encoded PNGs of the preprocessed pages, in page order
+        
+    Returns:
+        List of chat messages
+    """
+    return [
+        {"role": "system", "content": SUBMISSION_OCR_SYSTEM_PROMPT},
+        {"role": "user", "content": [
+            {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{base64_image}"}}
+            for base64_image in base64_images
+        ]},
+    ]
+
+
+async def extract_exam_metadata(image_data: BinaryIO, session: Any, force_refresh: bool = False) -> ExamModel:
     """
     Extract structured metadata from exam image using OCR.
     
+    Results are cached by the preprocessed image, OCR model and prompt
+    version, so the same page is only sent to the vision model once.
+    
     Args:
         image_data: The exam image file
         session: Database session
+        force_refresh: Skip the OCR cache and call the model again
         
     Returns:
         ExamMetadata: Structured exam metadata
@@ -163,31 +224,26 @@ async def extract_exam_metadata(image_data: BinaryIO, session: Any) -> ExamModel
         HTTPException: If OCR extraction fails
     """
     try:
-        # Convert image to PIL Image
-        image_pil = Image.open(image_data)
-        
-        # Preprocess image for better OCR
-        processed_image = preprocess_image(image_pil)
-        
-        # Convert to base64
-        base64_image = PIL_to_base64(processed_image)
+        # Preprocess image for better OCR without blocking the event loop
+        base64_image = await asyncio.to_thread(prepare_ocr_image, image_data)
         
-        # OCR system prompt
-        system_prompt = """You are an Exam OCR system. You will be given an exam image and your task is to extract exam email text from the scanned student exam."""
+        cache_key = inference_cache.ocr_cache_key(base64_image, settings.OCR_MODEL_NAME, OCR_PROMPT_VERSION)
+        if not force_refresh:
+            cached_metadata = inference_cache.get_cached_ocr(session, cache_key, ExamModel)
+            if cached_metadata is not None:
+                logger.info("OCR cache hit")
+                return cached_metadata
         
         # Extract structured data
-        exam_metadata = retry_inference(
-            client.chat.completions.create,
+        exam_metadata, _ = await retry_inference(
+            create_structured_completion,
             model=settings.OCR_MODEL_NAME,
             response_model=ExamModel,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": [
-                    {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{base64_image}"}},
-                ]},
-            ],
+            messages=build_ocr_messages(base64_image),
         )
         
+        inference_cache.store_ocr(session, cache_key, exam_metadata, settings.OCR_MODEL_NAME, OCR_PROMPT_VERSION)
+        
         return exam_metadata
         
     except Exception as e:
@@ -198,6 +254,62 @@ async def extract_exam_metadata(image_data: BinaryIO, session: Any) -> ExamModel
         )
 
 
+async def extract_submission_metadata(
+    images: List[BinaryIO],
+    session: Any,
+    force_refresh: bool = False
+) -> SubmissionModel:
+    """
+    Extract structured metadata and per-page text from all pages of one exam in a single OCR request.
+    
+    Args:
+        images: The page images, in page order
+        session: Database session
+        force_refresh: Skip the OCR cache and call the model again
+        
+    Returns:
+        SubmissionModel: Student metadata and the text of each page
+        
+    Raises:
+        HTTPException: If OCR extraction fails
+    """
+    try:
+        base64_images = await asyncio.gather(*(
+            asyncio.to_thread(prepare_ocr_image, image_data) for image_data in images
+        ))
+        
+        cache_key = inference_cache.ocr_cache_key(
+            inference_cache.hash_parts(*base64_images), settings.OCR_MODEL_NAME, SUBMISSION_OCR_PROMPT_VERSION
+        )
+        if not force_refresh:
+            cached_metadata = inference_cache.get_cached_ocr(session, cache_key, SubmissionModel)
+            if cached_metadata is not None:
+                logger.info("OCR cache hit for submission")
+                return cached_metadata
+        
+        submission_metadata, _ = await retry_inference(
+            create_structured_completion,
+            model=settings.OCR_MODEL_NAME,
+            response_model=SubmissionModel,
+            messages=build_submission_ocr_messages(base64_images),
+        )
+        if len(submission_metadata.pages) != len(images):
+            raise ValueError(f"Expected text for {len(images)} pages, got {len(submission_metadata.pages)}")
+        
+        inference_cache.store_ocr(
+            session, cache_key, submission_metadata, settings.OCR_MODEL_NAME, SUBMISSION_OCR_PROMPT_VERSION
+        )
+        
+        return submission_metadata
+        
+    except Exception as e:
+        logger.error(f"Failed to extract submission metadata: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to extract exam metadata from images"
+        )
+
+
 async def evaluate_exam(
     retrieved_exam: str,
     exam_text: str,
@@ -207,7 +319,12 @@ async def evaluate_exam(
     """
     Evaluate exam text using AI based on task rubrics.
     
+    Results are cached by the task's rubric, instruction and example
+    evaluation, the exam text, the few-shot examples and the model, so
+    unchanged inputs are not scored twice.
+    
     Args:
+        retrieved_exam: Few-shot examples block
         exam_text: The extracted exam text
         task_id: ID of the task containing rubrics
         session: Database session
@@ -219,31 +336,31 @@ async def evaluate_exam(
         HTTPException: If evaluation fails
     """
     try:
-        # Get task details from database
-        task = session.exec(select(task_model.Task).where(task_model.Task.id == task_id)).first()
-        if not task:
+        # Compiled once per task; the rubric prefix is identical for every exam
+        prompt = prompt_cache.get_compiled_prompt(session, task_id)
+        if not prompt:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Task not found"
             )
         
-        # Construct evaluation prompt
-        system_prompt = dedent(f"""
-            {task.rubrics}
-            {task.student_instruction}
-            {task.example_evaluation}
-            {retrieved_exam}
-        """)
-
-        evaluation = retry_inference(
-            client.chat.completions.create,
+        cache_key = inference_cache.evaluation_cache_key(
+            prompt.system_prompt, exam_text, retrieved_exam, settings.AI_MODEL_NAME, EVALUATION_PROMPT_VERSION
+        )
+        cached_evaluation = inference_cache.get_cached_evaluation(session, cache_key, StructuredAnalyzeResponse)
+        if cached_evaluation is not None:
+            logger.info(f"Evaluation cache hit for task {task_id}")
+            return cached_evaluation
+        
+        evaluation, completion = await retry_inference(
+            create_structured_completion,
             model=settings.AI_MODEL_NAME,
             response_model=StructuredAnalyzeResponse,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": exam_text},
-            ],
+            messages=prompt.build_messages(retrieved_exam, exam_text),
         )
+        prompt_cache.record_usage(getattr(completion, "usage", None))
+        
+        inference_cache.store_evaluation(session, cache_key, task_id, evaluation, settings.AI_MODEL_NAME)
         
         return evaluation
         
@@ -1,9 +1,11 @@
+import asyncio
 import logging
-from typing import BinaryIO
+from typing import BinaryIO, Iterator, List
 from urllib.parse import urljoin
-from typing import Optional
 
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
 from botocore.exceptions import ClientError
 from fastapi import HTTPException, status
 
@@ -12,12 +14,26 @@ from ..core.config import settings
 # Configure logging
 logger = logging.getLogger(__name__)
 
-# Initialize S3 client
+# Constants
+MULTIPART_THRESHOLD = 8 * 1024 * 1024  # Objects above this are uploaded in parallel parts
+DELETE_BATCH_SIZE = 1000  # Maximum keys accepted by one DeleteObjects call
+CONTENT_TYPE_EXTENSIONS = {
+    'image/jpeg': 'jpg',
+    'image/png': 'png',
+}
+
+# Initialize S3 client; the connection pool is shared by all upload threads
 s3_client = boto3.client(
     's3',
     aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
     aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-    region_name=settings.AWS_REGION
+    region_name=settings.AWS_REGION,
+    config=Config(max_pool_connections=settings.S3_MAX_POOL_CONNECTIONS)
+)
+
+transfer_config = TransferConfig(
+    multipart_threshold=MULTIPART_THRESHOLD,
+    multipart_chunksize=MULTIPART_THRESHOLD
 )
 
 async def upload_exam_image(
@@ -25,17 +41,22 @@ async def upload_exam_image(
     user_id: int,
     project_id: int,
     exam_id: int,
-    page_number: int
+    page_number: int,
+    content_type: str = 'image/jpeg'
 ) -> str:
     """
     Upload an exam image to S3.
     
+    The upload runs in a worker thread so several pages can be uploaded
+    concurrently without blocking the event loop.
+    
     Args:
         file: The file object to upload
         user_id: The ID of the user uploading the exam
         project_id: The ID of the project
         exam_id: The ID of the exam
         page_number: The page number in the exam
+        content_type: MIME type of the image, which also sets the key's extension
         
     Returns:
         str: The S3 key of the uploaded file
@@ -44,14 +65,17 @@ async def upload_exam_image(
         HTTPException: If the upload fails
     """
     try:
-        key = f"{settings.S3_EXAM_PREFIX}/user_{user_id}/project_{project_id}/exam_{exam_id}/page_{page_number}.jpg"
+        extension = CONTENT_TYPE_EXTENSIONS[content_type]
+        key = f"{settings.S3_EXAM_PREFIX}/user_{user_id}/project_{project_id}/exam_{exam_id}/page_{page_number}.{extension}"
         
         # Upload the file
-        s3_client.upload_fileobj(
+        await asyncio.to_thread(
+            s3_client.upload_fileobj,
             file,
             settings.S3_BUCKET_NAME,
             key,
-            ExtraArgs={'ContentType': 'image/jpeg'}
+            ExtraArgs={'ContentType': content_type},
+            Config=transfer_config
         )
         
         logger.info(f"Successfully uploaded exam image to S3: {key}")
@@ -108,7 +132,8 @@ async def delete_exam_image(key: str) -> None:
         HTTPException: If deletion fails
     """
     try:
-        s3_client.delete_object(
+        await asyncio.to_thread(
+            s3_client.delete_object,
             Bucket=settings.S3_BUCKET_NAME,
             Key=key
         )
@@ -122,57 +147,106 @@ async def delete_exam_image(key: str) -> None:
         )
 
 
-async def delete_project_exams(user_id: int, project_id: int) -> None:
+def project_prefix(user_id: int, project_id: int) -> str:
+    """S3 prefix holding every exam image of a project."""
+    return f"{settings.S3_EXAM_PREFIX}/user_{user_id}/project_{project_id}/"
+
+
+def _delete_keys(keys: List[str]) -> List[str]:
+    """Delete up to 1000 keys in one DeleteObjects call and return the keys S3 failed to delete."""
+    response = s3_client.delete_objects(
+        Bucket=settings.S3_BUCKET_NAME,
+        Delete={'Objects': [{'Key': key} for key in keys], 'Quiet': True}
+    )
+    errors = response.get('Errors', [])
+    for error in errors[:5]:
+        logger.warning(f"Failed to delete {error.get('Key')}: {error.get('Code')} {error.get('Message')}")
+    return [error['Key'] for error in errors]
+
+
+def _list_keys(prefix: str) -> Iterator[List[str]]:
+    """List the keys under a prefix, one page of at most 1000 keys at a time."""
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(
+        Bucket=settings.S3_BUCKET_NAME,
+        Prefix=prefix,
+        PaginationConfig={'PageSize': DELETE_BATCH_SIZE}
+    ):
+        keys = [obj['Key'] for obj in page.get('Contents', [])]
+        if keys:
+            yield keys
+
+
+async def delete_prefix(prefix: str) -> int:
     """
-    Delete all exam images for a project.
+    Delete every object under a prefix.
+    
+    Keys are listed a page at a time and each page is removed with one
+    DeleteObjects call. Up to S3_DELETE_CONCURRENCY calls run at once while
+    the listing continues.
     
     Args:
-        user_id: The ID of the user who owns the project
-        project_id: The ID of the project
+        prefix: The S3 prefix to empty
+        
+    Returns:
+        int: Number of objects deleted
         
     Raises:
-        HTTPException: If deletion fails
+        ClientError: If listing fails or S3 rejects a delete call
+        RuntimeError: If some objects could not be deleted
     """
+    semaphore = asyncio.Semaphore(settings.S3_DELETE_CONCURRENCY)
+    deletes: List[asyncio.Task] = []
+    
+    async def delete_page(keys: List[str]) -> List[str]:
+        try:
+            return await asyncio.to_thread(_delete_keys, keys)
+        finally:
+            semaphore.release()
+    
+    pages = _list_keys(prefix)
+    deleted = 0
     try:
-        # List all objects with the project prefix
-        prefix = f"{settings.S3_EXAM_PREFIX}/user_{user_id}/project_{project_id}/"
-        
-        paginator = s3_client.get_paginator('list_objects_v2')
-        pages = paginator.paginate(
-            Bucket=settings.S3_BUCKET_NAME,
-            Prefix=prefix
-        )
-        
-        # Delete all objects
-        for page in pages:
-            if 'Contents' in page:
-                for obj in page['Contents']:
-                    s3_client.delete_object(
-                        Bucket=settings.S3_BUCKET_NAME,
-                        Key=obj['Key']
-                    )
-        
-        logger.info(f"Successfully deleted all exam images for project {project_id}")
-        
-    except ClientError as e:
-        logger.error(f"Failed to delete project exam images: {str(e)}")
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Failed to delete project exam images"
-        )
+        while True:
+            # Wait for a free slot before listing the next page
+            await semaphore.acquire()
+            keys = await asyncio.to_thread(next, pages, None)
+            if keys is None:
+                semaphore.release()
+                break
+            deleted += len(keys)
+            deletes.append(asyncio.create_task(delete_page(keys)))
+    finally:
+        results = await asyncio.gather(*deletes, return_exceptions=True)
+    
+    failed_keys = []
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+        failed_keys.extend(result)
+    
+    if failed_keys:
+        raise RuntimeError(f"Failed to delete {len(failed_keys)} objects under {prefix}")
+    
+    logger.info(f"Deleted {deleted} objects under {prefix}")
+    return deleted
 
 
-async def download_image( key: str) -> Optional[bytes]:
-    """
-    Download an image from the S3 bucket.
+async def prefix_is_empty(prefix: str) -> bool:
     """
-    try:
-        response = s3_client.get_object(Bucket=settings.S3_BUCKET_NAME, Key=key)
-        body = response['Body'].read()
-        logger.info(
-            f"Downloaded image '{key}' from bucket '{settings.S3_BUCKET_NAME}'.")
-        return body
+    Check that no object remains under a prefix.
     
-    except ClientError as e:
-        logger.error(f"Error downloading image '{key}': {e}")
-        return None
+    Args:
+        prefix: The S3 prefix to check
+        
+    Returns:
+        bool: True if the prefix holds no objects
+    """
+    response = await asyncio.to_thread(
+        s3_client.list_objects_v2,
+        Bucket=settings.S3_BUCKET_NAME,
+        Prefix=prefix,
+        MaxKeys=1
+    )
+    return response.get('KeyCount', 0) == 0
+
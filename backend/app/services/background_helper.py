@@ -1,28 +1,25 @@
+import asyncio
 import logging
-import time
-from typing import Any, List
+from typing import Any, List, Optional, Set, Tuple
 from io import BytesIO
 from contextlib import contextmanager
 
-from fastapi import HTTPException, status
-from sqlmodel import select
-import requests
+from sqlmodel import Session, select
 
-from ..core import security
-from ..models import exam_model, project_model, user_model
+from ..core import database
+from ..core.config import settings
+from ..models import exam_model, project_model
 from ..schemas import exam_schema
-from .ai_evaluation import evaluate_exam, extract_exam_metadata
-from .aws_s3 import generate_presigned_url
+from .ai_evaluation import evaluate_exam, extract_exam_metadata, extract_submission_metadata
+from . import embedding_store, fewshot_selector, image_store
 from ..utils.email_util import send_email_notification
-from ..core.vectordb import get_similar_exams
+from ..core.vectordb import get_similar_exams_batch
 
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
 # Constants
-BATCH_SIZE = 5  # Number of exams to process in parallel
-RATE_LIMIT_DELAY = 3  # Seconds to wait between API calls
 MAX_RETRIES = 3  # Maximum number of retries for failed evaluations
 RETRY_DELAY = 5  # Base delay for retries in seconds
 MAX_RETRY_DELAY = 60  # Maximum delay between retries in seconds
@@ -37,261 +34,356 @@ def managed_bytesio():
     finally:
         bio.close()
 
-async def generate_fewshot_prompt(exam_text: str, top_k: int = 5) -> str:
-    results = get_similar_exams(query_text=exam_text, n_results=top_k)
+def retrieve_similar_exams(
+    exam_texts: List[str],
+    n_results: int,
+    task_ids: Optional[List[Optional[int]]] = None
+) -> Tuple[Any, List[List[float]]]:
+    """Look up the nearest collection documents of many texts, reusing their stored embeddings."""
+    with Session(database.engine) as session:
+        query_embeddings = embedding_store.get_embeddings(session, exam_texts)
+    if settings.FEWSHOT_SCOPE == 'global':
+        task_ids = None
+    results = get_similar_exams_batch(
+        query_texts=exam_texts,
+        n_results=n_results,
+        query_embeddings=query_embeddings,
+        task_ids=task_ids,
+        include_embeddings=True
+    )
+    return results, query_embeddings
 
-    prompt = ''
-    for i in range(len(results['documents'][0])):
-        doc = results['documents'][0][i]
-        metadata = results['metadatas'][0][i]
-        similarity = results['distances'][0][i]
-
-        prompt += (
-            f"Similar Example {i + 1} with Your Past Evaluation:\n"
-            f"{doc}\n"
-            f"{metadata}\n"
-            f"-------------------------------------------\n"
+def select_fewshot_examples(
+    exam_texts: List[str],
+    top_k: int,
+    task_ids: Optional[List[Optional[int]]] = None
+) -> List[List[str]]:
+    """
+    Pick the few-shot examples of many exams with one retrieval call.
+    
+    FEWSHOT_CANDIDATES neighbours are fetched per exam, and up to top_k of
+    them are picked for diversity and packed into FEWSHOT_TOKEN_BUDGET.
+    This is blocking and is meant to be run off the event loop.
+    
+    Args:
+        exam_texts: Texts of the exams to grade
+        top_k: Maximum number of examples per text
+        task_ids: Task of each exam, to draw examples graded against the same rubric
+        
+    Returns:
+        List[List[str]]: Formatted example blocks per text, in the same order
+    """
+    if not exam_texts:
+        return []
+    
+    results, query_embeddings = retrieve_similar_exams(
+        exam_texts, max(top_k, settings.FEWSHOT_CANDIDATES), task_ids
+    )
+    return [
+        fewshot_selector.select_examples(query_embedding, documents, metadatas, embeddings, top_k)
+        for query_embedding, documents, metadatas, embeddings in zip(
+            query_embeddings, results['documents'], results['metadatas'], results['embeddings']
         )
+    ]
+
+def build_fewshot_prompts(exam_texts: List[str], top_k: int = 5, task_ids: Optional[List[Optional[int]]] = None) -> List[str]:
+    """
+    Build the few-shot block of many exams with one retrieval call.
+    
+    Args:
+        exam_texts: Texts of the exams to grade
+        top_k: Maximum number of examples per text
+        task_ids: Task of each exam, to draw examples graded against the same rubric
+        
+    Returns:
+        List[str]: One few-shot block per text, in the same order
+    """
+    return ["".join(examples) for examples in select_fewshot_examples(exam_texts, top_k, task_ids)]
+
+class FewShotBatcher:
+    """
+    Collects few-shot lookups from exams graded concurrently and answers
+    them with one batched retrieval call.
+    
+    A batch is sent once FEWSHOT_BATCH_SIZE lookups are waiting or
+    FEWSHOT_BATCH_WINDOW seconds after the first one arrived.
+    """
+    
+    def __init__(self, max_batch: int, window: float):
+        self.max_batch = max_batch
+        self.window = window
+        self._pending: List[Tuple[str, int, Optional[int], asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        # The event loop only keeps weak references to tasks
+        self._tasks: Set[asyncio.Task] = set()
+    
+    async def get(self, exam_text: str, top_k: int, task_id: Optional[int] = None) -> str:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((exam_text, top_k, task_id, future))
+        
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+    
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+    
+    async def _run(self, batch: List[Tuple[str, int, Optional[int], asyncio.Future]]) -> None:
+        # Select for the largest top_k; a smaller top_k gets a prefix of the same examples
+        top_k = max(k for _, k, _, _ in batch)
+        try:
+            selected = await asyncio.to_thread(
+                select_fewshot_examples,
+                [text for text, _, _, _ in batch],
+                top_k,
+                [task_id for _, _, task_id, _ in batch]
+            )
+        except Exception as e:
+            for _, _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        
+        for i, (_, k, _, future) in enumerate(batch):
+            if not future.done():
+                future.set_result("".join(selected[i][:k]))
+
+fewshot_batcher = FewShotBatcher(settings.FEWSHOT_BATCH_SIZE, settings.FEWSHOT_BATCH_WINDOW)
+
+async def generate_fewshot_prompt(exam_text: str, top_k: int = 5, task_id: Optional[int] = None) -> str:
+    return await fewshot_batcher.get(exam_text, top_k, task_id)
+
+def get_submission_pages(session: Any, exam: exam_model.Exam) -> List[exam_model.Exam]:
+    """
+    Get every page graded together with an exam, in page order.
+    
+    Args:
+        session: Database session
+        exam: The lead page of a grouped submission, or a standalone exam
+        
+    Returns:
+        List[Exam]: The submission's pages, or just the exam if it is not grouped
+    """
+    if exam.lead_exam_id is None:
+        return [exam]
+    
+    return list(session.exec(
+        select(exam_model.Exam)
+        .where(exam_model.Exam.lead_exam_id == exam.lead_exam_id)
+        .order_by(exam_model.Exam.page)
+    ).all())
 
-    return prompt
 
 async def process_exam_with_retry(
     session: Any,
     exam: exam_model.Exam,
     project: project_model.Project,
     evaluation_type: exam_schema.EvaluationTypeEnum = exam_schema.EvaluationTypeEnum.full,
-    retry_count: int = 0
+    retry_count: int = 0,
+    force_refresh: bool = False
 ) -> bool:
     """
     Process a single exam with retry logic.
     
+    For the lead page of a grouped submission, all pages are read in one OCR
+    request and their combined text is scored once; the scores are stored on
+    the lead page and every page keeps its own text.
+    
     Args:
         session: Database session
         exam: Exam to process
         project: Project containing the exam
         evaluation_type: Type of evaluation to perform (full or ai_only)
         retry_count: Current retry attempt number
+        force_refresh: Bypass cached OCR results
         
     Returns:
         bool: True if processing succeeded, False otherwise
     """
+    pages = get_submission_pages(session, exam)
     try:
-        # Get image from S3
-        image_url = generate_presigned_url(exam.exam_image_url)
-        
-        # Download image data with proper resource management
-        with managed_bytesio() as image_data:
-            response = requests.get(image_url)
-            if response.status_code != 200:
-                raise HTTPException(
-                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                    detail="Failed to download image from S3"
+        # Extract metadata and text only if doing full evaluation
+        if evaluation_type == exam_schema.EvaluationTypeEnum.full:
+            images = await asyncio.gather(*(image_store.get_image(page.exam_image_url) for page in pages))
+            
+            if len(pages) == 1:
+                with managed_bytesio() as image_data:
+                    image_data.write(images[0])
+                    image_data.seek(0)
+                    metadata = await extract_exam_metadata(image_data, session, force_refresh=force_refresh)
+                page_texts = [metadata.extracted_exam_text]
+            else:
+                metadata = await extract_submission_metadata(
+                    [BytesIO(image) for image in images], session, force_refresh=force_refresh
                 )
-            image_data.write(response.content)
-            image_data.seek(0)
+                page_texts = metadata.pages
             
-            # Extract metadata and text only if doing full evaluation
-            if evaluation_type == exam_schema.EvaluationTypeEnum.full:
-                metadata = await extract_exam_metadata(image_data, session)
-                
-                # Update exam with metadata
-                exam.student_id = metadata.student_id
-                exam.student_section = metadata.section
-                exam.student_seat = metadata.seat
-                exam.student_room = metadata.room
-                exam.exam_extracted_text = metadata.extracted_exam_text
+            # Update every page with the student's metadata and its own text
+            for page, page_text in zip(pages, page_texts):
+                page.student_id = metadata.student_id
+                page.student_section = metadata.section
+                page.student_seat = metadata.seat
+                page.student_room = metadata.room
+                page.exam_extracted_text = page_text
 
-            # Evaluate exam using existing text or newly extracted text
-            evaluation = await evaluate_exam(
-                retrieved_exam=await generate_fewshot_prompt(exam.exam_extracted_text,top_k=TOP_K),
-                exam_text=exam.exam_extracted_text,
-                task_id=project.task_id,
-                session=session
-            )
-            
-            # Update exam with evaluation results
-            exam.exam_improved_text = evaluation.improved_text
-            exam.scoring_justification = evaluation.scoring_justification
-            exam.score_task_completion = evaluation.score_task_completion
-            exam.score_organization = evaluation.score_organization
-            exam.score_style_language_expression = evaluation.score_style_language_expression
-            exam.score_structural_variety_accuracy = evaluation.score_structural_variety_accuracy
-            exam.ai_comment = evaluation.ai_comment
+        # Evaluate the submission using existing text or newly extracted text
+        exam_text = "\n\n".join(page.exam_extracted_text or "" for page in pages)
+        evaluation = await evaluate_exam(
+            retrieved_exam=await generate_fewshot_prompt(exam_text, top_k=TOP_K, task_id=project.task_id),
+            exam_text=exam_text,
+            task_id=project.task_id,
+            session=session
+        )
+        
+        # Update exam with evaluation results
+        exam.exam_improved_text = evaluation.improved_text
+        exam.scoring_justification = evaluation.scoring_justification
+        exam.score_task_completion = evaluation.score_task_completion
+        exam.score_organization = evaluation.score_organization
+        exam.score_style_language_expression = evaluation.score_style_language_expression
+        exam.score_structural_variety_accuracy = evaluation.score_structural_variety_accuracy
+        exam.ai_comment = evaluation.ai_comment
 
 
-            # Automatically adds embedding into ChromaDB
-            # try:
-            #     add_exam_to_chroma(
-            #         exam_id=exam.id,
-            #         text=exam.exam_extracted_text,
-            #     )
-            #     exam.is_embedded = True
-            # except Exception as vector_error:
-            #     logger.warning(f"ChromaDB insert failed for exam {exam.id}: {vector_error}")
+        # Automatically adds embedding into ChromaDB
+        # try:
+        #     add_exam_to_chroma(
+        #         exam_id=exam.id,
+        #         text=exam.exam_extracted_text,
+        #     )
+        #     exam.is_embedded = True
+        # except Exception as vector_error:
+        #     logger.warning(f"ChromaDB insert failed for exam {exam.id}: {vector_error}")
 
-            
-            # Mark as processed
-            exam.status = exam_schema.StatusEnum.processed
-            session.add(exam)
-            session.commit()
+        
+        # Mark as processed
+        for page in pages:
+            page.status = exam_schema.StatusEnum.processed
+            session.add(page)
+        session.commit()
 
 
-            
-            return True
+        
+        return True
             
     except Exception as e:
         logger.error(f"Failed to process exam {exam.id} (attempt {retry_count + 1}/{MAX_RETRIES}): {str(e)}")
         
+        # Discard any half-applied changes before retrying or marking as failed
+        session.rollback()
+        
         if retry_count < MAX_RETRIES - 1:
             # Calculate exponential backoff delay
             delay = min(RETRY_DELAY * (2 ** retry_count), MAX_RETRY_DELAY)
             logger.info(f"Retrying exam {exam.id} in {delay} seconds...")
-            time.sleep(delay)
-            return await process_exam_with_retry(session, exam, project, evaluation_type, retry_count + 1)
+            await asyncio.sleep(delay)
+            return await process_exam_with_retry(session, exam, project, evaluation_type, retry_count + 1, force_refresh)
         else:
-            exam.status = exam_schema.StatusEnum.failed
-            session.add(exam)
+            for page in pages:
+                page.status = exam_schema.StatusEnum.failed
+                session.add(page)
             session.commit()
             return False
 
-async def process_exam_batch(
-    session: Any,
+async def process_exam_in_own_session(
+    exam_id: int,
     project_id: int,
-    exam_ids: List[int],
-    evaluation_type: exam_schema.EvaluationTypeEnum = exam_schema.EvaluationTypeEnum.full
-) -> None:
+    evaluation_type: exam_schema.EvaluationTypeEnum,
+    semaphore: asyncio.Semaphore,
+    force_refresh: bool = False
+) -> bool:
     """
-    Process a batch of exams in parallel.
+    Grade a single exam under the shared concurrency limit.
+    
+    Each exam gets its own database session so that concurrent exams never
+    flush each other's half-finished updates.
     
     Args:
-        session: Database session
-        project_id: ID of the project
-        exam_ids: List of exam IDs to process
+        exam_id: ID of the exam to process
+        project_id: ID of the project containing the exam
         evaluation_type: Type of evaluation to perform (full or ai_only)
+        semaphore: Semaphore bounding how many exams are graded at once
+        force_refresh: Bypass cached OCR results
         
-    Raises:
-        HTTPException: If processing fails
+    Returns:
+        bool: True if processing succeeded, False otherwise
     """
-    try:
-        # Get all exams in the batch
-        exams = session.exec(
-            select(exam_model.Exam)
-            .where(exam_model.Exam.id.in_(exam_ids))
-            .where(exam_model.Exam.status == exam_schema.StatusEnum.pending)
-        ).all()
-        
-        # Get project for task_id
-        project = session.exec(
-            select(project_model.Project)
-            .where(project_model.Project.id == project_id)
-        ).first()
-        
-        if not project:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Project not found"
-            )
-        
-        for exam in exams:
+    async with semaphore:
+        with Session(database.engine) as session:
+            exam = session.get(exam_model.Exam, exam_id)
+            project = session.get(project_model.Project, project_id)
+            if not exam or not project:
+                logger.warning(f"Skipping exam {exam_id}: exam or project {project_id} no longer exists")
+                return False
+            
             try:
-                # Update status to processing
-                exam.status = exam_schema.StatusEnum.processing
-                session.add(exam)
+                # Update status to processing, together with the other pages of a grouped submission
+                for page in get_submission_pages(session, exam):
+                    page.status = exam_schema.StatusEnum.processing
+                    session.add(page)
                 session.commit()
                 
-                # Process exam with retry logic
-                success = await process_exam_with_retry(session, exam, project, evaluation_type)
-                
-                if success:
-                    # Respect rate limits only on successful processing
-                    time.sleep(RATE_LIMIT_DELAY)
+                # Process exam with retry logic; API calls are throttled by the rate limiter
+                return await process_exam_with_retry(
+                    session, exam, project, evaluation_type, force_refresh=force_refresh
+                )
                 
             except Exception as e:
-                logger.error(f"Failed to process exam {exam.id}: {str(e)}")
-                exam.status = exam_schema.StatusEnum.failed
-                session.add(exam)
+                logger.error(f"Failed to process exam {exam_id}: {str(e)}")
+                session.rollback()
+                for page in get_submission_pages(session, exam):
+                    page.status = exam_schema.StatusEnum.failed
+                    session.add(page)
                 session.commit()
-                
-    except Exception as e:
-        logger.error(f"Failed to process exam batch: {str(e)}")
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Failed to process exam batch"
-        )
+                return False
 
 
-async def evaluate_project_exams(
-    session: Any,
-    project_id: int,
-    current_user: security.UserDep = security.UserDep
-) -> None:
+def notify_if_project_evaluated(session: Any, project_id: int, user: Any) -> bool:
     """
-    Queue background tasks to evaluate all pending exams in a project.
+    Email the project owner once every exam in the project is processed.
     
     Args:
         session: Database session
         project_id: ID of the project
+        user: User to notify
         
-    Raises:
-        HTTPException: If task queuing fails
+    Returns:
+        bool: True if all exams are processed
     """
-    try:
-        # Get all pending exams for the project
-        pending_exams = session.exec(
-            select(exam_model.Exam)
-            .where(exam_model.Exam.project_id == project_id)
-            .where(exam_model.Exam.status == exam_schema.StatusEnum.pending)
-        ).all()
-        
-        if not pending_exams:
-            return
-        
-        # Split exams into batches
-        exam_ids = [exam.id for exam in pending_exams]
-        batches = [
-            exam_ids[i:i + BATCH_SIZE]
-            for i in range(0, len(exam_ids), BATCH_SIZE)
-        ]
-        
-        # Process each batch directly instead of queuing as background tasks
-        for batch in batches:
-            # We'll process this batch directly
-            await process_exam_batch(
-                session,
-                project_id,
-                batch
-            )
-            
-        logger.info(f"Processed {len(batches)} batches for project {project_id}")
+    statement = select(exam_model.Exam).where(
+        exam_model.Exam.project_id == project_id
+    )
+    all_exams = session.exec(statement).all()
 
-        # After batch processing, check if all exams are now processed
-        statement = select(exam_model.Exam).where(
-            exam_model.Exam.project_id == project_id
-        )
-        all_exams = session.exec(statement).all()
+    if not all(exam.status == exam_schema.StatusEnum.processed for exam in all_exams):
+        return False
+
+    statement = select(project_model.Project).where(
+        project_model.Project.id == project_id
+    )
+    project = session.exec(statement).first()
 
-        if all(exam.status == exam_schema.StatusEnum.processed for exam in all_exams):
-            statement = select(project_model.Project).where(
-                project_model.Project.id == project_id
+    if project and user and user.email:
+        send_email_notification(
+            to_email=user.email,
+            subject=f"All Exams Evaluated for Project: {project.project_name}",
+            body=(
+                f"Dear {user.username},\n\n"
+                f"We’re pleased to inform you that all {len(all_exams)} exams in your project \"{project.project_name}\" "
+                f"have been successfully evaluated.\n\n"
+                f"You can now review the results in your dashboard.\n\n"
+                f"Thank you for using our platform.\n\n"
             )
-            project = session.exec(statement).first()
+        )
 
-            if project:
-                user = current_user
-                if user and user.email:
-                    send_email_notification(
-                        to_email=user.email,
-                        subject=f"All Exams Evaluated for Project: {project.project_name}",
-                        body=(
-                            f"Dear {user.username},\n\n"
-                            f"We’re pleased to inform you that all {len(all_exams)} exams in your project \"{project.project_name}\" "
-                            f"have been successfully evaluated.\n\n"
-                            f"You can now review the results in your dashboard.\n\n"
-                            f"Thank you for using our platform.\n\n"
-                        )
-                    )
-        
-    except Exception as e:
-        logger.error(f"Failed to process exam evaluation tasks: {str(e)}")
-        # Don't raise HTTPException here since this is a background task
-        # Just log the error and continue
\ No newline at end of file
+    return True
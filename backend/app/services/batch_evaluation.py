@@ -0,0 +1,632 @@
+import asyncio
+import json
+import logging
+import os
+import shutil
+import tempfile
+import uuid
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+from io import BytesIO
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from fastapi import HTTPException
+from openai import OpenAI
+from pydantic import BaseModel
+from sqlalchemy import or_, update
+from sqlmodel import Session, select
+
+from ..core import database
+from ..core.config import settings
+from ..models import batch_model, exam_model, project_model, user_model
+from ..schemas import batch_schema, exam_schema
+from . import image_store, inference_cache, job_queue, prompt_cache
+from .ai_evaluation import (
+    EVALUATION_PROMPT_VERSION,
+    OCR_PROMPT_VERSION,
+    ExamModel,
+    StructuredAnalyzeResponse,
+    build_ocr_messages,
+    prepare_ocr_image,
+)
+from .background_helper import TOP_K, build_fewshot_prompts, notify_if_project_evaluated
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Constants
+BATCH_ENDPOINT = "/v1/chat/completions"
+BATCH_COMPLETION_WINDOW = "24h"
+PROVIDER_COMPLETED = "completed"
+PROVIDER_FAILED = {"failed", "expired", "cancelled"}
+OCR_PREFIX = "ocr"
+SCORING_PREFIX = "score"
+
+
+class BatchBackend(ABC):
+    """Interface for a provider that runs JSONL files of chat completion requests offline."""
+
+    name = ""
+
+    @abstractmethod
+    def submit(self, input_path: str) -> str:
+        """
+        Submit a JSONL file of requests.
+
+        Args:
+            input_path: Path to the JSONL request file
+
+        Returns:
+            str: Provider batch ID
+        """
+
+    @abstractmethod
+    def poll(self, batch_id: str) -> str:
+        """
+        Get the provider status of a batch ("completed", "failed", "expired", "cancelled" or in progress).
+
+        Args:
+            batch_id: Provider batch ID
+
+        Returns:
+            str: Provider status
+        """
+
+    @abstractmethod
+    def fetch_results(self, batch_id: str) -> Iterator[Dict[str, Any]]:
+        """
+        Iterate over the result lines of a finished batch.
+
+        Args:
+            batch_id: Provider batch ID
+
+        Returns:
+            Iterator of result objects with custom_id, response and error keys
+        """
+
+
+class OpenAIBatchBackend(BatchBackend):
+    """Runs batches through the OpenAI Batch API."""
+
+    name = "openai"
+
+    def __init__(self):
+        self.client = OpenAI(api_key=settings.OPENAI_API_KEY)
+
+    def submit(self, input_path: str) -> str:
+        with open(input_path, "rb") as input_file:
+            batch_file = self.client.files.create(file=input_file, purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=batch_file.id,
+            endpoint=BATCH_ENDPOINT,
+            completion_window=BATCH_COMPLETION_WINDOW,
+        )
+        return batch.id
+
+    def poll(self, batch_id: str) -> str:
+        return self.client.batches.retrieve(batch_id).status
+
+    def fetch_results(self, batch_id: str) -> Iterator[Dict[str, Any]]:
+        batch = self.client.batches.retrieve(batch_id)
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if not file_id:
+                continue
+            for line in self.client.files.content(file_id).text.splitlines():
+                if line.strip():
+                    yield json.loads(line)
+
+
+class LocalBatchBackend(BatchBackend):
+    """
+    File-based stand-in for a batch provider.
+
+    Submitted files are copied into a directory; a batch is completed once
+    its output file exists, which `complete` can write from any responder
+    (see app.complete_local_batch).
+    """
+
+    name = "local"
+
+    def __init__(self, directory: str = settings.BATCH_LOCAL_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, batch_id: str, kind: str) -> str:
+        return os.path.join(self.directory, f"{batch_id}.{kind}.jsonl")
+
+    def submit(self, input_path: str) -> str:
+        batch_id = f"local_batch_{uuid.uuid4().hex}"
+        shutil.copyfile(input_path, self._path(batch_id, "input"))
+        return batch_id
+
+    def poll(self, batch_id: str) -> str:
+        return PROVIDER_COMPLETED if os.path.exists(self._path(batch_id, "output")) else "in_progress"
+
+    def fetch_results(self, batch_id: str) -> Iterator[Dict[str, Any]]:
+        with open(self._path(batch_id, "output"), encoding="utf-8") as output_file:
+            for line in output_file:
+                if line.strip():
+                    yield json.loads(line)
+
+    def pending_batches(self) -> List[str]:
+        """
+        List submitted batches that have no output yet, oldest first.
+
+        Returns:
+            List[str]: Local batch IDs
+        """
+        suffix = ".input.jsonl"
+        paths = [
+            os.path.join(self.directory, file_name)
+            for file_name in os.listdir(self.directory)
+            if file_name.endswith(suffix)
+        ]
+        batch_ids = [os.path.basename(path)[:-len(suffix)] for path in sorted(paths, key=os.path.getmtime)]
+        return [batch_id for batch_id in batch_ids if not os.path.exists(self._path(batch_id, "output"))]
+
+    def complete(self, batch_id: str, responder: Callable[[Dict[str, Any]], Dict[str, Any]]) -> int:
+        """
+        Answer every request of a submitted batch and mark it completed.
+
+        Args:
+            batch_id: Local batch ID
+            responder: Maps a request body to a chat completion response body
+
+        Returns:
+            int: Number of requests the responder failed on
+        """
+        errors = 0
+        temp_path = self._path(batch_id, "output.tmp")
+        with open(self._path(batch_id, "input"), encoding="utf-8") as input_file, \
+                open(temp_path, "w", encoding="utf-8") as output_file:
+            for line in input_file:
+                if not line.strip():
+                    continue
+                request = json.loads(line)
+                result = {"custom_id": request["custom_id"], "error": None}
+                try:
+                    result["response"] = {"status_code": 200, "body": responder(request["body"])}
+                except Exception as e:
+                    result["response"] = None
+                    result["error"] = {"message": str(e)}
+                    errors += 1
+                output_file.write(json.dumps(result) + "\n")
+        os.replace(temp_path, self._path(batch_id, "output"))
+        return errors
+
+
+def get_batch_backend(name: str = settings.BATCH_BACKEND) -> BatchBackend:
+    """
+    Create the batch backend registered under `name`.
+
+    Args:
+        name: Backend name ("openai" or "local")
+
+    Returns:
+        BatchBackend: The backend instance
+    """
+    backends = {
+        OpenAIBatchBackend.name: OpenAIBatchBackend,
+        LocalBatchBackend.name: LocalBatchBackend,
+    }
+    if name not in backends:
+        raise ValueError(f"Invalid batch backend: {name}")
+    return backends[name]()
+
+
+class _BatchFileWriter:
+    """Writes request lines into as many JSONL files as the provider's size limits require."""
+
+    def __init__(self, run_id: int, phase: str):
+        self.prefix = f"batch_run_{run_id}_{phase}_"
+        self.paths: List[str] = []
+        self.custom_ids: List[List[str]] = []  # Custom IDs written to each file
+        self.count = 0
+        self._file = None
+        self._lines = 0
+        self._bytes = 0
+
+    def write(self, custom_id: str, model: str, response_model: type[BaseModel], messages: List[Dict[str, Any]]) -> None:
+        line = json.dumps({
+            "custom_id": custom_id,
+            "method": "POST",
+            "url": BATCH_ENDPOINT,
+            "body": {
+                "model": model,
+                "messages": messages,
+                "response_format": {
+                    "type": "json_schema",
+                    "json_schema": {
+                        "name": response_model.__name__,
+                        "schema": response_model.model_json_schema(),
+                    },
+                },
+            },
+        }).encode("utf-8") + b"\n"
+
+        if (
+            self._file is None
+            or self._lines >= settings.BATCH_MAX_REQUESTS_PER_FILE
+            or self._bytes + len(line) > settings.BATCH_MAX_FILE_BYTES
+        ):
+            self._rotate()
+
+        self._file.write(line)
+        self.custom_ids[-1].append(custom_id)
+        self._lines += 1
+        self._bytes += len(line)
+        self.count += 1
+
+    def _rotate(self) -> None:
+        if self._file:
+            self._file.close()
+        handle, path = tempfile.mkstemp(prefix=self.prefix, suffix=".jsonl")
+        self._file = os.fdopen(handle, "wb")
+        self.paths.append(path)
+        self.custom_ids.append([])
+        self._lines = 0
+        self._bytes = 0
+
+    def close(self) -> List[str]:
+        if self._file:
+            self._file.close()
+            self._file = None
+        return self.paths
+
+
+def _exam_id(custom_id: str) -> int:
+    return int(custom_id.split("-", 1)[1])
+
+
+def _parse_result(result: Dict[str, Any], response_model: type[BaseModel]) -> Tuple[int, Optional[BaseModel], Optional[str]]:
+    """Return (exam_id, parsed response or None, error message) for one result line."""
+    exam_id = _exam_id(result["custom_id"])
+    response = result.get("response") or {}
+    if result.get("error") or response.get("status_code") != 200:
+        return exam_id, None, json.dumps(result.get("error") or response.get("body"))
+
+    try:
+        content = response["body"]["choices"][0]["message"]["content"]
+        return exam_id, response_model.model_validate_json(content), None
+    except Exception as e:
+        return exam_id, None, f"Unreadable batch response: {str(e)}"
+
+
+def _apply_ocr(metadata: ExamModel) -> Dict[str, Any]:
+    return {
+        "student_id": metadata.student_id,
+        "student_section": metadata.section,
+        "student_seat": metadata.seat,
+        "student_room": metadata.room,
+        "exam_extracted_text": metadata.extracted_exam_text,
+    }
+
+
+def _apply_evaluation(evaluation: StructuredAnalyzeResponse) -> Dict[str, Any]:
+    return {
+        "exam_improved_text": evaluation.improved_text,
+        "scoring_justification": evaluation.scoring_justification,
+        "score_task_completion": evaluation.score_task_completion,
+        "score_organization": evaluation.score_organization,
+        "score_style_language_expression": evaluation.score_style_language_expression,
+        "score_structural_variety_accuracy": evaluation.score_structural_variety_accuracy,
+        "ai_comment": evaluation.ai_comment,
+        "status": exam_schema.StatusEnum.processed,
+    }
+
+
+def _bulk_update_exams(session: Any, updates: List[Dict[str, Any]]) -> None:
+    """Write per-exam field updates in one executemany UPDATE keyed by exam ID."""
+    if not updates:
+        return
+    now = datetime.now()
+    session.execute(update(exam_model.Exam), [{**values, "updated_at": now} for values in updates])
+    session.commit()
+
+
+def _fail_exams(session: Any, exam_ids: List[int]) -> None:
+    _bulk_update_exams(session, [{"id": exam_id, "status": exam_schema.StatusEnum.failed} for exam_id in exam_ids])
+
+
+def _fail_run(session: Any, run: batch_model.BatchRun, error: str) -> None:
+    """Mark the run and its ungraded exams as failed."""
+    # Exams scored from the cache are already graded
+    graded = set(run.cached_exam_ids or []) if run.phase == batch_schema.BatchPhaseEnum.scoring else set()
+    _fail_exams(session, [exam_id for exam_id in run.exam_ids if exam_id not in graded])
+    run.status = batch_schema.BatchStatusEnum.failed
+    run.last_error = error[:2000]
+
+
+def _apply_cached(session: Any, run: batch_model.BatchRun, cached: List[Dict[str, Any]]) -> None:
+    """Write results answered from the caches and record those exams on the run in the same commit."""
+    if not cached:
+        return
+    run.cached_exam_ids = [*(run.cached_exam_ids or []), *(values["id"] for values in cached)]
+    session.add(run)
+    _bulk_update_exams(session, cached)
+
+
+def start_batch_run(
+    session: Any,
+    project_id: int,
+    user_id: int,
+    evaluation_type: exam_schema.EvaluationTypeEnum = exam_schema.EvaluationTypeEnum.full
+) -> Optional[batch_model.BatchRun]:
+    """
+    Move every pending exam of a project into a new offline evaluation run.
+
+    Queued interactive jobs of the project are withdrawn in the same
+    transaction, and exams a worker has already claimed stay with it, so no
+    exam is graded by both paths. The run's exams are marked as processing;
+    the evaluation worker prepares, submits and polls the run.
+
+    Args:
+        session: Database session
+        project_id: ID of the project
+        user_id: ID of the user to notify when the run completes
+        evaluation_type: full runs OCR then scoring, ai_only only scoring
+
+    Returns:
+        BatchRun: The new run, or None if the project has no pending exams
+    """
+    exam_ids = list(session.exec(
+        select(exam_model.Exam.id)
+        .where(exam_model.Exam.project_id == project_id)
+        .where(exam_model.Exam.status == exam_schema.StatusEnum.pending)
+        # Grouped multi-page submissions are graded by the evaluation worker
+        .where(exam_model.Exam.lead_exam_id.is_(None))
+    ).all())
+    # Exams a worker has already claimed stay with the interactive queue
+    claimed = set(job_queue.withdraw_queued_jobs(session, exam_ids))
+    exam_ids = [exam_id for exam_id in exam_ids if exam_id not in claimed]
+    if not exam_ids:
+        session.rollback()
+        return None
+
+    run = batch_model.BatchRun(
+        project_id=project_id,
+        user_id=user_id,
+        evaluation_type=evaluation_type,
+        backend=settings.BATCH_BACKEND,
+        phase=(
+            batch_schema.BatchPhaseEnum.ocr
+            if evaluation_type == exam_schema.EvaluationTypeEnum.full
+            else batch_schema.BatchPhaseEnum.scoring
+        ),
+        exam_ids=exam_ids,
+    )
+    session.add(run)
+    _bulk_update_exams(session, [{"id": exam_id, "status": exam_schema.StatusEnum.processing} for exam_id in exam_ids])
+    session.refresh(run)
+
+    logger.info(f"Started offline {evaluation_type.value} evaluation run {run.id} for {len(exam_ids)} exams")
+    return run
+
+
+async def _write_ocr_requests(session: Any, run: batch_model.BatchRun, writer: _BatchFileWriter) -> List[int]:
+    """Write OCR requests for the run's exams, applying cached results directly. Returns failed exam IDs."""
+    done = set(run.submitted_exam_ids or []) | set(run.cached_exam_ids or [])
+    failed, cached = [], []
+    for exam_id in run.exam_ids:
+        if exam_id in done:
+            continue
+        exam = session.get(exam_model.Exam, exam_id)
+        if not exam or not exam.exam_image_url:
+            failed.append(exam_id)
+            continue
+
+        try:
+            image_bytes = await image_store.get_image(exam.exam_image_url)
+        except HTTPException:
+            failed.append(exam_id)
+            continue
+
+        base64_image = await asyncio.to_thread(prepare_ocr_image, BytesIO(image_bytes))
+        cache_key = inference_cache.ocr_cache_key(base64_image, settings.OCR_MODEL_NAME, OCR_PROMPT_VERSION)
+        metadata = inference_cache.get_cached_ocr(session, cache_key, ExamModel)
+        if metadata is not None:
+            cached.append({"id": exam_id, **_apply_ocr(metadata)})
+            continue
+
+        writer.write(f"{OCR_PREFIX}-{exam_id}", settings.OCR_MODEL_NAME, ExamModel, build_ocr_messages(base64_image))
+
+    _apply_cached(session, run, cached)
+    return failed
+
+
+async def _write_scoring_requests(session: Any, run: batch_model.BatchRun, writer: _BatchFileWriter) -> List[int]:
+    """Write scoring requests for the run's exams, applying cached results directly. Returns failed exam IDs."""
+    project = session.get(project_model.Project, run.project_id)
+    prompt = prompt_cache.get_compiled_prompt(session, project.task_id) if project else None
+    if not prompt:
+        return list(run.exam_ids)
+
+    done = set(run.submitted_exam_ids or []) | set(run.cached_exam_ids or [])
+    failed, cached, exams = [], [], []
+    for exam_id in run.exam_ids:
+        if exam_id in done:
+            continue
+        exam = session.get(exam_model.Exam, exam_id)
+        if not exam or not exam.exam_extracted_text:
+            failed.append(exam_id)
+        else:
+            exams.append(exam)
+
+    # Retrieve the few-shot examples of every exam in one batched lookup
+    retrieved_exams = await asyncio.to_thread(
+        build_fewshot_prompts, [exam.exam_extracted_text for exam in exams], TOP_K, [project.task_id] * len(exams)
+    )
+
+    for exam, retrieved_exam in zip(exams, retrieved_exams):
+        exam_id = exam.id
+        cache_key = inference_cache.evaluation_cache_key(
+            prompt.system_prompt, exam.exam_extracted_text, retrieved_exam, settings.AI_MODEL_NAME, EVALUATION_PROMPT_VERSION
+        )
+        evaluation = inference_cache.get_cached_evaluation(session, cache_key, StructuredAnalyzeResponse)
+        if evaluation is not None:
+            cached.append({"id": exam_id, **_apply_evaluation(evaluation)})
+            continue
+
+        writer.write(
+            f"{SCORING_PREFIX}-{exam_id}",
+            settings.AI_MODEL_NAME,
+            StructuredAnalyzeResponse,
+            prompt.build_messages(retrieved_exam, exam.exam_extracted_text),
+        )
+
+    _apply_cached(session, run, cached)
+    return failed
+
+
+async def _prepare_run(session: Any, run: batch_model.BatchRun, backend: BatchBackend) -> None:
+    """
+    Build the request files for the run's current phase and submit them.
+
+    Each provider batch is saved on the run as soon as it is submitted, and
+    exams already submitted or answered from the caches are skipped, so
+    retrying a run that failed halfway never submits the same request twice.
+    """
+    writer = _BatchFileWriter(run.id, run.phase.value)
+    try:
+        if run.phase == batch_schema.BatchPhaseEnum.ocr:
+            failed = await _write_ocr_requests(session, run, writer)
+        else:
+            failed = await _write_scoring_requests(session, run, writer)
+        for path, custom_ids in zip(writer.close(), writer.custom_ids):
+            batch_id = await asyncio.to_thread(backend.submit, path)
+            run.provider_batch_ids = [*run.provider_batch_ids, batch_id]
+            run.submitted_exam_ids = [*(run.submitted_exam_ids or []), *map(_exam_id, custom_ids)]
+            run.request_count += len(custom_ids)
+            session.add(run)
+            session.commit()
+    finally:
+        for path in writer.close():
+            os.remove(path)
+
+    _fail_exams(session, failed)
+    run.exam_ids = [exam_id for exam_id in run.exam_ids if exam_id not in failed]
+    run.status = batch_schema.BatchStatusEnum.submitted
+
+    logger.info(
+        f"Submitted {writer.count} {run.phase.value} requests in {len(writer.paths)} batches for run {run.id}"
+    )
+    if not run.provider_batch_ids:
+        # Everything came from the caches; collect immediately
+        await _collect_run(session, run, backend)
+
+
+async def _collect_run(session: Any, run: batch_model.BatchRun, backend: BatchBackend) -> None:
+    """Poll the run's batches and map their results back onto the exams once all are done."""
+    statuses = [await asyncio.to_thread(backend.poll, batch_id) for batch_id in run.provider_batch_ids]
+    if any(batch_status in PROVIDER_FAILED for batch_status in statuses):
+        _fail_run(session, run, f"Batch provider reported: {', '.join(statuses)}")
+        return
+    if not all(batch_status == PROVIDER_COMPLETED for batch_status in statuses):
+        return
+
+    is_ocr = run.phase == batch_schema.BatchPhaseEnum.ocr
+    response_model = ExamModel if is_ocr else StructuredAnalyzeResponse
+    apply = _apply_ocr if is_ocr else _apply_evaluation
+
+    updates, errors = [], {}
+    for batch_id in run.provider_batch_ids:
+        results = await asyncio.to_thread(lambda: list(backend.fetch_results(batch_id)))
+        for result in results:
+            exam_id, parsed, error = _parse_result(result, response_model)
+            if parsed is None:
+                errors[exam_id] = error
+            else:
+                updates.append({"id": exam_id, **apply(parsed)})
+
+    answered = {values["id"] for values in updates}
+    # Exams answered from the cache while preparing the phase have no result line
+    cached = set(run.cached_exam_ids or [])
+    failed = [
+        exam_id for exam_id in run.exam_ids
+        if exam_id in errors or (exam_id not in answered and exam_id not in cached)
+    ]
+
+    _bulk_update_exams(session, updates)
+    _fail_exams(session, failed)
+    if errors:
+        run.last_error = f"{len(errors)} requests failed, e.g. {next(iter(errors.values()))}"[:2000]
+
+    succeeded = [exam_id for exam_id in run.exam_ids if exam_id not in failed]
+    logger.info(f"Run {run.id} {run.phase.value} phase finished: {len(succeeded)} succeeded, {len(failed)} failed")
+
+    if is_ocr and succeeded:
+        run.phase = batch_schema.BatchPhaseEnum.scoring
+        run.status = batch_schema.BatchStatusEnum.preparing
+        run.exam_ids = succeeded
+        run.provider_batch_ids = []
+        run.submitted_exam_ids = None
+        run.cached_exam_ids = None
+        run.request_count = 0
+        return
+
+    run.status = batch_schema.BatchStatusEnum.completed if succeeded else batch_schema.BatchStatusEnum.failed
+    if not job_queue.has_open_jobs(session, run.project_id):
+        notify_if_project_evaluated(session, run.project_id, session.get(user_model.User, run.user_id))
+
+
+def _claim_runs(session: Any, worker_id: str) -> List[int]:
+    """Lock runs that are due for preparation or polling for this worker."""
+    now = datetime.now()
+    run = batch_model.BatchRun
+    runs = session.exec(
+        select(run)
+        .where(run.status.in_([batch_schema.BatchStatusEnum.preparing, batch_schema.BatchStatusEnum.submitted]))
+        .where(or_(run.locked_at.is_(None), run.locked_at < now - timedelta(seconds=settings.JOB_LOCK_TIMEOUT)))
+        .where(or_(
+            run.status == batch_schema.BatchStatusEnum.preparing,
+            run.polled_at.is_(None),
+            run.polled_at < now - timedelta(seconds=settings.BATCH_POLL_INTERVAL),
+        ))
+        .order_by(run.id)
+        .with_for_update(skip_locked=True)
+    ).all()
+
+    for claimed in runs:
+        claimed.locked_by = worker_id
+        claimed.locked_at = now
+        session.add(claimed)
+    session.commit()
+    return [claimed.id for claimed in runs]
+
+
+async def advance_batch_runs(worker_id: str) -> None:
+    """
+    Prepare, submit, poll and collect every offline evaluation run that is due.
+
+    Args:
+        worker_id: Identifier of the worker advancing the runs
+    """
+    with Session(database.engine) as session:
+        run_ids = _claim_runs(session, worker_id)
+
+    for run_id in run_ids:
+        with Session(database.engine) as session:
+            run = session.get(batch_model.BatchRun, run_id)
+            try:
+                backend = get_batch_backend(run.backend)
+                if run.status == batch_schema.BatchStatusEnum.preparing:
+                    await _prepare_run(session, run, backend)
+                else:
+                    await _collect_run(session, run, backend)
+                run.attempts = 0
+            except Exception as e:
+                logger.error(f"Failed to advance batch run {run_id}: {str(e)}")
+                session.rollback()
+                run = session.get(batch_model.BatchRun, run_id)
+                run.last_error = str(e)[:2000]
+                run.attempts = (run.attempts or 0) + 1
+                if run.attempts >= settings.BATCH_MAX_ATTEMPTS:
+                    logger.error(f"Giving up on batch run {run_id} after {run.attempts} failed attempts")
+                    _fail_run(session, run, f"Gave up after {run.attempts} failed attempts: {str(e)}")
+
+            run.locked_by = None
+            run.locked_at = None
+            run.polled_at = datetime.now()
+            run.updated_at = datetime.now()
+            session.add(run)
+            session.commit()
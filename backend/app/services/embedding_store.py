@@ -0,0 +1,97 @@
+import logging
+import time
+from datetime import datetime
+from typing import Any, Dict, List
+
+import numpy as np
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlmodel import select
+
+from ..core.config import settings
+from ..core.vectordb import EMBEDDING_MODEL_ID, embed_documents
+from ..models import embedding_model
+from .inference_cache import hash_parts
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+def embedding_key(text: str, model_name: str = EMBEDDING_MODEL_ID) -> str:
+    """
+    Build the storage key of a text's embedding.
+
+    Args:
+        text: The embedded text
+        model_name: Embedding model name
+
+    Returns:
+        str: Storage key
+    """
+    return hash_parts(model_name, text)
+
+
+def encode_vector(vector: Any, dtype: str = settings.EMBEDDING_STORE_DTYPE) -> bytes:
+    """Pack an embedding into a compact little-endian blob."""
+    return np.asarray(vector, dtype=np.dtype(dtype).newbyteorder("<")).tobytes()
+
+
+def decode_vector(blob: bytes, dtype: str) -> List[float]:
+    """Unpack a stored embedding blob into float32 values."""
+    return np.frombuffer(blob, dtype=np.dtype(dtype).newbyteorder("<")).astype(np.float32).tolist()
+
+
+def get_embeddings(session: Any, texts: List[str], model_name: str = EMBEDDING_MODEL_ID) -> List[List[float]]:
+    """
+    Get the embeddings of several texts, computing only the ones never seen before.
+
+    Stored vectors are looked up in one query. The missing texts are encoded
+    in one batched pass and saved, so an exam's text is embedded once no
+    matter how often it is graded, retrieved against or added to the
+    collection.
+
+    Args:
+        session: Database session
+        texts: Texts to embed
+        model_name: Embedding model name
+
+    Returns:
+        List[List[float]]: One embedding per text, in the same order
+    """
+    if not texts:
+        return []
+
+    keys = [embedding_key(text, model_name) for text in texts]
+    stored: Dict[str, List[float]] = {
+        entry.key: decode_vector(entry.vector, entry.dtype)
+        for entry in session.exec(
+            select(embedding_model.ExamEmbedding).where(embedding_model.ExamEmbedding.key.in_(set(keys)))
+        ).all()
+    }
+
+    # Encode each missing text once, even if it appears several times
+    missing = {key: text for key, text in zip(keys, texts) if key not in stored}
+    if missing:
+        started = time.perf_counter()
+        vectors = embed_documents(list(missing.values()))
+        elapsed = time.perf_counter() - started
+
+        now = datetime.now()
+        rows = []
+        for key, vector in zip(missing, vectors):
+            blob = encode_vector(vector)
+            # Hand out the stored precision so results do not depend on whether the vector was reused
+            stored[key] = decode_vector(blob, settings.EMBEDDING_STORE_DTYPE)
+            rows.append({
+                "key": key,
+                "model_name": model_name,
+                "dimensions": len(vector),
+                "dtype": settings.EMBEDDING_STORE_DTYPE,
+                "vector": blob,
+                "created_at": now,
+            })
+        session.execute(pg_insert(embedding_model.ExamEmbedding).values(rows).on_conflict_do_nothing(index_elements=["key"]))
+        session.commit()
+
+        logger.info(f"Embedded {len(missing)} new texts in {elapsed * 1000:.0f} ms, reused {len(set(keys)) - len(missing)}")
+
+    return [stored[key] for key in keys]
@@ -0,0 +1,135 @@
+import asyncio
+import logging
+from contextlib import aclosing
+from datetime import datetime
+from io import BytesIO
+from typing import Any, Dict, List
+
+from sqlalchemy import delete, insert, update
+from sqlmodel import select
+
+from ..core.config import settings
+from ..models import exam_model
+from ..schemas import exam_schema
+from . import aws_s3, pdf_processor
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+def _insert_page_rows(session: Any, project_id: int, user_id: int, page_count: int) -> List[int]:
+    """Insert one pending exam row per page in a single statement and return their IDs in page order."""
+    now = datetime.now()
+    rows = [
+        {
+            "project_id": project_id,
+            "user_id": user_id,
+            "page": page_number,
+            "total_pages": page_count,
+            "status": exam_schema.StatusEnum.pending,
+            "is_embedded": False,
+            "source": exam_schema.SourceEnum.internal,
+            "exam_image_url": None,  # Set once the page is uploaded
+            "created_at": now,
+            "updated_at": now,
+        }
+        for page_number in range(1, page_count + 1)
+    ]
+    exam_ids = session.execute(
+        insert(exam_model.Exam).returning(exam_model.Exam.id, sort_by_parameter_order=True),
+        rows
+    ).scalars().all()
+    session.commit()
+    return list(exam_ids)
+
+
+async def ingest_pdf(
+    session: Any,
+    pdf_path: str,
+    page_count: int,
+    project_id: int,
+    user_id: int,
+    group_pages: bool = False
+) -> List[exam_model.Exam]:
+    """
+    Create exam rows for every page of a spooled PDF and upload the page images.
+
+    All page rows are inserted in one statement, pages are uploaded to S3
+    concurrently as they are rendered, and the S3 keys are written back in
+    one batched update. Pages that fail to upload are removed.
+
+    Args:
+        session: Database session
+        pdf_path: Path of the spooled PDF file
+        page_count: Number of pages in the PDF
+        project_id: ID of the project
+        user_id: ID of the uploading user
+        group_pages: Link all pages to the first one so they are graded as one submission
+
+    Returns:
+        List[Exam]: The created exams, in page order
+
+    Raises:
+        HTTPException: If the PDF cannot be rendered
+    """
+    exam_ids = _insert_page_rows(session, project_id, user_id, page_count)
+    semaphore = asyncio.Semaphore(settings.S3_UPLOAD_CONCURRENCY)
+    uploads: List[asyncio.Task] = []
+
+    async def upload_page(exam_id: int, page_number: int, page_image: bytes) -> Dict[str, Any]:
+        try:
+            key = await aws_s3.upload_exam_image(
+                file=BytesIO(page_image),
+                user_id=user_id,
+                project_id=project_id,
+                exam_id=exam_id,
+                page_number=page_number,
+                content_type=pdf_processor.PAGE_CONTENT_TYPE
+            )
+            return {"id": exam_id, "exam_image_url": key}
+        finally:
+            semaphore.release()
+
+    try:
+        async with aclosing(pdf_processor.iter_pdf_pages(pdf_path, page_count)) as pages:
+            async for page_number, page_image in pages:
+                # Wait for a free upload slot so rendered pages never pile up in memory
+                await semaphore.acquire()
+                uploads.append(asyncio.create_task(upload_page(exam_ids[page_number - 1], page_number, page_image)))
+    except Exception:
+        # Rendering failed; drop the rows and whatever pages already reached S3
+        results = await asyncio.gather(*uploads, return_exceptions=True)
+        await asyncio.gather(*(
+            aws_s3.delete_exam_image(result["exam_image_url"]) for result in results if isinstance(result, dict)
+        ), return_exceptions=True)
+        session.execute(delete(exam_model.Exam).where(exam_model.Exam.id.in_(exam_ids)))
+        session.commit()
+        raise
+
+    results = await asyncio.gather(*uploads, return_exceptions=True)
+    uploaded = [result for result in results if isinstance(result, dict)]
+    failed_ids = []
+    for exam_id, result in zip(exam_ids, results):
+        if not isinstance(result, dict):
+            # Continue with other pages even if one fails
+            logger.error(f"Failed to upload page image for exam {exam_id}: {str(result)}")
+            failed_ids.append(exam_id)
+
+    if failed_ids:
+        session.execute(delete(exam_model.Exam).where(exam_model.Exam.id.in_(failed_ids)))
+
+    if group_pages and len(uploaded) > 1:
+        for values in uploaded:
+            values["lead_exam_id"] = uploaded[0]["id"]
+
+    # Write every S3 key (and submission link) back in one executemany UPDATE by primary key
+    if uploaded:
+        session.execute(update(exam_model.Exam), uploaded)
+    session.commit()
+
+    logger.info(f"Ingested {len(uploaded)}/{page_count} pages for project {project_id}")
+    return list(session.exec(
+        select(exam_model.Exam)
+        .where(exam_model.Exam.id.in_([values["id"] for values in uploaded]))
+        .order_by(exam_model.Exam.page)
+    ).all())
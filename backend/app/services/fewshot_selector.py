@@ -0,0 +1,165 @@
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from ..core.config import settings
+from .token_counter import count_text_tokens, truncate_text_tokens
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Constants
+EXAMPLE_HEADER = "Similar Example {number} with Your Past Evaluation:"
+EXAMPLE_SEPARATOR = "---"
+# Metadata of a few-shot example shown to the model, in display order
+SCORE_FIELDS = (
+    "score_task_completion",
+    "score_organization",
+    "score_style_language_expression",
+    "score_structural_variety_accuracy",
+)
+
+
+def format_scores(metadata: Optional[Dict[str, Any]]) -> str:
+    """
+    Format the scores of an example on one line.
+
+    Args:
+        metadata: Collection metadata of the example
+
+    Returns:
+        str: e.g. "Scores: task_completion=4, organization=3.5"
+    """
+    scores = [
+        f"{field.removeprefix('score_')}={metadata[field]:g}"
+        for field in SCORE_FIELDS
+        if metadata and metadata.get(field) is not None
+    ]
+    return "Scores: " + ", ".join(scores)
+
+
+def format_example(number: int, document: str, metadata: Optional[Dict[str, Any]]) -> str:
+    """Format one few-shot example block."""
+    return f"{EXAMPLE_HEADER.format(number=number)}\n{document}\n{format_scores(metadata)}\n{EXAMPLE_SEPARATOR}\n"
+
+
+def mmr_order(query_embedding: Any, embeddings: Any, diversity_weight: float) -> List[int]:
+    """
+    Rank candidates by maximal marginal relevance.
+
+    Each step picks the candidate with the best trade-off between similarity
+    to the query and dissimilarity to the candidates already picked, so
+    near-duplicates of an earlier pick fall back in the ranking.
+
+    Args:
+        query_embedding: Embedding of the exam being graded
+        embeddings: Embeddings of the candidates, nearest first
+        diversity_weight: 1 ranks by relevance only, 0 by diversity only
+
+    Returns:
+        List[int]: Candidate indices, best first
+    """
+    candidates = np.asarray(embeddings, dtype=np.float32)
+    if len(candidates) == 0:
+        return []
+    candidates = candidates / np.clip(np.linalg.norm(candidates, axis=1, keepdims=True), 1e-12, None)
+    query = np.asarray(query_embedding, dtype=np.float32)
+    query = query / max(float(np.linalg.norm(query)), 1e-12)
+
+    relevance = candidates @ query
+    similarity = candidates @ candidates.T
+    redundancy = np.full(len(candidates), -np.inf)
+    remaining = list(range(len(candidates)))
+    order: List[int] = []
+
+    while remaining:
+        scores = [
+            diversity_weight * relevance[i] - (1 - diversity_weight) * (redundancy[i] if order else 0.0)
+            for i in remaining
+        ]
+        best = remaining.pop(int(np.argmax(scores)))
+        order.append(best)
+        redundancy = np.maximum(redundancy, similarity[best])
+
+    return order
+
+
+def pack_examples(
+    order: List[int],
+    documents: List[str],
+    metadatas: List[Optional[Dict[str, Any]]],
+    top_k: int,
+    token_budget: int = settings.FEWSHOT_TOKEN_BUDGET,
+    model: str = settings.AI_MODEL_NAME,
+) -> List[Tuple[int, str]]:
+    """
+    Format up to top_k ranked candidates within a token budget.
+
+    A candidate is skipped if it does not fit in what is left of the budget,
+    so a long essay can make room for shorter ones further down. If not even
+    the best candidate fits, its text is cut to the budget so the model
+    still sees one graded example. The first n of the result are the same
+    whatever top_k is, for any n up to top_k.
+
+    Args:
+        order: Candidate indices, best first
+        documents: Texts of the candidates
+        metadatas: Collection metadata of the candidates
+        top_k: Maximum number of examples
+        token_budget: Maximum tokens of all examples together
+        model: Model name used to pick the tokenizer
+
+    Returns:
+        List[Tuple[int, str]]: Candidate index and formatted block of each example, best first
+    """
+    examples: List[Tuple[int, str]] = []
+    used = 0
+
+    for index in order:
+        if len(examples) >= top_k:
+            break
+        example = format_example(len(examples) + 1, documents[index], metadatas[index])
+        tokens = count_text_tokens(example, model)
+        if used + tokens <= token_budget:
+            examples.append((index, example))
+            used += tokens
+
+    if not examples and order and top_k > 0:
+        best = order[0]
+        overhead = count_text_tokens(format_example(1, "", metadatas[best]), model)
+        document = truncate_text_tokens(documents[best], token_budget - overhead, model)
+        if document:
+            examples.append((best, format_example(1, document, metadatas[best])))
+
+    return examples
+
+
+def select_examples(
+    query_embedding: Any,
+    documents: List[str],
+    metadatas: List[Optional[Dict[str, Any]]],
+    embeddings: Any,
+    top_k: int,
+    token_budget: int = settings.FEWSHOT_TOKEN_BUDGET,
+    diversity_weight: float = settings.FEWSHOT_MMR_LAMBDA,
+    model: str = settings.AI_MODEL_NAME,
+) -> List[str]:
+    """
+    Pick and format up to top_k diverse few-shot examples within a token budget.
+
+    Args:
+        query_embedding: Embedding of the exam being graded
+        documents: Texts of the over-fetched candidates
+        metadatas: Collection metadata of the candidates
+        embeddings: Embeddings of the candidates
+        top_k: Maximum number of examples
+        token_budget: Maximum tokens of all examples together
+        diversity_weight: MMR trade-off; 1 ranks by relevance only
+        model: Model name used to pick the tokenizer
+
+    Returns:
+        List[str]: Formatted example blocks, best first
+    """
+    order = mmr_order(query_embedding, embeddings, diversity_weight)
+    return [example for _, example in pack_examples(order, documents, metadatas, top_k, token_budget, model)]
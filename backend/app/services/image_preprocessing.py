@@ -0,0 +1,126 @@
+from typing import List, Tuple
+
+import numpy as np
+from PIL import Image
+
+# Constants
+THRESHOLD = 128  # Gray levels below this become white (text) after inversion
+MEDIAN_MAJORITY = 5  # A 3x3 median of a binary image is set when 5 of 9 pixels are
+LEVELS = np.arange(256, dtype=np.uint8)
+
+
+def _moments(histogram: np.ndarray) -> Tuple[np.float64, np.float64]:
+    """Mean and standard deviation of the pixels described by a 256-bin histogram."""
+    count = histogram.sum()
+    # The integer sum is exact, so the mean matches np.mean of the pixels
+    mean = np.float64(int((LEVELS.astype(np.int64) * histogram).sum())) / count
+    variance = (histogram * (LEVELS - mean) ** 2).sum() / count
+    return mean, np.sqrt(variance)
+
+
+def _occurring_range(luts: List[np.ndarray], histograms: List[np.ndarray]) -> Tuple[np.generic, np.generic]:
+    """Minimum and maximum normalized value over the levels that actually occur in the image."""
+    values = np.concatenate([lut[histogram > 0] for lut, histogram in zip(luts, histograms)])
+    return values.min(), values.max()
+
+
+def _rescale(lut: np.ndarray, low: np.generic, high: np.generic) -> np.ndarray:
+    """Stretch normalized values to 0-255 exactly as the per-pixel rescale did."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.clip((lut - low) / (high - low) * 255, 0, 255).astype(np.uint8)
+
+
+def _rgb_levels(image: Image.Image) -> Image.Image:
+    """Z-score every color channel, stretch to 0-255 and convert to luma, using per-band lookup tables."""
+    bands = len(image.getbands())
+    histograms = np.array(image.histogram(), dtype=np.int64).reshape(bands, 256)
+
+    luts = []
+    for band, histogram in enumerate(histograms):
+        mean, std = _moments(histogram)
+        if band < 3 and std > 0:
+            # Normalized values are written back into the uint8 image, which wraps negatives
+            luts.append(((LEVELS - mean) / std).astype(np.uint8))
+        else:
+            # Alpha and flat channels keep their raw values but still count towards the range
+            luts.append(LEVELS.copy())
+
+    low, high = _occurring_range(luts, list(histograms))
+    table = np.concatenate([_rescale(lut, low, high) for lut in luts])
+    return image.point(table.tolist()).convert("L")
+
+
+def _gray_levels(image: Image.Image) -> Image.Image:
+    """Z-score a grayscale image and stretch it to 0-255 using one lookup table."""
+    histogram = np.array(image.histogram(), dtype=np.int64)
+    mean, std = _moments(histogram)
+    lut = (LEVELS - mean) / std if std > 0 else LEVELS
+
+    low, high = _occurring_range([lut], [histogram])
+    return image.point(_rescale(lut, low, high).tolist())
+
+
+def _median_3x3(mask: np.ndarray) -> np.ndarray:
+    """3x3 median filter of a 0/1 image with edge replication, as a majority vote of neighbour counts."""
+    padded = np.pad(mask, 1, mode="edge")
+    height, width = mask.shape
+
+    rows = np.empty((height + 2, width), dtype=np.uint8)
+    np.add(padded[:, :-2], padded[:, 1:-1], out=rows)
+    rows += padded[:, 2:]
+
+    counts = np.empty((height, width), dtype=np.uint8)
+    np.add(rows[:-2], rows[1:-1], out=counts)
+    counts += rows[2:]
+
+    return np.greater_equal(counts, MEDIAN_MAJORITY, out=np.empty((height, width), dtype=bool))
+
+
+def preprocess_image(image_pil: Image.Image, gray_as_color: bool = False) -> Image.Image:
+    """
+    Preprocess Image to remove red marks, enhance text for OCR.
+
+    Each channel is normalized to a standard normal distribution and
+    stretched back to 0-255, the image is converted to grayscale, binarized
+    and inverted, and speckles are removed with a 3x3 median filter. The
+    per-pixel steps are folded into lookup tables built from the image
+    histogram, so the pixels are only touched by a few C-level passes.
+
+    Args:
+        image_pil: PIL Image to preprocess
+        gray_as_color: Normalize a grayscale image the way the color path
+            treats a gray RGB scan, so pages rendered in grayscale come out
+            like pages rendered in RGB
+
+    Returns:
+        Image.Image: Binary (mode "1") image with white text on black
+    """
+    image = image_pil
+    if image.mode not in ("L", "RGB", "RGBA"):
+        image = image.convert("RGB" if len(image.getbands()) >= 3 else "L")
+
+    gray = _gray_levels(image) if image.mode == "L" and not gray_as_color else _rgb_levels(image)
+
+    # Threshold and invert in one table: dark (text) pixels become 1
+    mask = np.asarray(gray.point([1 if level < THRESHOLD else 0 for level in range(256)]))
+
+    return Image.fromarray(_median_3x3(mask))
+
+
+def ocr_polarity(binary: Image.Image) -> Image.Image:
+    """
+    Turn a binarized stored page into the image sent to the OCR model.
+
+    Running preprocess_image on a binary image gives the same result: the
+    normalization is a no-op, so it only inverts the page back to dark text
+    on a light background and despeckles it again. This does that directly,
+    without the histogram and lookup table passes.
+
+    Args:
+        binary: A binary page, such as the output of preprocess_image
+
+    Returns:
+        Image.Image: Binary (mode "1") image with black text on white
+    """
+    mask = np.asarray(binary.convert("1"))
+    return Image.fromarray(_median_3x3(np.logical_not(mask).astype(np.uint8)))
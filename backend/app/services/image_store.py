@@ -0,0 +1,183 @@
+import asyncio
+import glob
+import hashlib
+import itertools
+import logging
+import os
+import re
+import tempfile
+import time
+from typing import NamedTuple, Optional
+
+from botocore.exceptions import ClientError
+from fastapi import HTTPException, status
+
+from ..core.config import settings
+from .aws_s3 import s3_client
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Constants
+EVICTION_INTERVAL = 50  # Check the cache size once every N writes per process
+NOT_MODIFIED_CODES = {"304", "NotModified"}
+
+
+class CachedImage(NamedTuple):
+    etag: str
+    path: str
+    validated_at: float  # Epoch seconds when S3 last confirmed the ETag
+
+
+class ImageCache:
+    """
+    Size-bounded on-disk LRU cache of S3 objects keyed by S3 key and ETag.
+
+    Each object is one file named after the hash of its key and its ETag.
+    A file's modification time records when S3 last confirmed its ETag and
+    its access time when it was last read; the least recently read files
+    are removed once the directory grows beyond `max_bytes`.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._writes = itertools.count(1)
+
+    def _prefix(self, key: str) -> str:
+        return os.path.join(self.directory, hashlib.sha256(key.encode("utf-8")).hexdigest())
+
+    def lookup(self, key: str) -> Optional[CachedImage]:
+        """Find the cached copy of an S3 key, if any."""
+        for path in glob.glob(f"{self._prefix(key)}_*"):
+            if not path.endswith(".tmp"):
+                try:
+                    validated_at = os.stat(path).st_mtime
+                except FileNotFoundError:
+                    continue
+                return CachedImage(etag=path.rsplit("_", 1)[1], path=path, validated_at=validated_at)
+        return None
+
+    def read(self, cached: CachedImage, revalidated: bool = False) -> bytes:
+        """Read a cached file and mark it as recently used (and as just confirmed, if revalidated)."""
+        with open(cached.path, "rb") as cached_file:
+            data = cached_file.read()
+        now = time.time()
+        os.utime(cached.path, (now, now if revalidated else cached.validated_at))
+        return data
+
+    def store(self, key: str, etag: str, data: bytes) -> None:
+        """Save an object, replacing any copy with an older ETag."""
+        os.makedirs(self.directory, exist_ok=True)
+        prefix = self._prefix(key)
+        for stale_path in glob.glob(f"{prefix}_*"):
+            self._remove(stale_path)
+
+        # Write to a temp file first so readers never see a partial object
+        handle, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(handle, "wb") as temp_file:
+            temp_file.write(data)
+        os.replace(temp_path, f"{prefix}_{re.sub(r'[^0-9A-Za-z-]', '', etag)}")
+
+        if next(self._writes) % EVICTION_INTERVAL == 0:
+            self.evict()
+
+    def evict(self) -> int:
+        """
+        Remove least recently used files until the cache fits `max_bytes`.
+
+        Returns:
+            int: Number of files removed
+        """
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file():
+                stat = entry.stat()
+                entries.append((stat.st_atime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+            removed += 1
+
+        if removed:
+            logger.info(f"Evicted {removed} least recently used images from {self.directory}")
+        return removed
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+image_cache = ImageCache(settings.IMAGE_CACHE_DIR, settings.IMAGE_CACHE_MAX_BYTES)
+
+
+def _fetch(key: str) -> bytes:
+    """
+    Read an object through the cache.
+
+    Copies confirmed by S3 within IMAGE_CACHE_REVALIDATE_SECONDS are served
+    without a request; older ones are revalidated with a conditional GET.
+    """
+    cached = image_cache.lookup(key) if settings.IMAGE_CACHE_ENABLED else None
+    if cached and time.time() - cached.validated_at < settings.IMAGE_CACHE_REVALIDATE_SECONDS:
+        try:
+            return image_cache.read(cached)
+        except FileNotFoundError:
+            # Evicted by another process in the meantime
+            cached = None
+
+    params = {"Bucket": settings.S3_BUCKET_NAME, "Key": key}
+    if cached:
+        params["IfNoneMatch"] = f'"{cached.etag}"'
+
+    try:
+        response = s3_client.get_object(**params)
+    except ClientError as e:
+        if cached and e.response.get("Error", {}).get("Code") in NOT_MODIFIED_CODES:
+            try:
+                return image_cache.read(cached, revalidated=True)
+            except FileNotFoundError:
+                # Evicted by another process in the meantime
+                return _fetch_uncached(key)
+        raise
+
+    body = response["Body"].read()
+    if settings.IMAGE_CACHE_ENABLED:
+        image_cache.store(key, response["ETag"].strip('"'), body)
+    return body
+
+
+def _fetch_uncached(key: str) -> bytes:
+    response = s3_client.get_object(Bucket=settings.S3_BUCKET_NAME, Key=key)
+    return response["Body"].read()
+
+
+async def get_image(key: str) -> bytes:
+    """
+    Download an exam image, serving recently confirmed or unchanged objects from the local cache.
+
+    Args:
+        key: The S3 key of the image
+
+    Returns:
+        bytes: The image file
+
+    Raises:
+        HTTPException: If the image cannot be read
+    """
+    try:
+        return await asyncio.to_thread(_fetch, key)
+    except ClientError as e:
+        logger.error(f"Error downloading image '{key}': {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to download exam image"
+        )
@@ -0,0 +1,315 @@
+import hashlib
+import itertools
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Type, TypeVar
+
+from pydantic import BaseModel
+from sqlalchemy import delete, func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlmodel import Session, select
+
+from ..core.config import settings
+from ..models import cache_model
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Constants
+EVICTION_INTERVAL = 50  # Run eviction once every N cache writes per process
+ACCESS_TOUCH_INTERVAL = timedelta(hours=1)  # Granularity of last_accessed_at updates on cache hits
+
+ResponseModel = TypeVar("ResponseModel", bound=BaseModel)
+
+_ocr_writes = itertools.count(1)
+_evaluation_writes = itertools.count(1)
+
+
+def hash_parts(*parts: Any) -> str:
+    """
+    Build a stable sha256 cache key from several parts.
+
+    Args:
+        *parts: Strings or bytes that identify a cached result
+
+    Returns:
+        str: Hex digest of the parts
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        data = part if isinstance(part, bytes) else str(part).encode("utf-8")
+        # Length-prefix every part so ("ab", "c") and ("a", "bc") differ
+        digest.update(len(data).to_bytes(8, "big"))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+def _get_entry(
+    session: Any,
+    table: Any,
+    key: str,
+    max_age_days: int,
+    response_model: Type[ResponseModel]
+) -> Optional[ResponseModel]:
+    """
+    Return the parsed payload of a cache row, dropping it if expired or unreadable.
+
+    Runs in its own short-lived session so a lookup never commits or holds
+    locks in the caller's transaction. Hits only write back when the stored
+    access time is older than ACCESS_TOUCH_INTERVAL.
+    """
+    with Session(session.get_bind()) as cache_session:
+        entry = cache_session.get(table, key)
+        if not entry:
+            return None
+
+        now = datetime.now()
+        if entry.created_at < now - timedelta(days=max_age_days):
+            cache_session.delete(entry)
+            cache_session.commit()
+            return None
+
+        try:
+            result = response_model.model_validate_json(entry.payload)
+        except Exception as e:
+            logger.warning(f"Discarding unreadable {table.__tablename__} entry {key}: {str(e)}")
+            cache_session.delete(entry)
+            cache_session.commit()
+            return None
+
+        if entry.last_accessed_at < now - ACCESS_TOUCH_INTERVAL:
+            entry.last_accessed_at = now
+            cache_session.add(entry)
+            cache_session.commit()
+        return result
+
+
+def _upsert_entry(session: Any, table: Any, key: str, result: BaseModel, **columns: Any) -> None:
+    """Insert or replace a cache row holding `result`, in its own short-lived session."""
+    payload = result.model_dump_json()
+    now = datetime.now()
+    values: Dict[str, Any] = {
+        "key": key,
+        "payload": payload,
+        "size_bytes": len(payload.encode("utf-8")),
+        "created_at": now,
+        "last_accessed_at": now,
+        **columns,
+    }
+    statement = pg_insert(table).values(**values)
+    with Session(session.get_bind()) as cache_session:
+        cache_session.execute(statement.on_conflict_do_update(
+            index_elements=["key"],
+            set_={column: statement.excluded[column] for column in values if column != "key"},
+        ))
+        cache_session.commit()
+
+
+def _evict(session: Any, table: Any, max_bytes: int, max_age_days: int) -> int:
+    """Remove expired rows, then least recently used ones until the table fits `max_bytes`."""
+    # Keep the most recently used entries whose running size total fits the budget
+    running_size = (
+        select(table.key, func.sum(table.size_bytes).over(order_by=table.last_accessed_at.desc()).label("running_size"))
+        .subquery()
+    )
+    with Session(session.get_bind()) as cache_session:
+        expired = cache_session.execute(
+            delete(table).where(table.created_at < datetime.now() - timedelta(days=max_age_days))
+        ).rowcount
+        oversized = cache_session.execute(
+            delete(table).where(table.key.in_(
+                select(running_size.c.key).where(running_size.c.running_size > max_bytes)
+            ))
+        ).rowcount
+        cache_session.commit()
+
+    if expired or oversized:
+        logger.info(
+            f"Evicted {expired} expired and {oversized} least recently used entries from {table.__tablename__}"
+        )
+    return expired + oversized
+
+
+def ocr_cache_key(preprocessed_image: Any, model_name: str, prompt_version: str) -> str:
+    """
+    Build the OCR cache key for a preprocessed exam image.
+
+    Args:
+        preprocessed_image: The preprocessed image sent to the OCR model
+        model_name: OCR model name
+        prompt_version: Version of the OCR prompt
+
+    Returns:
+        str: Cache key
+    """
+    return hash_parts(model_name, prompt_version, preprocessed_image)
+
+
+def get_cached_ocr(session: Any, key: str, response_model: Type[ResponseModel]) -> Optional[ResponseModel]:
+    """
+    Look up a cached OCR result.
+
+    Entries older than OCR_CACHE_MAX_AGE_DAYS are treated as misses and removed.
+
+    Args:
+        session: Database session
+        key: Cache key from ocr_cache_key
+        response_model: Model the cached payload is parsed into
+
+    Returns:
+        The cached result, or None on a miss
+    """
+    if not settings.OCR_CACHE_ENABLED:
+        return None
+    return _get_entry(session, cache_model.OcrCacheEntry, key, settings.OCR_CACHE_MAX_AGE_DAYS, response_model)
+
+
+def store_ocr(session: Any, key: str, result: BaseModel, model_name: str, prompt_version: str) -> None:
+    """
+    Save an OCR result in the cache, replacing any previous entry.
+
+    Args:
+        session: Database session
+        key: Cache key from ocr_cache_key
+        result: OCR result to store
+        model_name: OCR model name
+        prompt_version: Version of the OCR prompt
+    """
+    if not settings.OCR_CACHE_ENABLED:
+        return
+
+    _upsert_entry(
+        session, cache_model.OcrCacheEntry, key, result,
+        model_name=model_name, prompt_version=prompt_version,
+    )
+    if next(_ocr_writes) % EVICTION_INTERVAL == 0:
+        evict_ocr_cache(session)
+
+
+def evict_ocr_cache(
+    session: Any,
+    max_bytes: int = settings.OCR_CACHE_MAX_BYTES,
+    max_age_days: int = settings.OCR_CACHE_MAX_AGE_DAYS
+) -> int:
+    """
+    Remove expired OCR entries, then least recently used ones until the cache fits `max_bytes`.
+
+    Args:
+        session: Database session
+        max_bytes: Maximum total payload size to keep
+        max_age_days: Maximum entry age in days
+
+    Returns:
+        int: Number of entries removed
+    """
+    return _evict(session, cache_model.OcrCacheEntry, max_bytes, max_age_days)
+
+
+def evaluation_cache_key(
+    prompt_prefix: str,
+    exam_text: str,
+    retrieved_exam: str,
+    model_name: str,
+    prompt_version: str
+) -> str:
+    """
+    Build the evaluation cache key for one scoring request.
+
+    Args:
+        prompt_prefix: The task's compiled system prompt (rubric, instruction and example evaluation)
+        exam_text: The extracted exam text being scored
+        retrieved_exam: The few-shot examples block
+        model_name: Scoring model name
+        prompt_version: Version of the scoring prompt layout
+
+    Returns:
+        str: Cache key
+    """
+    return hash_parts(
+        model_name,
+        prompt_version,
+        prompt_prefix,
+        retrieved_exam,
+        exam_text,
+    )
+
+
+def get_cached_evaluation(session: Any, key: str, response_model: Type[ResponseModel]) -> Optional[ResponseModel]:
+    """
+    Look up a cached evaluation result.
+
+    Args:
+        session: Database session
+        key: Cache key from evaluation_cache_key
+        response_model: Model the cached payload is parsed into
+
+    Returns:
+        The cached result, or None on a miss
+    """
+    if not settings.EVALUATION_CACHE_ENABLED:
+        return None
+    return _get_entry(
+        session, cache_model.EvaluationCacheEntry, key, settings.EVALUATION_CACHE_MAX_AGE_DAYS, response_model
+    )
+
+
+def store_evaluation(session: Any, key: str, task_id: int, result: BaseModel, model_name: str) -> None:
+    """
+    Save an evaluation result in the cache, replacing any previous entry.
+
+    Args:
+        session: Database session
+        key: Cache key from evaluation_cache_key
+        task_id: ID of the task the result was graded against
+        result: Evaluation result to store
+        model_name: Scoring model name
+    """
+    if not settings.EVALUATION_CACHE_ENABLED:
+        return
+
+    _upsert_entry(
+        session, cache_model.EvaluationCacheEntry, key, result,
+        task_id=task_id, model_name=model_name,
+    )
+    if next(_evaluation_writes) % EVICTION_INTERVAL == 0:
+        evict_evaluation_cache(session)
+
+
+def evict_evaluation_cache(
+    session: Any,
+    max_bytes: int = settings.EVALUATION_CACHE_MAX_BYTES,
+    max_age_days: int = settings.EVALUATION_CACHE_MAX_AGE_DAYS
+) -> int:
+    """
+    Remove expired evaluation entries, then least recently used ones until the cache fits `max_bytes`.
+
+    Args:
+        session: Database session
+        max_bytes: Maximum total payload size to keep
+        max_age_days: Maximum entry age in days
+
+    Returns:
+        int: Number of entries removed
+    """
+    return _evict(session, cache_model.EvaluationCacheEntry, max_bytes, max_age_days)
+
+
+def invalidate_task_evaluations(session: Any, task_id: int) -> int:
+    """
+    Drop every cached evaluation graded against a task.
+
+    Args:
+        session: Database session
+        task_id: ID of the task that changed
+
+    Returns:
+        int: Number of entries removed
+    """
+    removed = session.execute(
+        delete(cache_model.EvaluationCacheEntry).where(cache_model.EvaluationCacheEntry.task_id == task_id)
+    ).rowcount
+    session.commit()
+
+    if removed:
+        logger.info(f"Invalidated {removed} cached evaluations for task {task_id}")
+    return removed
@@ -0,0 +1,273 @@
+import logging
+from datetime import datetime, timedelta
+from typing import Any, List, Optional
+
+from sqlmodel import select
+
+from ..core.config import settings
+from ..models import exam_model, job_model
+from ..schemas import exam_schema, job_schema
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Constants
+MAX_ERROR_LENGTH = 2000  # Characters of the last error kept on a job
+
+
+def enqueue_evaluation_jobs(
+    session: Any,
+    project_id: int,
+    user_id: int,
+    exam_ids: List[int],
+    evaluation_type: exam_schema.EvaluationTypeEnum = exam_schema.EvaluationTypeEnum.full,
+    force_refresh: bool = False
+) -> List[job_model.EvaluationJob]:
+    """
+    Add evaluation jobs for a set of exams to the durable queue.
+
+    Exams that already have a queued job are not queued twice; the queued
+    job takes the new evaluation type instead, and bypasses the OCR cache if
+    either request asked for it.
+
+    Args:
+        session: Database session
+        project_id: ID of the project containing the exams
+        user_id: ID of the user to notify when the project is done
+        exam_ids: IDs of the exams to evaluate
+        evaluation_type: Type of evaluation to perform (full or ai_only)
+        force_refresh: Bypass cached OCR results
+
+    Returns:
+        List[EvaluationJob]: The newly queued jobs
+    """
+    if not exam_ids:
+        return []
+
+    queued_jobs = session.exec(
+        select(job_model.EvaluationJob)
+        .where(job_model.EvaluationJob.exam_id.in_(exam_ids))
+        .where(job_model.EvaluationJob.status == job_schema.JobStatusEnum.queued)
+        .with_for_update(skip_locked=True)
+    ).all()
+    now = datetime.now()
+    for queued_job in queued_jobs:
+        queued_job.evaluation_type = evaluation_type
+        queued_job.force_refresh = queued_job.force_refresh or force_refresh
+        queued_job.updated_at = now
+        session.add(queued_job)
+    already_queued = {queued_job.exam_id for queued_job in queued_jobs}
+
+    jobs = [
+        job_model.EvaluationJob(
+            exam_id=exam_id,
+            project_id=project_id,
+            user_id=user_id,
+            evaluation_type=evaluation_type,
+            force_refresh=force_refresh,
+        )
+        for exam_id in exam_ids
+        if exam_id not in already_queued
+    ]
+    session.add_all(jobs)
+    session.commit()
+
+    logger.info(f"Queued {len(jobs)} evaluation jobs for project {project_id}")
+    return jobs
+
+
+def claim_jobs(session: Any, worker_id: str, limit: int) -> List[job_model.EvaluationJob]:
+    """
+    Claim up to `limit` queued jobs for a worker.
+
+    Rows are locked with SELECT ... FOR UPDATE SKIP LOCKED so concurrent
+    workers never claim the same job and never wait on each other.
+
+    Args:
+        session: Database session
+        worker_id: Identifier of the claiming worker
+        limit: Maximum number of jobs to claim
+
+    Returns:
+        List[EvaluationJob]: The claimed jobs, now marked as running
+    """
+    if limit <= 0:
+        return []
+
+    jobs = session.exec(
+        select(job_model.EvaluationJob)
+        .where(job_model.EvaluationJob.status == job_schema.JobStatusEnum.queued)
+        .order_by(job_model.EvaluationJob.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    ).all()
+
+    now = datetime.now()
+    for job in jobs:
+        job.status = job_schema.JobStatusEnum.running
+        job.worker_id = worker_id
+        job.locked_at = now
+        job.updated_at = now
+        job.attempts += 1
+        session.add(job)
+    session.commit()
+
+    for job in jobs:
+        session.refresh(job)
+    return list(jobs)
+
+
+def renew_lease(session: Any, job_id: int, worker_id: str) -> bool:
+    """
+    Refresh the lock of a running job so requeue_stale_jobs leaves it alone.
+
+    Args:
+        session: Database session
+        job_id: ID of the job
+        worker_id: Identifier of the worker holding the job
+
+    Returns:
+        bool: False if the job is no longer held by this worker
+    """
+    job = session.get(job_model.EvaluationJob, job_id)
+    if not job or job.status != job_schema.JobStatusEnum.running or job.worker_id != worker_id:
+        return False
+
+    job.locked_at = datetime.now()
+    session.add(job)
+    session.commit()
+    return True
+
+
+def finish_job(session: Any, job_id: int, success: bool, error: Optional[str] = None) -> None:
+    """
+    Mark a claimed job as done or failed.
+
+    Args:
+        session: Database session
+        job_id: ID of the job
+        success: Whether the evaluation succeeded
+        error: Error message to record on failure
+    """
+    job = session.get(job_model.EvaluationJob, job_id)
+    if not job:
+        return
+
+    job.status = job_schema.JobStatusEnum.done if success else job_schema.JobStatusEnum.failed
+    job.last_error = error[:MAX_ERROR_LENGTH] if error else None
+    job.worker_id = None
+    job.locked_at = None
+    job.updated_at = datetime.now()
+    session.add(job)
+    session.commit()
+
+
+def requeue_stale_jobs(session: Any, timeout: int = settings.JOB_LOCK_TIMEOUT) -> int:
+    """
+    Return jobs held by workers that died mid-evaluation to the queue.
+
+    Live workers renew the lock of their running jobs every
+    JOB_HEARTBEAT_INTERVAL seconds, so only jobs whose worker stopped doing
+    so are taken back, however long the evaluation itself takes.
+
+    Jobs that already used all their attempts are marked as failed along
+    with their exam.
+
+    Args:
+        session: Database session
+        timeout: Seconds without a lease renewal after which a running job is considered abandoned
+
+    Returns:
+        int: Number of jobs requeued or failed
+    """
+    cutoff = datetime.now() - timedelta(seconds=timeout)
+    stale_jobs = session.exec(
+        select(job_model.EvaluationJob)
+        .where(job_model.EvaluationJob.status == job_schema.JobStatusEnum.running)
+        .where(job_model.EvaluationJob.locked_at < cutoff)
+        .with_for_update(skip_locked=True)
+    ).all()
+
+    for job in stale_jobs:
+        exam = session.get(exam_model.Exam, job.exam_id)
+        exhausted = job.attempts >= settings.JOB_MAX_ATTEMPTS
+
+        job.status = job_schema.JobStatusEnum.failed if exhausted else job_schema.JobStatusEnum.queued
+        job.last_error = f"Worker {job.worker_id} did not renew its lease within {timeout} seconds"
+        job.worker_id = None
+        job.locked_at = None
+        job.updated_at = datetime.now()
+        session.add(job)
+
+        # The exam was left in processing by the dead worker
+        if exam and exam.status == exam_schema.StatusEnum.processing:
+            exam.status = exam_schema.StatusEnum.failed if exhausted else exam_schema.StatusEnum.pending
+            session.add(exam)
+
+    session.commit()
+
+    if stale_jobs:
+        logger.warning(f"Recovered {len(stale_jobs)} stale evaluation jobs")
+    return len(stale_jobs)
+
+
+def has_open_jobs(session: Any, project_id: int) -> bool:
+    """
+    Check whether a project still has queued or running evaluation jobs.
+
+    Args:
+        session: Database session
+        project_id: ID of the project
+
+    Returns:
+        bool: True if any job for the project is still open
+    """
+    open_job = session.exec(
+        select(job_model.EvaluationJob.id)
+        .where(job_model.EvaluationJob.project_id == project_id)
+        .where(job_model.EvaluationJob.status.in_([
+            job_schema.JobStatusEnum.queued,
+            job_schema.JobStatusEnum.running,
+        ]))
+        .limit(1)
+    ).first()
+    return open_job is not None
+
+
+def withdraw_queued_jobs(session: Any, exam_ids: List[int]) -> List[int]:
+    """
+    Remove the queued evaluation jobs of a set of exams from the queue.
+
+    Jobs a worker is claiming at the same moment are skipped, as are
+    running ones. Changes are not committed; the caller commits them
+    together with whatever takes over the exams.
+
+    Args:
+        session: Database session
+        exam_ids: IDs of the exams
+
+    Returns:
+        List[int]: IDs of the exams that still have an open job
+    """
+    if not exam_ids:
+        return []
+
+    jobs = session.exec(
+        select(job_model.EvaluationJob)
+        .where(job_model.EvaluationJob.exam_id.in_(exam_ids))
+        .where(job_model.EvaluationJob.status == job_schema.JobStatusEnum.queued)
+        .with_for_update(skip_locked=True)
+    ).all()
+    for job in jobs:
+        session.delete(job)
+    session.flush()
+
+    # Whatever is left is running, or being claimed by a worker right now
+    return list(set(session.exec(
+        select(job_model.EvaluationJob.exam_id)
+        .where(job_model.EvaluationJob.exam_id.in_(exam_ids))
+        .where(job_model.EvaluationJob.status.in_([
+            job_schema.JobStatusEnum.queued,
+            job_schema.JobStatusEnum.running,
+        ]))
+    ).all()))
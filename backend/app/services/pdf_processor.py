@@ -1,114 +1,304 @@
+import asyncio
 import io
 import logging
-from typing import List, Tuple
-from PIL import Image, ImageFilter
-import numpy as np
+import multiprocessing
+import os
+import shutil
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import AsyncIterator, List, NamedTuple, Optional, Tuple
+from PIL import Image
 import pymupdf
-from fastapi import HTTPException, status
+from fastapi import HTTPException, UploadFile, status
+
+from ..core.config import settings
+from . import token_counter
+from .image_preprocessing import preprocess_image
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
-def preprocess_image(image_pil: Image.Image) -> Image.Image:
-    """Preprocess Image to remove red marks, enhance text for OCR."""
+# Constants
+RENDER_DPI = 300  # Highest resolution pages are rasterized at
+PAGES_PER_TASK = 4  # Consecutive pages rendered by one pool task when collecting a whole PDF
+SPOOL_CHUNK_SIZE = 1024 * 1024  # Bytes copied at a time when spooling uploads to disk
+PAGE_CONTENT_TYPE = "image/png"  # Binarized pages are stored as 1-bit PNG
 
-    x = image_pil.copy()
+_render_pool: Optional[ProcessPoolExecutor] = None
 
-    # Convert the image to an RGB array for color manipulation
-    x = np.array(x)
 
-    # Normalize each channel to follow a normal distribution
-    for i in range(3):  # Iterate over R, G, B channels
-        channel = x[:, :, i]
-        mean = np.mean(channel)
-        std = np.std(channel)
-        if std > 0:  # Avoid division by zero
-            x[:, :, i] = (channel - mean) / std  # Standard normal distribution
+class RasterProfile(NamedTuple):
+    dpi: int
+    grayscale: bool
+    # Pages are scaled down until both edges fit; None leaves that edge unbounded
+    max_long_edge: Optional[int]
+    max_short_edge: Optional[int]
 
-    # Scale normalized values back to 0-255 range
-    x = np.clip((x - x.min()) / (x.max() - x.min()) * 255, 0, 255).astype(np.uint8)
 
-    # Convert back to PIL image
-    # Ensure the data type is uint8 before converting back to PIL Image
-    x = x.astype(np.uint8)
-    x = Image.fromarray(x)
+LEGACY_RASTER_PROFILE = RasterProfile(dpi=RENDER_DPI, grayscale=False, max_long_edge=None, max_short_edge=None)
 
-    # Convert to grayscale to reduce complexity and enhance text contrast
-    x = x.convert("L")
 
-    # Apply binary thresholding to make text stand out (binarization)
-    x = x.point(lambda x: 0 if x < 128 else 255, '1')
+def raster_profile(model_name: str = settings.OCR_MODEL_NAME, profile_name: str = settings.PDF_RASTER_PROFILE) -> RasterProfile:
+    """
+    Choose how pages are rasterized for the OCR model.
+    
+    Vision models with known tiling rules fit every image into a bounded
+    square and then shrink its short side, so pixels beyond that size are
+    never seen but still cost memory, upload time and preprocessing. Pages
+    for those models are rendered in grayscale straight at that size.
+    
+    Args:
+        model_name: The OCR model the pages are rendered for
+        profile_name: "model" to render at the model's size, "legacy" for RGB at 300 DPI
+        
+    Returns:
+        RasterProfile: Rasterization settings
+    """
+    if profile_name == 'legacy' or model_name not in token_counter.IMAGE_TOKEN_COSTS:
+        return LEGACY_RASTER_PROFILE
+    
+    return RasterProfile(
+        dpi=RENDER_DPI,
+        grayscale=True,
+        max_long_edge=token_counter.IMAGE_MAX_LONG_EDGE,
+        max_short_edge=token_counter.IMAGE_MAX_SHORT_EDGE,
+    )
 
-    # Invert colors (flip black and white)
-    x = x.point(lambda val: 255 - val)
 
-    # Apply noise reduction filter
-    x = x.filter(ImageFilter.MedianFilter(size=3))
+def page_scale(page_rect: pymupdf.Rect, profile: RasterProfile) -> float:
+    """Zoom factor that renders a page at the profile's DPI without exceeding its edge limits."""
+    scale = profile.dpi / 72
+    long_side, short_side = max(page_rect.width, page_rect.height), min(page_rect.width, page_rect.height)
+    if profile.max_long_edge:
+        scale = min(scale, profile.max_long_edge / long_side)
+    if profile.max_short_edge:
+        scale = min(scale, profile.max_short_edge / short_side)
+    return scale
 
-    return x
 
-async def process_pdf(pdf_file: io.BytesIO) -> List[Tuple[int, bytes]]:
+def encode_page(image: Image.Image) -> bytes:
     """
-    Process a PDF file and convert each page to an optimized image.
+    Encode a binarized page for storage.
+    
+    A 1-bit PNG is lossless and several times smaller than a JPEG of the
+    same page, which blurs text edges and stores 8 bits per pixel.
     
     Args:
-        pdf_file: PDF file as BytesIO object
+        image: The preprocessed page
         
     Returns:
-        List of tuples containing (page_number, image_bytes)
-        
-    Raises:
-        HTTPException: If PDF processing fails
+        bytes: The PNG file
     """
-    try:
-        # Open PDF document
-        doc = pymupdf.open(stream=pdf_file.read(), filetype="pdf")
-        
-        if doc.page_count == 0:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="PDF file is empty"
-            )
-        
-        processed_pages = []
+    buffer = io.BytesIO()
+    if image.mode != "1":
+        image = image.convert("1")
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def render_page_range(
+    pdf_path: str,
+    start: int,
+    stop: int,
+    profile: RasterProfile = LEGACY_RASTER_PROFILE
+) -> List[Tuple[int, bytes]]:
+    """
+    Rasterize, preprocess and PNG-encode a range of PDF pages.
+    
+    Runs in a render pool process, which opens its own handle on the document.
+    
+    Args:
+        pdf_path: Path of the PDF file
+        start: Index of the first page to render
+        stop: Index after the last page to render
+        profile: Resolution and colorspace to render at
         
-        # Process each page
-        for page_num in range(doc.page_count):
+    Returns:
+        List of tuples containing (page_number, image_bytes)
+    """
+    rendered_pages = []
+    with pymupdf.open(pdf_path) as doc:
+        for page_num in range(start, stop):
             try:
                 # Get page
                 page = doc[page_num]
                 
-                # Convert page to image with high resolution
-                pix = page.get_pixmap(matrix=pymupdf.Matrix(300/72, 300/72))  # 300 DPI
+                # Convert page to image at the profile's resolution
+                scale = page_scale(page.rect, profile)
+                pix = page.get_pixmap(
+                    matrix=pymupdf.Matrix(scale, scale),
+                    colorspace=pymupdf.csGRAY if profile.grayscale else pymupdf.csRGB
+                )
                 
                 # Convert to PIL Image
-                img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
+                img = Image.frombytes("L" if profile.grayscale else "RGB", [pix.width, pix.height], pix.samples)
                 
                 # Preprocess the image
-                processed_img = preprocess_image(img)
+                processed_img = preprocess_image(img, gray_as_color=profile.grayscale)
                 
-                # Convert to bytes
-                img_byte_arr = io.BytesIO()
-                processed_img.save(img_byte_arr, format='JPEG', quality=95, optimize=True)
-                img_byte_arr = img_byte_arr.getvalue()
-                
-                processed_pages.append((page_num + 1, img_byte_arr))
+                rendered_pages.append((page_num + 1, encode_page(processed_img)))
                 
             except Exception as e:
-                logger.error(f"Failed to process page {page_num + 1}: {str(e)}")
-                raise HTTPException(
-                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                    detail=f"Failed to process page {page_num + 1}: {str(e)}"
-                )
+                raise RuntimeError(f"Failed to process page {page_num + 1}: {str(e)}") from e
+    
+    return rendered_pages
+
+
+def page_ranges(page_count: int, pages_per_task: int = PAGES_PER_TASK) -> List[Tuple[int, int]]:
+    """Split a document into consecutive (start, stop) page ranges."""
+    return [(start, min(start + pages_per_task, page_count)) for start in range(0, page_count, pages_per_task)]
+
+
+def get_render_pool() -> Optional[ProcessPoolExecutor]:
+    """
+    Get the shared PDF render pool, starting it on first use.
+    
+    Returns:
+        ProcessPoolExecutor, or None if PDF_RENDER_WORKERS is 0
+    """
+    global _render_pool
+    if _render_pool is None and settings.PDF_RENDER_WORKERS > 0:
+        # Spawned workers do not inherit the API process's threads and connections
+        _render_pool = ProcessPoolExecutor(
+            max_workers=settings.PDF_RENDER_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _render_pool
+
+
+def shutdown_render_pool() -> None:
+    """Stop the render pool processes."""
+    global _render_pool
+    if _render_pool is not None:
+        _render_pool.shutdown(cancel_futures=True)
+        _render_pool = None
+
+
+async def spool_upload(upload: UploadFile) -> str:
+    """
+    Copy an uploaded file to a temp file on disk in fixed-size chunks.
+    
+    Args:
+        upload: The uploaded file
         
-        return processed_pages
+    Returns:
+        str: Path of the temp file; the caller removes it
+    """
+    await upload.seek(0)
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as temp_file:
+        await asyncio.to_thread(shutil.copyfileobj, upload.file, temp_file, SPOOL_CHUNK_SIZE)
+        return temp_file.name
+
+
+def count_pdf_pages(pdf_path: str) -> int:
+    """
+    Count the pages of a PDF file.
+    
+    Args:
+        pdf_path: Path of the PDF file
         
+    Returns:
+        int: Number of pages
+        
+    Raises:
+        HTTPException: If the file is not a readable PDF or has no pages
+    """
+    try:
+        with pymupdf.open(pdf_path) as doc:
+            page_count = doc.page_count
     except Exception as e:
-        logger.error(f"Failed to process PDF: {str(e)}")
+        logger.error(f"Failed to open PDF: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to process PDF: {str(e)}"
         )
+    
+    if page_count == 0:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="PDF file is empty"
+        )
+    return page_count
+
+
+async def iter_pdf_pages(
+    pdf_path: str,
+    page_count: int,
+    pages_per_task: int = 1
+) -> AsyncIterator[Tuple[int, bytes]]:
+    """
+    Render the pages of a PDF file, yielding each one in page order as soon as it is ready.
+    
+    At most one render task per pool worker is in flight, so only a handful
+    of pages are held in memory however long the document is.
+    
+    Args:
+        pdf_path: Path of the PDF file
+        page_count: Number of pages in the document
+        pages_per_task: Consecutive pages rendered by one pool task
+        
+    Yields:
+        Tuples of (page_number, image_bytes)
+        
+    Raises:
+        HTTPException: If a page fails to render
+    """
+    pool = get_render_pool()
+    profile = raster_profile()
+    ranges = deque(page_ranges(page_count, pages_per_task))
+    in_flight: deque = deque()
+    loop = asyncio.get_running_loop()
+    
+    try:
+        while ranges or in_flight:
+            while ranges and len(in_flight) < max(1, settings.PDF_RENDER_WORKERS):
+                start, stop = ranges.popleft()
+                if pool is None:
+                    in_flight.append(asyncio.ensure_future(asyncio.to_thread(render_page_range, pdf_path, start, stop, profile)))
+                else:
+                    in_flight.append(loop.run_in_executor(pool, render_page_range, pdf_path, start, stop, profile))
+            
+            try:
+                rendered_pages = await in_flight.popleft()
+            except Exception as e:
+                logger.error(f"Failed to process PDF: {str(e)}")
+                raise HTTPException(
+                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    detail=f"Failed to process PDF: {str(e)}"
+                )
+            
+            for page in rendered_pages:
+                yield page
+    finally:
+        for future in in_flight:
+            future.cancel()
+
+
+async def process_pdf(pdf_file: io.BytesIO) -> List[Tuple[int, bytes]]:
+    """
+    Process a PDF file and convert each page to an optimized image.
+    
+    Pages are rendered in a pool of processes so large scans neither block
+    the event loop nor run on a single core. Prefer spool_upload and
+    iter_pdf_pages for uploads, which do not hold the whole document in memory.
+    
+    Args:
+        pdf_file: PDF file as BytesIO object
+        
+    Returns:
+        List of tuples containing (page_number, image_bytes)
+        
+    Raises:
+        HTTPException: If PDF processing fails
+    """
+    # Render workers open the document from a temp file instead of receiving its bytes
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as temp_file:
+        temp_file.write(pdf_file.read())
+        pdf_path = temp_file.name
+    
+    try:
+        page_count = count_pdf_pages(pdf_path)
+        return [page async for page in iter_pdf_pages(pdf_path, page_count, PAGES_PER_TASK)]
     finally:
-        if 'doc' in locals():
-            doc.close() 
\ No newline at end of file
+        os.remove(pdf_path)
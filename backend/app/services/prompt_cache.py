@@ -0,0 +1,149 @@
+import logging
+from textwrap import dedent
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlmodel import select
+
+from ..models import task_model
+from .inference_cache import hash_parts
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Constants
+STATS_LOG_INTERVAL = 50  # Log prefix-hit statistics every N scoring requests
+
+
+class CompiledPrompt:
+    """
+    Scoring prompt template compiled once per task.
+
+    The system message holds only the task's rubric, instruction and example
+    evaluation, so it is byte-identical for every exam of the task and the
+    provider can serve it from its prompt cache. Per-exam material (few-shot
+    examples and the exam text) goes at the end, in the user message.
+    """
+
+    def __init__(self, task: task_model.Task):
+        self.task_id = task.id
+        self.updated_at = task.updated_at
+        self.system_prompt = dedent(f"""
+            {task.rubrics}
+            {task.student_instruction}
+            {task.example_evaluation}
+        """)
+        self.prefix_hash = hash_parts(self.system_prompt)
+
+    def build_messages(self, retrieved_exam: str, exam_text: str) -> List[Dict[str, Any]]:
+        """
+        Build the chat messages for scoring one exam.
+
+        Args:
+            retrieved_exam: Few-shot examples block
+            exam_text: The extracted exam text
+
+        Returns:
+            List of chat messages
+        """
+        content = f"Exam to evaluate:\n{exam_text}"
+        if retrieved_exam:
+            content = f"Graded example exams, for reference only:\n{retrieved_exam}\n\n{content}"
+        return [
+            {"role": "system", "content": self.system_prompt},
+            {"role": "user", "content": content},
+        ]
+
+
+_compiled: Dict[int, CompiledPrompt] = {}
+_stats = {
+    "template_hits": 0,
+    "template_misses": 0,
+    "requests": 0,
+    "prompt_tokens": 0,
+    "cached_tokens": 0,
+}
+
+
+def get_compiled_prompt(session: Any, task_id: int) -> Optional[CompiledPrompt]:
+    """
+    Get the compiled scoring prompt of a task, compiling it on first use.
+
+    Templates are kept in process and keyed on the task's updated_at, so
+    only that column is read per call and an edit made by any process
+    recompiles the template.
+
+    Args:
+        session: Database session
+        task_id: ID of the task
+
+    Returns:
+        CompiledPrompt: The compiled prompt, or None if the task does not exist
+    """
+    row = session.exec(
+        select(task_model.Task.id, task_model.Task.updated_at).where(task_model.Task.id == task_id)
+    ).first()
+    if not row:
+        _compiled.pop(task_id, None)
+        return None
+
+    compiled = _compiled.get(task_id)
+    if compiled and compiled.updated_at == row.updated_at:
+        _stats["template_hits"] += 1
+        return compiled
+
+    # Reload the row even if the session already holds the task, so edits committed elsewhere are seen
+    task = session.get(task_model.Task, task_id, populate_existing=True)
+    if not task:
+        _compiled.pop(task_id, None)
+        return None
+
+    _stats["template_misses"] += 1
+    compiled = CompiledPrompt(task)
+    _compiled[task_id] = compiled
+    return compiled
+
+
+def record_usage(usage: Any) -> None:
+    """
+    Record how much of a scoring request's prompt the provider served from its cache.
+
+    Args:
+        usage: Usage object of a chat completion
+    """
+    if usage is None:
+        return
+
+    details = getattr(usage, "prompt_tokens_details", None)
+    _stats["requests"] += 1
+    _stats["prompt_tokens"] += usage.prompt_tokens or 0
+    _stats["cached_tokens"] += (getattr(details, "cached_tokens", None) or 0)
+
+    if _stats["requests"] % STATS_LOG_INTERVAL == 0:
+        hit_rate, cached_ratio = _rates()
+        logger.info(
+            f"Prompt cache: {hit_rate:.1%} template hits, "
+            f"{cached_ratio:.1%} of {_stats['prompt_tokens']} prompt tokens served from the provider cache"
+        )
+
+
+def _rates() -> Tuple[float, float]:
+    lookups = _stats["template_hits"] + _stats["template_misses"]
+    hit_rate = _stats["template_hits"] / lookups if lookups else 0.0
+    cached_ratio = _stats["cached_tokens"] / _stats["prompt_tokens"] if _stats["prompt_tokens"] else 0.0
+    return hit_rate, cached_ratio
+
+
+def get_stats() -> Dict[str, Any]:
+    """
+    Get the prefix-hit statistics of this process.
+
+    Returns:
+        Dict with template hit/miss counts, provider cached token totals and their rates
+    """
+    hit_rate, cached_ratio = _rates()
+    return {
+        **_stats,
+        "compiled_tasks": len(_compiled),
+        "template_hit_rate": hit_rate,
+        "cached_token_ratio": cached_ratio,
+    }
@@ -0,0 +1,262 @@
+import asyncio
+import logging
+import threading
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Dict, Tuple
+
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlmodel import Session, select
+
+from ..core import database
+from ..core.config import settings
+from ..models.rate_limit_model import RateLimitBucket
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Constants
+REFILL_WINDOW = 60.0  # Budgets are expressed per minute
+MIN_WAIT = 0.05  # Shortest sleep between acquire attempts in seconds
+
+# Bucket key -> (amount to take, bucket capacity)
+BucketCosts = Dict[str, Tuple[float, float]]
+
+
+@dataclass(frozen=True)
+class ModelBudget:
+    """Requests-per-minute and tokens-per-minute budget for one model."""
+    requests_per_minute: int
+    tokens_per_minute: int
+
+
+def _refill(tokens: float, updated_at: float, capacity: float, now: float) -> float:
+    """Return the bucket level after refilling it for the time elapsed since `updated_at`."""
+    elapsed = max(0.0, now - updated_at)
+    return min(capacity, tokens + elapsed * capacity / REFILL_WINDOW)
+
+
+def _wait_time(level: float, amount: float, capacity: float) -> float:
+    """Return how long a bucket at `level` needs to refill before `amount` fits."""
+    if level >= amount:
+        return 0.0
+    return (amount - level) * REFILL_WINDOW / capacity
+
+
+class RateLimitBackend(ABC):
+    """
+    Storage for token-bucket state.
+
+    Implementations must take all buckets of one call atomically: either
+    every bucket has enough capacity and all are debited, or none is.
+    """
+
+    @abstractmethod
+    def try_acquire(self, costs: BucketCosts) -> float:
+        """
+        Try to take capacity from every bucket in `costs`.
+
+        Args:
+            costs: Mapping of bucket key to (amount, capacity)
+
+        Returns:
+            float: 0 if the capacity was taken, otherwise seconds to wait before retrying
+        """
+
+    @abstractmethod
+    def adjust(self, key: str, delta: float, capacity: float) -> None:
+        """
+        Add `delta` to a bucket (negative values take capacity away).
+
+        Args:
+            key: Bucket key
+            delta: Amount to give back or take
+            capacity: Bucket capacity
+        """
+
+
+class LocalRateLimitBackend(RateLimitBackend):
+    """In-process buckets for a single worker."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+
+    def _level(self, key: str, capacity: float, now: float) -> float:
+        tokens, updated_at = self._buckets.get(key, (capacity, now))
+        return _refill(tokens, updated_at, capacity, now)
+
+    def try_acquire(self, costs: BucketCosts) -> float:
+        with self._lock:
+            now = time.monotonic()
+            levels = {key: self._level(key, capacity, now) for key, (_, capacity) in costs.items()}
+
+            wait = max(
+                _wait_time(levels[key], amount, capacity)
+                for key, (amount, capacity) in costs.items()
+            )
+            if wait > 0:
+                return wait
+
+            for key, (amount, _) in costs.items():
+                self._buckets[key] = (levels[key] - amount, now)
+            return 0.0
+
+    def adjust(self, key: str, delta: float, capacity: float) -> None:
+        with self._lock:
+            now = time.monotonic()
+            self._buckets[key] = (min(capacity, self._level(key, capacity, now) + delta), now)
+
+
+class PostgresRateLimitBackend(RateLimitBackend):
+    """
+    Buckets shared by every worker through the `rate_limit_buckets` table.
+
+    Rows are locked with SELECT ... FOR UPDATE in key order so concurrent
+    workers serialize on the same model without deadlocking.
+    """
+
+    def _lock_buckets(self, session: Session, costs: BucketCosts, now: float) -> Dict[str, RateLimitBucket]:
+        rows = {}
+        for key in sorted(costs):
+            _, capacity = costs[key]
+            session.execute(
+                pg_insert(RateLimitBucket)
+                .values(key=key, tokens=capacity, updated_at=now)
+                .on_conflict_do_nothing(index_elements=['key'])
+            )
+            rows[key] = session.exec(
+                select(RateLimitBucket)
+                .where(RateLimitBucket.key == key)
+                .with_for_update()
+            ).one()
+        return rows
+
+    def try_acquire(self, costs: BucketCosts) -> float:
+        with Session(database.engine) as session:
+            now = time.time()
+            rows = self._lock_buckets(session, costs, now)
+            levels = {
+                key: _refill(rows[key].tokens, rows[key].updated_at, capacity, now)
+                for key, (_, capacity) in costs.items()
+            }
+
+            wait = max(
+                _wait_time(levels[key], amount, capacity)
+                for key, (amount, capacity) in costs.items()
+            )
+            if wait > 0:
+                session.rollback()
+                return wait
+
+            for key, (amount, _) in costs.items():
+                rows[key].tokens = levels[key] - amount
+                rows[key].updated_at = now
+                session.add(rows[key])
+            session.commit()
+            return 0.0
+
+    def adjust(self, key: str, delta: float, capacity: float) -> None:
+        with Session(database.engine) as session:
+            now = time.time()
+            row = self._lock_buckets(session, {key: (0, capacity)}, now)[key]
+            row.tokens = min(capacity, _refill(row.tokens, row.updated_at, capacity, now) + delta)
+            row.updated_at = now
+            session.add(row)
+            session.commit()
+
+
+class RateLimiter:
+    """
+    Token-bucket limiter tracking separate request and token budgets per model.
+
+    Callers reserve an estimated token count before a request and reconcile
+    it with the usage reported by the response afterwards.
+    """
+
+    def __init__(self, backend: RateLimitBackend, budgets: Dict[str, ModelBudget]):
+        self.backend = backend
+        self.budgets = budgets
+
+    def _costs(self, model: str, tokens: int) -> BucketCosts:
+        budget = self.budgets[model]
+        # A single request larger than the whole budget would never fit; cap it
+        return {
+            f"{model}:requests": (1, budget.requests_per_minute),
+            f"{model}:tokens": (min(tokens, budget.tokens_per_minute), budget.tokens_per_minute),
+        }
+
+    async def acquire(self, model: str, tokens: int) -> None:
+        """
+        Wait until one request and `tokens` tokens are available for `model`.
+
+        Models without a configured budget are not throttled.
+
+        Args:
+            model: Model name
+            tokens: Estimated tokens the request will consume
+        """
+        if model not in self.budgets:
+            return
+
+        costs = self._costs(model, tokens)
+        while True:
+            wait = await asyncio.to_thread(self.backend.try_acquire, costs)
+            if wait <= 0:
+                return
+            logger.debug(f"Rate limit reached for {model}; waiting {wait:.2f} seconds")
+            await asyncio.sleep(max(wait, MIN_WAIT))
+
+    async def reconcile(self, model: str, estimated_tokens: int, actual_tokens: int) -> None:
+        """
+        Correct the token bucket once the real usage of a request is known.
+
+        Args:
+            model: Model name
+            estimated_tokens: Tokens reserved by `acquire`
+            actual_tokens: Total tokens reported by the response
+        """
+        if model not in self.budgets or actual_tokens is None:
+            return
+
+        budget = self.budgets[model]
+        reserved = min(estimated_tokens, budget.tokens_per_minute)
+        delta = reserved - actual_tokens
+        if delta:
+            await asyncio.to_thread(
+                self.backend.adjust, f"{model}:tokens", delta, budget.tokens_per_minute
+            )
+
+
+def build_rate_limiter() -> RateLimiter:
+    """
+    Create the rate limiter configured in settings.
+
+    Returns:
+        RateLimiter: Limiter with budgets for the OCR and scoring models
+    """
+    backends = {
+        'local': LocalRateLimitBackend,
+        'postgres': PostgresRateLimitBackend,
+    }
+    ocr_budget = ModelBudget(settings.OCR_MODEL_RPM, settings.OCR_MODEL_TPM)
+    scoring_budget = ModelBudget(settings.AI_MODEL_RPM, settings.AI_MODEL_TPM)
+    if settings.OCR_MODEL_NAME != settings.AI_MODEL_NAME:
+        budgets = {settings.OCR_MODEL_NAME: ocr_budget, settings.AI_MODEL_NAME: scoring_budget}
+    else:
+        # The provider counts both uses against one limit, so both budgets describe it; keep the stricter values
+        merged = ModelBudget(
+            min(ocr_budget.requests_per_minute, scoring_budget.requests_per_minute),
+            min(ocr_budget.tokens_per_minute, scoring_budget.tokens_per_minute),
+        )
+        budgets = {settings.AI_MODEL_NAME: merged}
+        logger.info(
+            f"OCR and scoring both use {settings.AI_MODEL_NAME}; sharing one budget of "
+            f"{merged.requests_per_minute} requests and {merged.tokens_per_minute} tokens per minute"
+        )
+    return RateLimiter(backends[settings.RATE_LIMIT_BACKEND](), budgets)
+
+
+# Shared limiter for all OpenAI calls in this process
+rate_limiter = build_rate_limiter()
@@ -0,0 +1,154 @@
+import logging
+from datetime import datetime, timedelta
+from typing import Any, List
+
+from sqlalchemy import or_
+from sqlmodel import Session, select
+
+from ..core import database
+from ..core.config import settings
+from ..models import job_model
+from ..schemas import job_schema
+from . import aws_s3
+from .job_queue import MAX_ERROR_LENGTH
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Constants
+PURGES_PER_POLL = 4  # Purge jobs claimed by one worker per poll
+
+
+def enqueue_project_purge(session: Any, user_id: int, project_id: int) -> job_model.StoragePurgeJob:
+    """
+    Queue the removal of a project's exam images from S3.
+
+    The job is added to the session without committing, so it is saved in
+    the same transaction that deletes the project rows.
+
+    Args:
+        session: Database session
+        user_id: ID of the user who owned the project
+        project_id: ID of the project
+
+    Returns:
+        StoragePurgeJob: The queued job
+    """
+    job = job_model.StoragePurgeJob(
+        prefix=aws_s3.project_prefix(user_id, project_id),
+        project_id=project_id,
+        user_id=user_id,
+    )
+    session.add(job)
+    return job
+
+
+def claim_purge_jobs(session: Any, worker_id: str, limit: int = PURGES_PER_POLL) -> List[job_model.StoragePurgeJob]:
+    """
+    Claim queued purge jobs, and running ones abandoned by a dead worker.
+
+    Args:
+        session: Database session
+        worker_id: Identifier of the claiming worker
+        limit: Maximum number of jobs to claim
+
+    Returns:
+        List[StoragePurgeJob]: The claimed jobs, now marked as running
+    """
+    cutoff = datetime.now() - timedelta(seconds=settings.PURGE_LOCK_TIMEOUT)
+    jobs = session.exec(
+        select(job_model.StoragePurgeJob)
+        .where(or_(
+            job_model.StoragePurgeJob.status == job_schema.JobStatusEnum.queued,
+            (job_model.StoragePurgeJob.status == job_schema.JobStatusEnum.running)
+            & (job_model.StoragePurgeJob.locked_at < cutoff),
+        ))
+        .order_by(job_model.StoragePurgeJob.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    ).all()
+
+    now = datetime.now()
+    for job in jobs:
+        job.status = job_schema.JobStatusEnum.running
+        job.worker_id = worker_id
+        job.locked_at = now
+        job.updated_at = now
+        job.attempts += 1
+        session.add(job)
+    session.commit()
+
+    for job in jobs:
+        session.refresh(job)
+    return list(jobs)
+
+
+async def run_purge_job(job_id: int) -> bool:
+    """
+    Delete every object under a purge job's prefix, then confirm none remain.
+
+    A failed purge is queued again until it has used JOB_MAX_ATTEMPTS.
+    Deleting is idempotent, so a retry simply continues where the last
+    attempt stopped.
+
+    Args:
+        job_id: ID of the claimed job
+
+    Returns:
+        bool: True if the prefix is empty
+    """
+    with Session(database.engine) as session:
+        job = session.get(job_model.StoragePurgeJob, job_id)
+        if not job:
+            return False
+        prefix = job.prefix
+
+    error = None
+    deleted = 0
+    try:
+        deleted = await aws_s3.delete_prefix(prefix)
+        if not await aws_s3.prefix_is_empty(prefix):
+            error = f"Objects remain under {prefix} after deletion"
+    except Exception as e:
+        error = str(e)
+
+    with Session(database.engine) as session:
+        job = session.get(job_model.StoragePurgeJob, job_id)
+        job.deleted_objects += deleted
+        job.worker_id = None
+        job.locked_at = None
+        job.updated_at = datetime.now()
+        job.last_error = error[:MAX_ERROR_LENGTH] if error else None
+
+        if error is None:
+            job.status = job_schema.JobStatusEnum.done
+            logger.info(f"Purged {job.deleted_objects} objects of project {job.project_id}")
+        elif job.attempts >= settings.JOB_MAX_ATTEMPTS:
+            job.status = job_schema.JobStatusEnum.failed
+            logger.error(f"Giving up purging {prefix}: {error}")
+        else:
+            job.status = job_schema.JobStatusEnum.queued
+            logger.warning(f"Purge of {prefix} failed, will retry: {error}")
+
+        session.add(job)
+        session.commit()
+
+    return error is None
+
+
+async def advance_purge_jobs(worker_id: str) -> int:
+    """
+    Claim and run the pending storage purge jobs.
+
+    Args:
+        worker_id: Identifier of this worker
+
+    Returns:
+        int: Number of jobs run
+    """
+    with Session(database.engine) as session:
+        job_ids = [job.id for job in claim_purge_jobs(session, worker_id)]
+
+    for job_id in job_ids:
+        await run_purge_job(job_id)
+    return len(job_ids)
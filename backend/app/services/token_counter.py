@@ -0,0 +1,192 @@
+import base64
+import json
+import logging
+import math
+import struct
+from functools import lru_cache
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+import tiktoken
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Constants
+DEFAULT_ENCODING = "o200k_base"  # Tokenizer used by the gpt-4o family
+MESSAGE_OVERHEAD_TOKENS = 4  # Role and separator tokens added per chat message
+REPLY_PRIMER_TOKENS = 3  # Tokens that prime the assistant reply
+DEFAULT_COMPLETION_TOKENS = 1024  # Expected output size when max_tokens is not set
+CHARS_PER_TOKEN = 4  # Rough ratio used when the tokenizer files are unavailable
+
+# Vision tiling rules: images are fit into a 2048px square, the short side is
+# scaled down to 768px, and the result is billed per 512px tile.
+IMAGE_MAX_LONG_EDGE = 2048
+IMAGE_MAX_SHORT_EDGE = 768
+IMAGE_TILE_SIZE = 512
+IMAGE_LOW_DETAIL_SIZE = 512
+
+# (base tokens, tokens per tile) for each vision model
+IMAGE_TOKEN_COSTS: Dict[str, Tuple[int, int]] = {
+    "gpt-4o": (85, 170),
+    "gpt-4o-mini": (2833, 5667),
+}
+DEFAULT_IMAGE_TOKEN_COST = IMAGE_TOKEN_COSTS["gpt-4o"]
+
+# Fallback size (A4 page at the model's working resolution) when the image
+# dimensions cannot be read from the payload
+DEFAULT_IMAGE_SIZE = (768, 1086)
+
+
+@lru_cache(maxsize=None)
+def _get_encoding(model: str) -> Optional[tiktoken.Encoding]:
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding(DEFAULT_ENCODING)
+    except Exception as e:
+        # tiktoken downloads its vocabulary on first use; fall back to a heuristic offline
+        logger.warning(f"Tokenizer for {model} unavailable, approximating token counts: {str(e)}")
+        return None
+
+
+def count_text_tokens(text: str, model: str) -> int:
+    """
+    Count the tokens of a piece of text with the model's local tokenizer.
+
+    Args:
+        text: Text to count
+        model: Model name used to pick the tokenizer
+
+    Returns:
+        int: Number of tokens
+    """
+    if not text:
+        return 0
+
+    encoding = _get_encoding(model)
+    if encoding is None:
+        return math.ceil(len(text) / CHARS_PER_TOKEN)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_text_tokens(text: str, max_tokens: int, model: str) -> str:
+    """
+    Cut a piece of text down to at most max_tokens tokens.
+
+    Args:
+        text: Text to cut
+        max_tokens: Maximum number of tokens to keep
+        model: Model name used to pick the tokenizer
+
+    Returns:
+        str: The text itself if it fits, otherwise its leading tokens
+    """
+    if max_tokens <= 0:
+        return ""
+
+    encoding = _get_encoding(model)
+    if encoding is None:
+        return text[:max_tokens * CHARS_PER_TOKEN]
+    tokens = encoding.encode(text, disallowed_special=())
+    return text if len(tokens) <= max_tokens else encoding.decode(tokens[:max_tokens])
+
+
+def fit_image_to_tiles(width: int, height: int) -> Tuple[int, int]:
+    """
+    Apply the vision model's high-detail resizing rules to an image size.
+
+    Args:
+        width: Image width in pixels
+        height: Image height in pixels
+
+    Returns:
+        Tuple[int, int]: The (width, height) the model actually sees
+    """
+    scale = min(1.0, IMAGE_MAX_LONG_EDGE / max(width, height))
+    width, height = width * scale, height * scale
+
+    scale = min(1.0, IMAGE_MAX_SHORT_EDGE / min(width, height))
+    return int(width * scale), int(height * scale)
+
+
+def image_token_cost(width: int, height: int, model: str, detail: str = "high") -> int:
+    """
+    Estimate the prompt tokens billed for one image.
+
+    Args:
+        width: Image width in pixels
+        height: Image height in pixels
+        model: Vision model name
+        detail: Requested detail level ("low", "high" or "auto")
+
+    Returns:
+        int: Estimated number of prompt tokens for the image
+    """
+    base, per_tile = IMAGE_TOKEN_COSTS.get(model, DEFAULT_IMAGE_TOKEN_COST)
+    if detail == "low" or max(width, height) <= IMAGE_LOW_DETAIL_SIZE:
+        return base
+
+    fitted_width, fitted_height = fit_image_to_tiles(width, height)
+    tiles = math.ceil(fitted_width / IMAGE_TILE_SIZE) * math.ceil(fitted_height / IMAGE_TILE_SIZE)
+    return base + per_tile * tiles
+
+
+def _image_size_from_data_url(url: str) -> Optional[Tuple[int, int]]:
+    """Read the width and height from the header of a base64 PNG data URL."""
+    prefix = "data:image/png;base64,"
+    if not url.startswith(prefix):
+        return None
+    try:
+        # The IHDR chunk sits in the first 24 bytes of every PNG file
+        header = base64.b64decode(url[len(prefix):len(prefix) + 32])
+        width, height = struct.unpack(">II", header[16:24])
+        return width, height
+    except Exception:
+        return None
+
+
+def _content_tokens(content: Any, model: str) -> int:
+    if isinstance(content, str):
+        return count_text_tokens(content, model)
+
+    tokens = 0
+    for part in content or []:
+        if part.get("type") == "text":
+            tokens += count_text_tokens(part.get("text", ""), model)
+        elif part.get("type") == "image_url":
+            image_url = part.get("image_url", {})
+            size = _image_size_from_data_url(image_url.get("url", "")) or DEFAULT_IMAGE_SIZE
+            tokens += image_token_cost(*size, model=model, detail=image_url.get("detail", "high"))
+    return tokens
+
+
+def estimate_chat_tokens(
+    model: str,
+    messages: Iterable[Dict[str, Any]],
+    response_model: Any = None,
+    max_tokens: Optional[int] = None
+) -> int:
+    """
+    Estimate the total tokens a chat completion will consume before sending it.
+
+    Args:
+        model: Model name
+        messages: Chat messages in OpenAI format
+        response_model: Optional pydantic model whose JSON schema is sent as a tool
+        max_tokens: Completion token limit, if any
+
+    Returns:
+        int: Estimated prompt plus completion tokens
+    """
+    tokens = REPLY_PRIMER_TOKENS
+    for message in messages:
+        tokens += MESSAGE_OVERHEAD_TOKENS + _content_tokens(message.get("content"), model)
+
+    if response_model is not None:
+        try:
+            tokens += count_text_tokens(json.dumps(response_model.model_json_schema()), model)
+        except Exception as e:
+            logger.debug(f"Could not size response schema: {str(e)}")
+
+    return tokens + (max_tokens or DEFAULT_COMPLETION_TOKENS)
@@ -1,10 +1,19 @@
+import asyncio
+import logging
+import os
+import tempfile
 from io import BytesIO
-from typing import List
+from typing import BinaryIO, Iterator, List, Optional
 from PIL import Image
 import fitz
+from fastapi import HTTPException
 
+from ..core.config import settings
 from ..models.exam_model import Exam
-from ..services import aws_s3
+from ..services import image_store
+
+# Configure logging
+logger = logging.getLogger(__name__)
 
 CSS_STYLE = """
     * { font-family: sans-serif; font-size: 12px; }
@@ -16,29 +25,39 @@ CSS_STYLE = """
     li { margin-bottom: 2px; }
 """
 RECT_START = (50, 50, 550, 750)
+FETCH_WINDOW = 32  # Exams whose images are held in memory at once
+STREAM_CHUNK_SIZE = 1024 * 1024  # Bytes read from the finished report per chunk
 
 
-async def generate_exam_pdf(exams: List[Exam]) -> BytesIO:
-    doc = fitz.open()
-    image_page_number = 1
+async def _fetch_image(key: str, semaphore: asyncio.Semaphore) -> Optional[bytes]:
+    async with semaphore:
+        try:
+            return await image_store.get_image(key)
+        except HTTPException:
+            return None
 
-    for exam in exams:
-        if not exam.exam_image_url:
-            continue
 
-        # Download and render image page
-        image_key = exam.exam_image_url
-        image_bytes = await aws_s3.download_image(image_key)
+async def _fetch_images(exams: List[Exam], semaphore: asyncio.Semaphore) -> List[Optional[bytes]]:
+    return await asyncio.gather(*(_fetch_image(exam.exam_image_url, semaphore) for exam in exams))
 
-        if image_bytes:
-            img = Image.open(BytesIO(image_bytes)).convert("RGB")
-            img_stream = BytesIO()
-            img.save(img_stream, format="PNG")
-            img_stream.seek(0)
 
-            # Add image page
-            img_page = doc.new_page()
-            img_page.insert_image(img_page.rect, stream=img_stream.getvalue())
+def _insert_image(doc: fitz.Document, image_bytes: bytes) -> None:
+    img_page = doc.new_page()
+    try:
+        # JPEG and PNG pages are embedded as stored, without decoding
+        img_page.insert_image(img_page.rect, stream=image_bytes)
+    except (RuntimeError, ValueError):
+        # Formats the PDF cannot embed directly are converted first
+        img = Image.open(BytesIO(image_bytes)).convert("RGB")
+        img_stream = BytesIO()
+        img.save(img_stream, format="PNG")
+        img_page.insert_image(img_page.rect, stream=img_stream.getvalue())
+
+
+def _add_exam_pages(doc: fitz.Document, exams: List[Exam], images: List[Optional[bytes]], first_page_number: int) -> None:
+    for image_page_number, (exam, image_bytes) in enumerate(zip(exams, images), start=first_page_number):
+        if image_bytes:
+            _insert_image(doc, image_bytes)
 
         # Preprocess text fields to safely insert into HTML
         extracted_text = (exam.exam_extracted_text or "-").replace("\n", "<br>")
@@ -89,10 +108,71 @@ async def generate_exam_pdf(exams: List[Exam]) -> BytesIO:
 
         report_page = doc.new_page()
         report_page.insert_htmlbox(fitz.Rect(*RECT_START), html_content, css=CSS_STYLE)
-        image_page_number += 1
 
-    final_pdf = BytesIO()
-    doc.save(final_pdf)
-    doc.close()
-    final_pdf.seek(0)
-    return final_pdf
\ No newline at end of file
+
+async def generate_exam_pdf(exams: List[Exam]) -> str:
+    """
+    Write the grading report of exams (each image page followed by its report page) to a temp file.
+
+    Images are downloaded REPORT_IMAGE_CONCURRENCY at a time, one window of
+    exams ahead of the pages being written, and the document is assembled
+    off the event loop. Pass the returned path to stream_report, which removes the file.
+
+    Args:
+        exams: Exams to include; exams without an image are left out
+
+    Returns:
+        str: Path of the finished PDF
+    """
+    exams = [exam for exam in exams if exam.exam_image_url]
+    windows = [exams[start:start + FETCH_WINDOW] for start in range(0, len(exams), FETCH_WINDOW)]
+    semaphore = asyncio.Semaphore(settings.REPORT_IMAGE_CONCURRENCY)
+
+    handle, path = tempfile.mkstemp(prefix="report_", suffix=".pdf")
+    os.close(handle)
+    doc = fitz.open()
+    pending = asyncio.ensure_future(_fetch_images(windows[0], semaphore)) if windows else None
+    try:
+        for index, window in enumerate(windows):
+            images = await pending
+            # Download the next window while this one is written
+            pending = asyncio.ensure_future(_fetch_images(windows[index + 1], semaphore)) if index + 1 < len(windows) else None
+            await asyncio.to_thread(_add_exam_pages, doc, window, images, index * FETCH_WINDOW + 1)
+
+        await asyncio.to_thread(doc.save, path, deflate=True)
+    except BaseException:
+        if pending is not None:
+            pending.cancel()
+        os.remove(path)
+        raise
+    finally:
+        doc.close()
+
+    logger.info(f"Wrote report of {len(exams)} exams ({os.path.getsize(path) / 1e6:.1f} MB)")
+    return path
+
+
+def _read_chunks(report_file: BinaryIO, chunk_size: int) -> Iterator[bytes]:
+    with report_file:
+        while chunk := report_file.read(chunk_size):
+            yield chunk
+
+
+def stream_report(path: str, chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    Read a finished report in chunks for a streaming response, removing its file.
+
+    The file is unlinked right away; the open handle keeps its data readable
+    until the response is done, so nothing is left behind if the client
+    disconnects.
+
+    Args:
+        path: Path returned by generate_exam_pdf
+        chunk_size: Bytes per chunk
+
+    Returns:
+        Iterator[bytes]: The report's bytes
+    """
+    report_file = open(path, "rb")
+    os.remove(path)
+    return _read_chunks(report_file, chunk_size)
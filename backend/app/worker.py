@@ -0,0 +1,189 @@
+# Standalone evaluation worker. Run one or more per node:
+# python -m app.worker
+
+
+import asyncio
+import logging
+import os
+import signal
+import socket
+import time
+
+from dotenv import load_dotenv
+from sqlmodel import Session
+
+from app.core import database
+from app.core.config import settings
+from app.models import exam_model, job_model, user_model
+from app.schemas import exam_schema
+from app.services import background_helper, batch_evaluation, job_queue, prompt_cache, storage_purge
+
+# Load environment variables
+load_dotenv(override=True)
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s %(levelname)s [%(name)s] %(message)s"
+)
+logger = logging.getLogger("app.worker")
+
+# Constants
+STALE_CHECK_INTERVAL = 60  # Seconds between sweeps for abandoned jobs
+
+
+async def keep_lease(job_id: int, worker_id: str) -> None:
+    """
+    Renew the lock of a running job until cancelled.
+
+    Args:
+        job_id: ID of the claimed job
+        worker_id: Identifier of this worker
+    """
+    while True:
+        await asyncio.sleep(settings.JOB_HEARTBEAT_INTERVAL)
+        with Session(database.engine) as session:
+            if not job_queue.renew_lease(session, job_id, worker_id):
+                logger.warning(f"Job {job_id} is no longer held by {worker_id}")
+                return
+
+
+async def run_job(job_id: int, worker_id: str, semaphore: asyncio.Semaphore) -> None:
+    """
+    Evaluate the exam behind one claimed job and record the outcome.
+
+    The job's lock is renewed while it runs, so a long evaluation (e.g. a
+    grouped submission waiting on the rate limiter) is not taken for an
+    abandoned one.
+
+    Args:
+        job_id: ID of the claimed job
+        worker_id: Identifier of this worker
+        semaphore: Semaphore bounding how many exams are graded at once
+    """
+    with Session(database.engine) as session:
+        job = session.get(job_model.EvaluationJob, job_id)
+        if not job:
+            return
+        exam = session.get(exam_model.Exam, job.exam_id)
+        exam_id, project_id, user_id = job.exam_id, job.project_id, job.user_id
+        evaluation_type, force_refresh = job.evaluation_type, job.force_refresh
+
+        # Another job may already have graded this exam
+        if not exam or exam.status != exam_schema.StatusEnum.pending:
+            job_queue.finish_job(session, job_id, success=True)
+            return
+
+    lease = asyncio.create_task(keep_lease(job_id, worker_id))
+    try:
+        success = await background_helper.process_exam_in_own_session(
+            exam_id, project_id, evaluation_type, semaphore, force_refresh
+        )
+        error = None if success else "Evaluation failed after all retries"
+    except Exception as e:
+        logger.error(f"Job {job_id} crashed: {str(e)}")
+        success, error = False, str(e)
+    finally:
+        lease.cancel()
+
+    with Session(database.engine) as session:
+        job_queue.finish_job(session, job_id, success=success, error=error)
+
+        if not job_queue.has_open_jobs(session, project_id):
+            user = session.get(user_model.User, user_id)
+            background_helper.notify_if_project_evaluated(session, project_id, user)
+
+
+async def run_batch_loop(worker_id: str, stop: asyncio.Event) -> None:
+    """
+    Advance offline batch evaluation runs until stopped.
+
+    Args:
+        worker_id: Identifier of this worker
+        stop: Event set on shutdown
+    """
+    while not stop.is_set():
+        try:
+            await batch_evaluation.advance_batch_runs(worker_id)
+        except Exception as e:
+            logger.error(f"Batch loop failed: {str(e)}")
+
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=settings.WORKER_POLL_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def run_purge_loop(worker_id: str, stop: asyncio.Event) -> None:
+    """
+    Remove the S3 objects of deleted projects until stopped.
+
+    Args:
+        worker_id: Identifier of this worker
+        stop: Event set on shutdown
+    """
+    while not stop.is_set():
+        try:
+            await storage_purge.advance_purge_jobs(worker_id)
+        except Exception as e:
+            logger.error(f"Purge loop failed: {str(e)}")
+
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=settings.WORKER_POLL_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def run_worker(concurrency: int = settings.EVALUATION_CONCURRENCY) -> None:
+    """
+    Claim jobs from the durable queue and grade them until stopped.
+
+    Args:
+        concurrency: Maximum number of exams graded at once by this worker
+    """
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    semaphore = asyncio.Semaphore(concurrency)
+    in_flight: set[asyncio.Task] = set()
+    stop = asyncio.Event()
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    logger.info(f"Worker {worker_id} started with concurrency {concurrency}")
+    batch_loop = asyncio.create_task(run_batch_loop(worker_id, stop))
+    purge_loop = asyncio.create_task(run_purge_loop(worker_id, stop))
+    last_stale_check = 0.0
+
+    while not stop.is_set():
+        with Session(database.engine) as session:
+            if time.monotonic() - last_stale_check > STALE_CHECK_INTERVAL:
+                job_queue.requeue_stale_jobs(session)
+                last_stale_check = time.monotonic()
+
+            jobs = job_queue.claim_jobs(session, worker_id, concurrency - len(in_flight))
+            job_ids = [job.id for job in jobs]
+
+        for job_id in job_ids:
+            task = asyncio.create_task(run_job(job_id, worker_id, semaphore))
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+
+        # Wake up when a slot frees up, on shutdown, or after the poll interval
+        waiters = set(in_flight) | {asyncio.create_task(stop.wait())}
+        done, pending = await asyncio.wait(
+            waiters,
+            timeout=settings.WORKER_POLL_INTERVAL,
+            return_when=asyncio.FIRST_COMPLETED
+        )
+        for waiter in pending - in_flight:
+            waiter.cancel()
+
+    logger.info(f"Worker {worker_id} stopping; waiting for {len(in_flight)} running jobs")
+    await asyncio.gather(batch_loop, purge_loop, *in_flight, return_exceptions=True)
+    logger.info(f"Prompt cache statistics: {prompt_cache.get_stats()}")
+
+
+if __name__ == "__main__":
+    database.create_db_and_tables()
+    asyncio.run(run_worker())
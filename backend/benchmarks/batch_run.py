@@ -0,0 +1,143 @@
+# End-to-end check of an offline evaluation run on the local batch backend:
+# creates a scratch project of --exams pending exams with extracted text,
+# starts an ai_only run, and lets the worker's batch step and
+# app.complete_local_batch (canned responder) drive it to completion. Fails
+# unless every exam ends up processed with the canned scores; reports the
+# wall time of each step. The scratch rows are deleted afterwards. Needs the
+# application database and the embedding model. Run from the backend
+# directory with the local backend and no poll delay:
+# BATCH_BACKEND=local BATCH_POLL_INTERVAL=0 python -m benchmarks.batch_run --exams 50
+
+
+import argparse
+import asyncio
+import random
+import time
+import uuid
+from typing import List
+
+from sqlmodel import Session, delete, select
+
+from app.complete_local_batch import CANNED_RESULTS, canned_responder, complete_pending
+from app.core import database
+from app.core.config import settings
+from app.models import batch_model, exam_model, project_model, task_model, user_model
+from app.schemas import batch_schema, exam_schema
+from app.services import batch_evaluation
+from app.services.ai_evaluation import StructuredAnalyzeResponse
+
+WORDS = (
+    "the student argues that technology changes how people learn and communicate with each other "
+    "although some critics claim social media harms attention many examples show students collaborate "
+    "better when teachers give clear feedback essays should present evidence organize ideas in paragraphs"
+).split()
+MAX_STEPS = 20  # Worker steps before the run is considered stuck
+
+
+def create_scratch_project(session: Session, exams: int, seed: int) -> project_model.Project:
+    """A user, task and project with `exams` pending exams of unique text."""
+    rng = random.Random(seed)
+    tag = uuid.uuid4().hex[:8]
+    user = user_model.User(username=f"batch_check_{tag}", password="-")
+    task = task_model.Task(
+        course_name="Batch check",
+        course_code=tag,
+        year="2024",
+        rubrics="Score each criterion from 0 to 5.",
+        example_evaluation="-",
+        student_instruction="Write an essay about technology and learning.",
+    )
+    session.add_all([user, task])
+    session.commit()
+
+    project = project_model.Project(
+        project_name=f"batch_check_{tag}", course_name="Batch check", section="1", user_id=user.id, task_id=task.id
+    )
+    session.add(project)
+    session.commit()
+
+    session.add_all([
+        exam_model.Exam(
+            page=1,
+            project_id=project.id,
+            user_id=user.id,
+            exam_extracted_text=f"{tag} {index} " + " ".join(rng.choices(WORDS, k=rng.randint(50, 300))),
+        )
+        for index in range(exams)
+    ])
+    session.commit()
+    session.refresh(project)
+    return project
+
+
+def delete_scratch_project(session: Session, project: project_model.Project) -> None:
+    session.exec(delete(batch_model.BatchRun).where(batch_model.BatchRun.project_id == project.id))
+    session.exec(delete(exam_model.Exam).where(exam_model.Exam.project_id == project.id))
+    session.exec(delete(project_model.Project).where(project_model.Project.id == project.id))
+    session.exec(delete(task_model.Task).where(task_model.Task.id == project.task_id))
+    session.exec(delete(user_model.User).where(user_model.User.id == project.user_id))
+    session.commit()
+
+
+async def drive_run(run_id: int, backend: batch_evaluation.LocalBatchBackend) -> List[float]:
+    """Alternate worker steps and local completion until the run finishes; returns step times."""
+    timings = []
+    for _ in range(MAX_STEPS):
+        started = time.perf_counter()
+        await batch_evaluation.advance_batch_runs("benchmarks.batch_run")
+        complete_pending(canned_responder, backend)
+        timings.append(time.perf_counter() - started)
+
+        with Session(database.engine) as session:
+            run = session.get(batch_model.BatchRun, run_id)
+            if run.status in (batch_schema.BatchStatusEnum.completed, batch_schema.BatchStatusEnum.failed):
+                return timings
+    raise SystemExit(f"Run {run_id} did not finish within {MAX_STEPS} steps")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="End-to-end check of an offline run on the local batch backend")
+    parser.add_argument("--exams", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if settings.BATCH_BACKEND != batch_evaluation.LocalBatchBackend.name or settings.BATCH_POLL_INTERVAL:
+        parser.error("Set BATCH_BACKEND=local and BATCH_POLL_INTERVAL=0")
+
+    database.create_db_and_tables()
+    backend = batch_evaluation.LocalBatchBackend()
+
+    with Session(database.engine) as session:
+        project = create_scratch_project(session, args.exams, args.seed)
+    try:
+        with Session(database.engine) as session:
+            started = time.perf_counter()
+            run = batch_evaluation.start_batch_run(
+                session, project.id, project.user_id, exam_schema.EvaluationTypeEnum.ai_only
+            )
+            run_id = run.id
+            print(f"start_batch_run: {time.perf_counter() - started:.2f}s for {len(run.exam_ids)} exams")
+
+        timings = asyncio.run(drive_run(run_id, backend))
+        print("worker steps: " + ", ".join(f"{seconds:.2f}s" for seconds in timings))
+
+        expected = CANNED_RESULTS[StructuredAnalyzeResponse.__name__]
+        with Session(database.engine) as session:
+            run = session.get(batch_model.BatchRun, run_id)
+            exams = session.exec(select(exam_model.Exam).where(exam_model.Exam.project_id == project.id)).all()
+            graded = [
+                exam for exam in exams
+                if exam.status == exam_schema.StatusEnum.processed
+                and exam.score_task_completion == expected.score_task_completion
+                and exam.ai_comment == expected.ai_comment
+            ]
+            print(f"run {run_id}: {run.status.value}, {run.request_count} requests, {len(graded)}/{len(exams)} exams graded")
+            if run.status != batch_schema.BatchStatusEnum.completed or len(graded) != len(exams):
+                raise SystemExit(f"Run {run_id} failed the check: {run.last_error}")
+    finally:
+        with Session(database.engine) as session:
+            delete_scratch_project(session, project)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+# Compares the few-shot block of the previous formatting (the top-k nearest
+# exams in full, with their metadata dict) against diversity-aware,
+# token-budgeted packing, using stored exams as queries. Reports tokens per
+# scoring request (mean, p95, max) and how similar the chosen examples are
+# to each other. Needs only the stored vectors, not the embedding model. Run
+# from the backend directory:
+# python -m benchmarks.fewshot_packing --queries 200 --k 3 --budget 1800
+
+
+import argparse
+import random
+from typing import Dict, List
+
+import numpy as np
+
+from app.core import vectordb
+from app.core.config import settings
+from app.services import fewshot_selector
+from app.services.token_counter import count_text_tokens
+
+
+def legacy_block(documents: List[str], metadatas: List[dict]) -> str:
+    """The few-shot block as it was built before packing."""
+    return "".join(
+        f"Similar Example {i + 1} with Your Past Evaluation:\n{document}\n{metadata}\n"
+        f"-------------------------------------------\n"
+        for i, (document, metadata) in enumerate(zip(documents, metadatas))
+    )
+
+
+def mean_pairwise_similarity(embeddings: List[List[float]]) -> float:
+    """Mean cosine similarity between the examples shown together."""
+    if len(embeddings) < 2:
+        return float("nan")
+    vectors = np.asarray(embeddings, dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    similarity = vectors @ vectors.T
+    return float(similarity[np.triu_indices(len(vectors), 1)].mean())
+
+
+def summary(values: List[float]) -> Dict[str, float]:
+    return {"mean": float(np.mean(values)), "p95": float(np.percentile(values, 95)), "max": float(np.max(values))}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Few-shot block size and diversity")
+    parser.add_argument("--queries", type=int, default=200, help="Stored exams used as queries")
+    parser.add_argument("--k", type=int, default=3, help="Examples per request")
+    parser.add_argument("--candidates", type=int, default=settings.FEWSHOT_CANDIDATES)
+    parser.add_argument("--budget", type=int, default=settings.FEWSHOT_TOKEN_BUDGET)
+    parser.add_argument("--mmr-lambda", type=float, default=settings.FEWSHOT_MMR_LAMBDA)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    store = vectordb.get_shared_vector_store()
+    items = {"ids": [], "embeddings": []}
+    for batch in store.iter_all():
+        items["ids"].extend(batch["ids"])
+        items["embeddings"].extend(batch["embeddings"])
+    if not items["ids"]:
+        raise SystemExit("The collection is empty")
+
+    sample = random.Random(args.seed).sample(range(len(items["ids"])), min(args.queries, len(items["ids"])))
+    queries = [list(items["embeddings"][index]) for index in sample]
+    # One extra neighbour per query, since the nearest one is the query exam itself
+    results = store.query(queries, args.candidates + 1, include_embeddings=True)
+
+    legacy_tokens, packed_tokens, legacy_similarity, packed_similarity = [], [], [], []
+    for i, query in enumerate(queries):
+        keep = [j for j, item_id in enumerate(results["ids"][i]) if item_id != items["ids"][sample[i]]]
+        documents = [results["documents"][i][j] for j in keep]
+        metadatas = [results["metadatas"][i][j] for j in keep]
+        embeddings = [results["embeddings"][i][j] for j in keep]
+
+        legacy_tokens.append(count_text_tokens(legacy_block(documents[:args.k], metadatas[:args.k]), settings.AI_MODEL_NAME))
+        legacy_similarity.append(mean_pairwise_similarity(embeddings[:args.k]))
+
+        order = fewshot_selector.mmr_order(query, embeddings, args.mmr_lambda)
+        examples = fewshot_selector.pack_examples(order, documents, metadatas, args.k, args.budget)
+        packed_tokens.append(count_text_tokens("".join(example for _, example in examples), settings.AI_MODEL_NAME))
+        packed_similarity.append(mean_pairwise_similarity([embeddings[j] for j, _ in examples]))
+
+    print(f"{len(queries)} queries, k={args.k}, {args.candidates} candidates, budget {args.budget} tokens, lambda {args.mmr_lambda}")
+    print(f"{'':>8} {'mean tok':>9} {'p95 tok':>8} {'max tok':>8} {'example similarity':>19}")
+    for label, tokens, similarity in (("top-k", legacy_tokens, legacy_similarity), ("packed", packed_tokens, packed_similarity)):
+        stats = summary(tokens)
+        print(f"{label:>8} {stats['mean']:9.0f} {stats['p95']:8.0f} {stats['max']:8.0f} {np.nanmean(similarity):19.3f}")
+
+
+if __name__ == "__main__":
+    main()
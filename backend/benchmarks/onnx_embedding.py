@@ -0,0 +1,95 @@
+# Checks the int8 ONNX embedding runtime against the PyTorch model it was
+# exported from: cosine similarity of every embedding pair (fails below
+# --min-cosine), agreement of the nearest neighbours, and throughput in
+# sentences per second for each runtime. Texts come from --texts-file (one
+# per line, e.g. exported exam texts) or are generated. Run from the backend
+# directory after app.export_onnx_embedding:
+# python -m benchmarks.onnx_embedding --texts 512 --threads 1 4
+
+
+import argparse
+import random
+import time
+from typing import Callable, List
+
+import numpy as np
+
+from app.core import vectordb
+from app.core.config import settings
+from app.core.onnx_embedding import OnnxEmbeddingFunction
+
+WORDS = (
+    "the student argues that technology changes how people learn and communicate with each other "
+    "although some critics claim social media harms attention many examples show students collaborate "
+    "better when teachers give clear feedback essays should present evidence organize ideas in paragraphs "
+    "and use varied sentence structures to express opinions about environment education culture and health"
+).split()
+
+
+def generate_texts(count: int, seed: int) -> List[str]:
+    """Essay-like texts from a few words to a few paragraphs."""
+    rng = random.Random(seed)
+    return [" ".join(rng.choices(WORDS, k=rng.randint(5, 400))) for _ in range(count)]
+
+
+def throughput(encode: Callable[[List[str]], np.ndarray], texts: List[str]) -> float:
+    """Sentences per second of one encoding pass after a warm-up."""
+    encode(texts[:8])
+    started = time.perf_counter()
+    encode(texts)
+    return len(texts) / (time.perf_counter() - started)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="ONNX int8 embedding parity and throughput")
+    parser.add_argument("--model", default=settings.EMBEDDING_MODEL_PATH or vectordb.EMBEDDING_MODEL_NAME, help="Reference PyTorch model")
+    parser.add_argument("--onnx", default=settings.ONNX_EMBEDDING_PATH, help="Exported ONNX model directory")
+    parser.add_argument("--texts-file", default=None, help="File with one text per line")
+    parser.add_argument("--texts", type=int, default=512, help="Generated texts when no file is given")
+    parser.add_argument("--batch-size", type=int, default=settings.EMBEDDING_BATCH_SIZE)
+    parser.add_argument("--threads", type=int, nargs="*", default=[settings.ONNX_NUM_THREADS], help="onnxruntime thread counts to time")
+    parser.add_argument("--min-cosine", type=float, default=0.99)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.texts_file:
+        with open(args.texts_file) as f:
+            texts = [line.strip() for line in f if line.strip()]
+    else:
+        texts = generate_texts(args.texts, args.seed)
+
+    reference = vectordb.get_embedding_function("huggingface", args.model)
+    torch_model = reference.model
+
+    def encode_torch(batch: List[str]) -> np.ndarray:
+        return torch_model.encode(batch, batch_size=args.batch_size, convert_to_numpy=True)
+
+    runtimes = {f"onnx int8, {threads or 'auto'} threads": OnnxEmbeddingFunction(args.onnx, threads, args.batch_size) for threads in args.threads}
+    onnx_model = next(iter(runtimes.values()))
+
+    expected = encode_torch(texts)
+    actual = onnx_model.encode(texts)
+    cosine = (expected * actual).sum(axis=1) / (np.linalg.norm(expected, axis=1) * np.linalg.norm(actual, axis=1))
+
+    # Nearest neighbour of each text among the others, under each runtime
+    def neighbours(embeddings: np.ndarray) -> np.ndarray:
+        normalized = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+        similarities = normalized @ normalized.T
+        np.fill_diagonal(similarities, -np.inf)
+        return similarities.argmax(axis=1)
+
+    print(f"{len(texts)} texts, batch size {args.batch_size}")
+    print(f"cosine: min {cosine.min():.4f}  mean {cosine.mean():.4f}  p1 {np.percentile(cosine, 1):.4f}")
+    print(f"nearest neighbour agreement: {(neighbours(expected) == neighbours(actual)).mean():.3f}")
+
+    print(f"{'runtime':>24} {'sentences/s':>12}")
+    print(f"{'pytorch':>24} {throughput(encode_torch, texts):12.1f}")
+    for label, runtime in runtimes.items():
+        print(f"{label:>24} {throughput(runtime.encode, texts):12.1f}")
+
+    if cosine.min() < args.min_cosine:
+        raise SystemExit(f"Parity check failed: min cosine {cosine.min():.4f} < {args.min_cosine}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+# Measures PDF rasterization throughput of the upload pipeline against the
+# number of render processes. Run from the backend directory:
+# python -m benchmarks.pdf_render --pages 40
+
+
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pymupdf
+
+from app.services.pdf_processor import page_ranges, render_page_range
+
+A4_SIZE = (595, 842)  # Points
+
+
+def build_sample_pdf(path: str, pages: int) -> None:
+    """Write a PDF of text-filled A4 pages, similar in density to a typed essay."""
+    doc = pymupdf.open()
+    for page_number in range(pages):
+        page = doc.new_page(width=A4_SIZE[0], height=A4_SIZE[1])
+        text = "\n".join(
+            f"Page {page_number + 1}, line {line + 1}: The quick brown fox jumps over the lazy dog."
+            for line in range(45)
+        )
+        page.insert_textbox(pymupdf.Rect(50, 50, A4_SIZE[0] - 50, A4_SIZE[1] - 50), text, fontsize=11)
+    doc.save(path)
+    doc.close()
+
+
+def run_pool(pdf_path: str, pages: int, workers: int) -> float:
+    """Render every page with `workers` processes and return the elapsed seconds."""
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        # Start the workers before timing so process spawn is not measured
+        list(pool.map(render_page_range, [pdf_path] * workers, [0] * workers, [1] * workers))
+
+        started = time.perf_counter()
+        ranges = page_ranges(pages)
+        results = list(pool.map(
+            render_page_range,
+            [pdf_path] * len(ranges),
+            [start for start, _ in ranges],
+            [stop for _, stop in ranges],
+        ))
+        elapsed = time.perf_counter() - started
+
+    rendered = [page_number for rendered_range in results for page_number, _ in rendered_range]
+    assert rendered == list(range(1, pages + 1)), "Pages came back out of order"
+    return elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="PDF rasterization throughput by render pool size")
+    parser.add_argument("--pages", type=int, default=40, help="Number of pages in the sample PDF")
+    parser.add_argument("--workers", type=int, nargs="*", help="Pool sizes to measure (default: 1, 2, 4, ... up to the core count)")
+    args = parser.parse_args()
+
+    cores = os.cpu_count() or 1
+    pool_sizes = args.workers or sorted({1, cores} | {2 ** i for i in range(1, cores.bit_length()) if 2 ** i <= cores})
+
+    with tempfile.TemporaryDirectory() as directory:
+        pdf_path = os.path.join(directory, "sample.pdf")
+        build_sample_pdf(pdf_path, args.pages)
+
+        started = time.perf_counter()
+        render_page_range(pdf_path, 0, args.pages)
+        serial = time.perf_counter() - started
+
+        print(f"{args.pages} pages, {cores} cores")
+        print(f"{'mode':>10} {'seconds':>9} {'pages/s':>9} {'speedup':>8}")
+        print(f"{'serial':>10} {serial:9.2f} {args.pages / serial:9.2f} {1.0:8.2f}")
+        for workers in pool_sizes:
+            elapsed = run_pool(pdf_path, args.pages, workers)
+            print(f"{f'{workers} procs':>10} {elapsed:9.2f} {args.pages / elapsed:9.2f} {serial / elapsed:8.2f}")
+
+
+if __name__ == "__main__":
+    main()
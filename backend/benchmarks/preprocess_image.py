@@ -0,0 +1,96 @@
+# Compares the OCR image preprocessing kernel with the original per-pixel
+# implementation on synthetic A4 scans, checking that both produce the same
+# pixels. Run from the backend directory:
+# python -m benchmarks.preprocess_image
+
+
+import argparse
+import time
+
+import numpy as np
+import pymupdf
+from PIL import Image, ImageFilter
+
+from app.services.image_preprocessing import preprocess_image
+
+A4_INCHES = (8.27, 11.69)
+
+
+def legacy_preprocess_image(image_pil: Image.Image) -> Image.Image:
+    """The original implementation, kept as the reference output."""
+    x = image_pil.copy()
+    x = np.array(x)
+
+    if len(x.shape) == 2:
+        mean = np.mean(x)
+        std = np.std(x)
+        if std > 0:
+            x = (x - mean) / std
+    else:
+        for i in range(3):
+            channel = x[:, :, i]
+            mean = np.mean(channel)
+            std = np.std(channel)
+            if std > 0:
+                x[:, :, i] = (channel - mean) / std
+
+    x = np.clip((x - x.min()) / (x.max() - x.min()) * 255, 0, 255).astype(np.uint8)
+    x = x.astype(np.uint8)
+    x = Image.fromarray(x)
+    x = x.convert("L")
+    x = x.point(lambda x: 0 if x < 128 else 255, '1')
+    x = x.point(lambda val: 255 - val)
+    x = x.filter(ImageFilter.MedianFilter(size=3))
+    return x
+
+
+def sample_scan(dpi: int, seed: int = 0) -> Image.Image:
+    """Render a handwritten-density text page at `dpi` with paper tint, red marks and sensor noise."""
+    doc = pymupdf.open()
+    page = doc.new_page(width=A4_INCHES[0] * 72, height=A4_INCHES[1] * 72)
+    text = "\n".join(f"{line + 1}. Dear Sir or Madam, I am writing to apply for the position." for line in range(40))
+    page.insert_textbox(pymupdf.Rect(50, 50, page.rect.width - 50, page.rect.height - 50), text, fontsize=12)
+    pix = page.get_pixmap(matrix=pymupdf.Matrix(dpi / 72, dpi / 72))
+    doc.close()
+
+    rng = np.random.default_rng(seed)
+    pixels = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, 3).astype(np.int16)
+    pixels += np.array([-6, -10, -24], dtype=np.int16)  # Yellowed paper
+    rows = slice(pix.height // 4, pix.height // 4 + dpi // 20)
+    pixels[rows, pix.width // 8:pix.width // 2] = (200, 30, 40)  # Teacher's red pen stroke
+    pixels += rng.normal(0, 8, pixels.shape).astype(np.int16)
+    return Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+
+
+def time_call(function, image: Image.Image, repeat: int) -> float:
+    """Best wall time of `repeat` calls, in seconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function(image)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="OCR image preprocessing throughput and equivalence")
+    parser.add_argument("--dpi", type=int, nargs="*", default=[150, 200, 300], help="Scan resolutions to measure")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per case (best is reported)")
+    args = parser.parse_args()
+
+    print(f"{'case':>10} {'size':>11} {'legacy ms':>10} {'kernel ms':>10} {'speedup':>8} {'equal':>6}")
+    for dpi in args.dpi:
+        rgb = sample_scan(dpi)
+        for name, image in ((f"{dpi} RGB", rgb), (f"{dpi} L", rgb.convert("L"))):
+            expected = np.asarray(legacy_preprocess_image(image))
+            actual = np.asarray(preprocess_image(image))
+            equal = actual.shape == expected.shape and bool((actual == expected).all())
+
+            legacy = time_call(legacy_preprocess_image, image, args.repeat)
+            kernel = time_call(preprocess_image, image, args.repeat)
+            size = f"{image.width}x{image.height}"
+            print(f"{name:>10} {size:>11} {legacy * 1000:10.1f} {kernel * 1000:10.1f} {legacy / kernel:8.1f} {str(equal):>6}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+# Compares the model-sized grayscale raster profile with the legacy 300 DPI
+# RGB path on a synthetic scanned exam: render time, pixmap memory, stored
+# image size, billed image tokens and agreement of what the model sees. With
+# --ocr both images are also sent to OCR_MODEL_NAME (needs OPENAI_API_KEY)
+# and the extracted text is scored against the ground truth. Run from the
+# backend directory:
+# python -m benchmarks.raster_profile --pages 4
+
+
+import argparse
+import asyncio
+import difflib
+import io
+import os
+import tempfile
+import time
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pymupdf
+from PIL import Image
+
+from app.core.config import settings
+from app.services import token_counter
+from app.services.pdf_processor import LEGACY_RASTER_PROFILE, RasterProfile, page_scale, raster_profile, render_page_range
+
+from .preprocess_image import A4_INCHES
+
+SCAN_DPI = 300
+ESSAY = (
+    "Dear Sir or Madam, I am writing to apply for the position of library assistant "
+    "advertised in the school newsletter. I have always enjoyed reading and I believe "
+    "I would be able to help other students find the books they need. "
+)
+
+
+def build_scanned_pdf(path: str, pages: int, seed: int = 0) -> List[str]:
+    """Write a PDF whose pages are noisy RGB scans of typed text with red marks, and return each page's text."""
+    rng = np.random.default_rng(seed)
+    width, height = A4_INCHES[0] * 72, A4_INCHES[1] * 72
+    texts = []
+    doc = pymupdf.open()
+    for page_number in range(pages):
+        text = f"Page {page_number + 1}. " + ESSAY * 6
+        texts.append(text)
+
+        # Rasterize the text like a scanner would, then add paper tint, a red pen stroke and noise
+        source = pymupdf.open()
+        source_page = source.new_page(width=width, height=height)
+        source_page.insert_textbox(pymupdf.Rect(60, 60, width - 60, height - 60), text, fontsize=13)
+        pix = source_page.get_pixmap(matrix=pymupdf.Matrix(SCAN_DPI / 72, SCAN_DPI / 72))
+        source.close()
+
+        pixels = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, 3).astype(np.int16)
+        pixels += np.array([-6, -10, -24], dtype=np.int16)
+        pixels[pix.height // 3:pix.height // 3 + 15, pix.width // 6:pix.width // 2] = (200, 30, 40)
+        pixels += rng.normal(0, 8, pixels.shape).astype(np.int16)
+
+        scan = io.BytesIO()
+        Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).save(scan, format="JPEG", quality=90)
+        doc.new_page(width=width, height=height).insert_image(pymupdf.Rect(0, 0, width, height), stream=scan.getvalue())
+    doc.save(path)
+    doc.close()
+    return texts
+
+
+def model_view(image: Image.Image, size: Tuple[int, int]) -> np.ndarray:
+    """Resize an image to the resolution the vision model reads it at."""
+    return np.asarray(image.convert("L").resize(size, Image.Resampling.LANCZOS), dtype=np.int16)
+
+
+def measure(pdf_path: str, pages: int, profile: RasterProfile) -> Dict:
+    """Render every page with a profile and collect size and cost figures."""
+    with pymupdf.open(pdf_path) as doc:
+        scale = page_scale(doc[0].rect, profile)
+        rect = doc[0].rect
+    channels = 1 if profile.grayscale else 3
+    pixmap_bytes = int(rect.width * scale) * int(rect.height * scale) * channels
+
+    started = time.perf_counter()
+    rendered = render_page_range(pdf_path, 0, pages, profile)
+    elapsed = time.perf_counter() - started
+
+    images = [Image.open(io.BytesIO(image_bytes)) for _, image_bytes in rendered]
+    return {
+        "images": images,
+        "encoded": [image_bytes for _, image_bytes in rendered],
+        "ms_per_page": elapsed / pages * 1000,
+        "pixmap_mb": pixmap_bytes / 1024 / 1024,
+        "stored_kb": sum(len(image_bytes) for _, image_bytes in rendered) / pages / 1024,
+        "size": f"{images[0].width}x{images[0].height}",
+        "tokens": token_counter.image_token_cost(images[0].width, images[0].height, settings.OCR_MODEL_NAME),
+    }
+
+
+async def ocr_similarity(encoded: List[bytes], texts: List[str]) -> Dict:
+    """OCR each page with the configured model and score the text against the ground truth."""
+    from app.services.ai_evaluation import ExamModel, build_ocr_messages, create_structured_completion, prepare_ocr_image
+
+    scores, prompt_tokens = [], 0
+    for image_bytes, text in zip(encoded, texts):
+        base64_image = prepare_ocr_image(io.BytesIO(image_bytes))
+        result, completion = await create_structured_completion(
+            model=settings.OCR_MODEL_NAME,
+            response_model=ExamModel,
+            messages=build_ocr_messages(base64_image),
+        )
+        scores.append(difflib.SequenceMatcher(None, " ".join(text.split()), " ".join(result.extracted_exam_text.split())).ratio())
+        prompt_tokens += completion.usage.prompt_tokens
+    return {"similarity": sum(scores) / len(scores), "prompt_tokens": prompt_tokens / len(scores)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Raster profile cost and quality report")
+    parser.add_argument("--pages", type=int, default=4, help="Number of scanned pages in the sample PDF")
+    parser.add_argument("--ocr", action="store_true", help="Also OCR both renderings with OCR_MODEL_NAME")
+    args = parser.parse_args()
+
+    profiles = {"legacy": LEGACY_RASTER_PROFILE, "model": raster_profile(settings.OCR_MODEL_NAME, "model")}
+    with tempfile.TemporaryDirectory() as temp_dir:
+        pdf_path = os.path.join(temp_dir, "sample.pdf")
+        texts = build_scanned_pdf(pdf_path, args.pages)
+        results = {name: measure(pdf_path, args.pages, profile) for name, profile in profiles.items()}
+
+    print(f"OCR model: {settings.OCR_MODEL_NAME}, model profile: {profiles['model']}")
+    print(f"{'profile':>8} {'size':>10} {'ms/page':>8} {'pixmap MB':>10} {'stored KB':>10} {'img tokens':>11}")
+    for name, result in results.items():
+        print(
+            f"{name:>8} {result['size']:>10} {result['ms_per_page']:8.1f} {result['pixmap_mb']:10.1f} "
+            f"{result['stored_kb']:10.1f} {result['tokens']:11}"
+        )
+
+    # Share of pixels that differ noticeably once both images are shrunk to what the model reads
+    differing = [
+        float((np.abs(
+            model_view(legacy, token_counter.fit_image_to_tiles(legacy.width, legacy.height))
+            - model_view(model, token_counter.fit_image_to_tiles(legacy.width, legacy.height))
+        ) > 64).mean())
+        for legacy, model in zip(results["legacy"]["images"], results["model"]["images"])
+    ]
+    print(f"Pixels differing at model resolution: {sum(differing) / len(differing):.2%}")
+
+    if args.ocr:
+        for name, result in results.items():
+            quality = asyncio.run(ocr_similarity(result["encoded"], texts))
+            print(f"{name:>8} OCR similarity {quality['similarity']:.3f}, prompt tokens/page {quality['prompt_tokens']:.0f}")
+
+
+if __name__ == "__main__":
+    main()
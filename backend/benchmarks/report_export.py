@@ -0,0 +1,101 @@
+# Compares the PDF report export before and after concurrent downloads and
+# image passthrough: wall time and report size for a project of synthetic
+# graded exams. The S3 download is replaced by a fixed delay (--latency-ms)
+# so the run needs no bucket. Pages are stored as 1-bit PNG like new
+# uploads, or as JPEG like older ones (--format jpeg). Run from the backend
+# directory:
+# python -m benchmarks.report_export --exams 200 --latency-ms 40
+
+
+import argparse
+import asyncio
+import io
+import os
+import time
+from typing import Dict
+
+import fitz
+from PIL import Image, ImageDraw
+
+from app.models.exam_model import Exam
+from app.services import image_store
+from app.services.pdf_processor import encode_page
+from app.utils import report_generator
+
+from .raster_profile import build_scanned_pdf
+
+
+async def legacy_export(exams, images: Dict[str, bytes], latency: float) -> int:
+    """Sequential downloads and PNG re-encoding, as the exporter worked before; returns the report size."""
+    doc = fitz.open()
+    for exam in exams:
+        await asyncio.sleep(latency)
+        img = Image.open(io.BytesIO(images[exam.exam_image_url])).convert("RGB")
+        img_stream = io.BytesIO()
+        img.save(img_stream, format="PNG")
+        page = doc.new_page()
+        page.insert_image(page.rect, stream=img_stream.getvalue())
+        report_page = doc.new_page()
+        report_page.insert_htmlbox(fitz.Rect(*report_generator.RECT_START), exam.exam_extracted_text or "-", css=report_generator.CSS_STYLE)
+    final_pdf = io.BytesIO()
+    doc.save(final_pdf)
+    doc.close()
+    return len(final_pdf.getvalue())
+
+
+async def current_export(exams, images: Dict[str, bytes], latency: float) -> int:
+    async def get_image(key: str) -> bytes:
+        await asyncio.sleep(latency)
+        return images[key]
+
+    image_store.get_image = get_image
+    path = await report_generator.generate_exam_pdf(exams)
+    size = os.path.getsize(path)
+    for _ in report_generator.stream_report(path):
+        pass
+    return size
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="PDF report export time and size")
+    parser.add_argument("--exams", type=int, default=200)
+    parser.add_argument("--latency-ms", type=float, default=40, help="Simulated S3 download time per image")
+    parser.add_argument("--format", choices=["png", "jpeg"], default="png", help="Stored page format")
+    args = parser.parse_args()
+
+    # A handful of scanned pages, each exam's copy stamped with its number so no two images are identical
+    pdf_path = "/tmp/report_export_source.pdf"
+    build_scanned_pdf(pdf_path, 4)
+    with fitz.open(pdf_path) as source:
+        scans = [
+            Image.open(io.BytesIO(page.get_pixmap(matrix=fitz.Matrix(100 / 72, 100 / 72)).tobytes("png")))
+            for page in source
+        ]
+    os.remove(pdf_path)
+
+    images = {}
+    for i in range(args.exams):
+        image = scans[i % len(scans)].copy()
+        ImageDraw.Draw(image).text((20, 20), f"Exam {i}", fill=(0, 0, 0))
+        if args.format == "png":
+            images[f"exams/{i}.png"] = encode_page(image.convert("L"))
+        else:
+            stream = io.BytesIO()
+            image.convert("RGB").save(stream, format="JPEG", quality=90)
+            images[f"exams/{i}.jpeg"] = stream.getvalue()
+
+    exams = [
+        Exam(id=i, project_id=1, exam_image_url=key, exam_extracted_text="Dear Sir or Madam, " * 40, score_organization=3)
+        for i, key in enumerate(images)
+    ]
+    latency = args.latency_ms / 1000
+
+    print(f"{args.exams} exams, {args.format} pages, {args.latency_ms:.0f} ms per download")
+    for label, export in (("before", legacy_export), ("after", current_export)):
+        started = time.perf_counter()
+        size = asyncio.run(export(exams, images, latency))
+        print(f"{label:>7}: {time.perf_counter() - started:7.2f} s  {size / 1e6:7.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+# Measures API startup cost in fresh interpreters: the time and peak RSS of
+# importing app.main, and of importing it plus the vector warm-up that the
+# lifespan hook runs (model load, first encode, collection open). Exits
+# non-zero when a budget is exceeded, so it can gate a deploy. Point
+# EMBEDDING_MODEL_PATH at a saved model to check an offline start. Run from
+# the backend directory:
+# python -m benchmarks.startup --runs 3 --import-budget-ms 3000 --rss-budget-mb 900
+
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+# Runs inside the child interpreter; ru_maxrss is in KiB on Linux
+PROBE = """
+import json, resource, time
+started = time.perf_counter()
+import app.main
+imported = time.perf_counter()
+import_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+warm_up_ms = None
+if {warm_up}:
+    from app.core import vectordb
+    vectordb.warm_up()
+    warm_up_ms = (time.perf_counter() - imported) * 1000
+print(json.dumps({{
+    "import_ms": (imported - started) * 1000,
+    "import_rss_mb": import_rss,
+    "warm_up_ms": warm_up_ms,
+    "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+}}))
+"""
+
+
+def probe(warm_up: bool) -> dict:
+    """Start one interpreter and return its measurements."""
+    completed = subprocess.run(
+        [sys.executable, "-c", PROBE.format(warm_up=warm_up)],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="API import and vector warm-up cost")
+    parser.add_argument("--runs", type=int, default=3, help="Fresh interpreters per measurement")
+    parser.add_argument("--no-warm-up", action="store_true", help="Only measure the import")
+    parser.add_argument("--import-budget-ms", type=float, default=None, help="Fail if the median import is slower")
+    parser.add_argument("--warm-up-budget-ms", type=float, default=None, help="Fail if the median warm-up is slower")
+    parser.add_argument("--rss-budget-mb", type=float, default=None, help="Fail if the peak RSS after warm-up is higher")
+    args = parser.parse_args()
+
+    imports = [probe(warm_up=False) for _ in range(args.runs)]
+    import_ms = statistics.median(run["import_ms"] for run in imports)
+    import_rss = max(run["import_rss_mb"] for run in imports)
+    print(f"import app.main: {import_ms:8.0f} ms  {import_rss:7.0f} MB RSS")
+
+    failures = []
+    if args.import_budget_ms is not None and import_ms > args.import_budget_ms:
+        failures.append(f"import {import_ms:.0f} ms > {args.import_budget_ms:.0f} ms")
+
+    peak_rss = import_rss
+    if not args.no_warm_up:
+        warm_ups = [probe(warm_up=True) for _ in range(args.runs)]
+        warm_up_ms = statistics.median(run["warm_up_ms"] for run in warm_ups)
+        peak_rss = max(run["peak_rss_mb"] for run in warm_ups)
+        print(f"vector warm-up:  {warm_up_ms:8.0f} ms  {peak_rss:7.0f} MB RSS")
+        if args.warm_up_budget_ms is not None and warm_up_ms > args.warm_up_budget_ms:
+            failures.append(f"warm-up {warm_up_ms:.0f} ms > {args.warm_up_budget_ms:.0f} ms")
+
+    if args.rss_budget_mb is not None and peak_rss > args.rss_budget_mb:
+        failures.append(f"peak RSS {peak_rss:.0f} MB > {args.rss_budget_mb:.0f} MB")
+
+    if failures:
+        raise SystemExit("Over budget: " + "; ".join(failures))
+
+
+if __name__ == "__main__":
+    main()
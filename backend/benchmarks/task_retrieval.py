@@ -0,0 +1,113 @@
+# Measures few-shot retrieval as the collection grows: query latency (p50
+# and p95) of a search over the whole collection and of one filtered to the
+# query's task, how many of the unfiltered results belong to another task,
+# and how many filtered queries came back with fewer than --k results
+# although every task has enough exams. Synthetic exams are clustered by task. They are written to a scratch
+# collection (a temporary Chroma directory or a scratch pgvector table that
+# is dropped afterwards), never to the real one. Run from the backend
+# directory:
+# python -m benchmarks.task_retrieval --backend chroma --sizes 1000 5000 20000 --tasks 40
+
+
+import argparse
+import tempfile
+import time
+from typing import Dict
+
+import numpy as np
+from sqlalchemy import text
+
+from app.core.vector_store import ChromaVectorStore, PgVectorStore, VectorStore
+
+DIMENSIONS = 384  # all-MiniLM-L6-v2
+SCRATCH_TABLE = "exam_vectors_benchmark"
+
+
+def synthetic_exams(rng: np.random.Generator, count: int, centres: np.ndarray, spread: float):
+    """Unit vectors scattered around their task's centre, with the task id of each."""
+    task_ids = rng.integers(0, len(centres), count)
+    vectors = centres[task_ids] + rng.normal(0, spread, (count, DIMENSIONS))
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True), task_ids
+
+
+def measure(store: VectorStore, queries: np.ndarray, query_tasks: np.ndarray, k: int) -> Dict[str, float]:
+    """Latency percentiles of global and task-filtered queries, the share of other-task results and of short filtered ones."""
+    global_latencies, task_latencies, foreign, short = [], [], 0, 0
+    for query, task_id in zip(queries, query_tasks):
+        started = time.perf_counter()
+        results = store.query([query.tolist()], k)
+        global_latencies.append(time.perf_counter() - started)
+        foreign += sum(metadata["task_id"] != task_id for metadata in results["metadatas"][0])
+
+        started = time.perf_counter()
+        results = store.query([query.tolist()], k, where={"task_id": int(task_id)})
+        task_latencies.append(time.perf_counter() - started)
+        short += len(results["ids"][0]) < k
+
+    global_ms, task_ms = np.array(global_latencies) * 1000, np.array(task_latencies) * 1000
+    return {
+        "global_p50": float(np.percentile(global_ms, 50)),
+        "global_p95": float(np.percentile(global_ms, 95)),
+        "task_p50": float(np.percentile(task_ms, 50)),
+        "task_p95": float(np.percentile(task_ms, 95)),
+        "foreign": foreign / (len(queries) * k),
+        "short": short / len(queries),
+    }
+
+
+def open_store(backend: str, directory: str) -> VectorStore:
+    if backend == "chroma":
+        return ChromaVectorStore(directory, None)
+    from app.core.database import engine
+    with engine.begin() as connection:
+        connection.execute(text(f"DROP TABLE IF EXISTS {SCRATCH_TABLE}"))
+    return PgVectorStore(engine, DIMENSIONS, table=SCRATCH_TABLE)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Task-scoped retrieval latency as the collection grows")
+    parser.add_argument("--backend", choices=["chroma", "pgvector"], default="chroma")
+    parser.add_argument("--sizes", type=int, nargs="*", default=[1000, 5000, 20000], help="Collection sizes to measure at")
+    parser.add_argument("--tasks", type=int, default=40, help="Distinct tasks in the collection")
+    parser.add_argument("--spread", type=float, default=0.15, help="Noise around each task's centre; higher mixes tasks more")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--batch-size", type=int, default=1000, help="Items written per upsert")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    centres = rng.normal(0, 1 / np.sqrt(DIMENSIONS), (args.tasks, DIMENSIONS))
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = open_store(args.backend, directory)
+        try:
+            print(f"{args.backend}, {args.tasks} tasks, {args.queries} queries, k={args.k}")
+            print(f"{'items':>7} {'global p50':>11} {'global p95':>11} {'task p50':>9} {'task p95':>9} {'other task':>11} {'short':>6}")
+            size = 0
+            for target in sorted(args.sizes):
+                while size < target:
+                    count = min(args.batch_size, target - size)
+                    vectors, task_ids = synthetic_exams(rng, count, centres, args.spread)
+                    store.upsert(
+                        ids=[str(size + i) for i in range(count)],
+                        documents=[""] * count,
+                        embeddings=vectors.tolist(),
+                        metadatas=[{"task_id": int(task_id)} for task_id in task_ids],
+                    )
+                    size += count
+
+                queries, query_tasks = synthetic_exams(rng, args.queries, centres, args.spread)
+                result = measure(store, queries, query_tasks, args.k)
+                print(
+                    f"{size:7d} {result['global_p50']:11.2f} {result['global_p95']:11.2f} "
+                    f"{result['task_p50']:9.2f} {result['task_p95']:9.2f} {result['foreign']:11.1%} {result['short']:6.1%}"
+                )
+        finally:
+            if args.backend == "pgvector":
+                with store.engine.begin() as connection:
+                    connection.execute(text(f"DROP TABLE IF EXISTS {SCRATCH_TABLE}"))
+
+
+if __name__ == "__main__":
+    main()
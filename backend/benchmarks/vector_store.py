@@ -0,0 +1,92 @@
+# Compares recall and latency of the vector store backends on the stored
+# exam collection. Exact neighbours are computed by brute force over the
+# stored vectors, and each backend's approximate (HNSW) results are scored
+# against them. Copy the collection first so both backends hold the same
+# data. Run from the backend directory:
+# python -m app.migrate_vector_store --source chroma --target pgvector
+# python -m benchmarks.vector_store --queries 200 --k 3
+
+
+import argparse
+import random
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from app.core import vectordb
+
+
+def load_vectors(backend: str):
+    """Read every id and embedding of a backend."""
+    ids, embeddings = [], []
+    for batch in vectordb.get_vector_store(backend).iter_all():
+        ids.extend(batch["ids"])
+        embeddings.extend(batch["embeddings"])
+    return ids, np.asarray(embeddings, dtype=np.float32)
+
+
+def exact_neighbours(ids: List[str], embeddings: np.ndarray, queries: np.ndarray, k: int) -> List[List[str]]:
+    """Brute-force nearest neighbours by cosine distance."""
+    normalized = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+    query_normalized = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+    similarities = query_normalized @ normalized.T
+    top = np.argsort(-similarities, axis=1)[:, :k]
+    return [[ids[index] for index in row] for row in top]
+
+
+def measure(backend: str, queries: np.ndarray, truth: List[List[str]], k: int, batch_size: int) -> Dict[str, float]:
+    """Recall@k and latencies of one backend."""
+    store = vectordb.get_vector_store(backend)
+    store.query(queries[:1].tolist(), k)  # Warm up connections and caches
+
+    latencies, hits = [], 0
+    for query, expected in zip(queries, truth):
+        started = time.perf_counter()
+        results = store.query([query.tolist()], k)
+        latencies.append(time.perf_counter() - started)
+        hits += len(set(results["ids"][0]) & set(expected))
+
+    batch_latencies = []
+    for start in range(0, len(queries), batch_size):
+        started = time.perf_counter()
+        store.query(queries[start:start + batch_size].tolist(), k)
+        batch_latencies.append(time.perf_counter() - started)
+
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        "recall": hits / (len(truth) * k),
+        "p50": float(np.percentile(latencies_ms, 50)),
+        "p95": float(np.percentile(latencies_ms, 95)),
+        "batch_ms": float(np.mean(batch_latencies) * 1000),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Vector store recall and latency comparison")
+    parser.add_argument("--backends", nargs="*", default=["chroma", "pgvector"], help="Backends to compare")
+    parser.add_argument("--queries", type=int, default=200, help="Stored exams used as queries")
+    parser.add_argument("--k", type=int, default=3, help="Neighbours per query")
+    parser.add_argument("--batch-size", type=int, default=32, help="Queries per batched call")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    ids, embeddings = load_vectors(args.backends[0])
+    if not ids:
+        raise SystemExit(f"The {args.backends[0]} collection is empty")
+
+    # Query with slightly perturbed stored vectors so the exact answer is not just the item itself
+    rng = np.random.default_rng(args.seed)
+    sample = random.Random(args.seed).sample(range(len(ids)), min(args.queries, len(ids)))
+    queries = embeddings[sample] + rng.normal(0, 0.01, (len(sample), embeddings.shape[1])).astype(np.float32)
+    truth = exact_neighbours(ids, embeddings, queries, args.k)
+
+    print(f"{len(ids)} items, {len(sample)} queries, k={args.k}")
+    print(f"{'backend':>9} {'recall@k':>9} {'p50 ms':>8} {'p95 ms':>8} {f'batch of {args.batch_size} ms':>16}")
+    for backend in args.backends:
+        result = measure(backend, queries, truth, args.k, args.batch_size)
+        print(f"{backend:>9} {result['recall']:9.3f} {result['p50']:8.2f} {result['p95']:8.2f} {result['batch_ms']:16.2f}")
+
+
+if __name__ == "__main__":
+    main()